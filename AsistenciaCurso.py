@@ -19,16 +19,25 @@ Para usar este archivo:
 
 import streamlit as st
 import pandas as pd
+import re
 import time
+import uuid
 import requests
 from datetime import datetime, date
-from rut_chile import rut_chile
-import io
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
 
 # Importar el sistema de buffer
 from db_buffer import get_buffer
+from sheets_api import descargar_config, iter_paginas, SheetsAPIError
+from sheets_cache import get_snapshot_cache
+from indices import sesiones_del_dia, IndiceInscritos
+from validacion import normalizar_rut, rut_valido
+from roster import RosterDia
+from consultas import MotorReportes, COLUMNAS_VISTA
+from analitica import AnaliticaAsistencia
+from admision import ControlAdmision, ColapsadorEnvios
+from perfilador import get_perfilador, panel_perfilador
+from reportes import (generar_excel_ist, generar_excel_mk, fecha_sesion_curso,
+                      get_cache_reportes, MIME_XLSX)
 
 # Configuración básica
 st.set_page_config(page_title="Registro de Asistencia", layout="wide", initial_sidebar_state="collapsed")
@@ -40,71 +49,166 @@ API_KEY = st.secrets["API_KEY"]
 
 # ==================== FUNCIONES DE API ====================
 
+# Snapshots locales de Sheets: tras un reinicio se sirven sin esperar al API
+SNAPSHOT_DB_PATH = "sheets_cache_asistencia.duckdb"
+
+def _leer_config(snapshots):
+    """Config desde el snapshot local (o el API) con columnas de fecha parseadas."""
+    df = snapshots.obtener("config", lambda: descargar_config(API_URL, API_KEY), max_edad=300)
+    if not df.empty:
+        # Convertir columnas de fecha a datetime (detectando formato automáticamente)
+        date_cols = ['fecha_inicio', 'fecha_fin', 'fecha_jornada', 'fecha_sesion_1', 'fecha_sesion_2', 'fecha_sesion_3']
+        for col in date_cols:
+            if col in df.columns:
+                parsed = pd.to_datetime(df[col], dayfirst=True, errors='coerce')
+                if parsed.dt.tz is not None:
+                    parsed = parsed.dt.tz_convert(None)
+                df[col] = parsed.dt.normalize()
+
+        df['cupo_maximo'] = pd.to_numeric(df['cupo_maximo'], errors='coerce')
+    return df
+
+def _leer_registros(snapshots, filtros=None):
+    """
+    Registros de inscripción desde el snapshot local (o el API, paginado).
+    Con filtros (ej: {'curso_id': [...]}) solo se leen esas filas del snapshot.
+    """
+    return snapshots.obtener(
+        "registros",
+        lambda: iter_paginas(API_URL, API_KEY, "getRegistros", "registros"),
+        max_edad=180,
+        filtros=filtros
+    )
+
 # Función para obtener datos de configuración de cursos
 @st.cache_data(ttl=300)  # Cache por 5 minutos
 def get_config_data():
     try:
-        response = requests.get(f"{API_URL}?action=getConfig&key={API_KEY}")
-        data = response.json()
-
-        if data['success']:
-            df = pd.DataFrame(data['cursos'])
-            if not df.empty:
-                # Convertir columnas de fecha a datetime (detectando formato automáticamente)
-                date_cols = ['fecha_inicio', 'fecha_fin', 'fecha_jornada', 'fecha_sesion_1', 'fecha_sesion_2', 'fecha_sesion_3']
-                for col in date_cols:
-                    if col in df.columns:
-                        parsed = pd.to_datetime(df[col], dayfirst=True, errors='coerce')
-                        if parsed.dt.tz is not None:
-                            parsed = parsed.dt.tz_convert(None)
-                        df[col] = parsed.dt.normalize()
-
-                df['cupo_maximo'] = pd.to_numeric(df['cupo_maximo'], errors='coerce')
-            return df
-        else:
-            st.error(f"Error al obtener configuración: {data.get('error', 'Error desconocido')}")
-            return pd.DataFrame()
+        return _leer_config(get_snapshot_cache(SNAPSHOT_DB_PATH))
+    except SheetsAPIError as e:
+        st.error(f"Error al obtener configuración: {str(e)}")
+        return pd.DataFrame()
     except Exception as e:
         st.error(f"Error al conectar con la API: {str(e)}")
         return pd.DataFrame()
 
-# Función para obtener asistencias directamente desde Google Sheets (para descargas)
-@st.cache_data(ttl=60)
 def get_asistencias_desde_sheets(curso_id=None, sesion=None):
+    """
+    Obtiene asistencias de la hoja Asistencias desde el snapshot local (una
+    descarga paginada compartida); solo se leen las filas del curso y sesión.
+
+    Args:
+        curso_id: ID del curso (opcional)
+        sesion: Número de sesión (opcional)
+
+    Returns:
+        pd.DataFrame: Asistencias filtradas (attrs 'revision' del snapshot)
+    """
+    filtros = {}
+    if curso_id:
+        filtros['curso_id'] = str(curso_id)
+    if sesion is not None:
+        filtros['sesion'] = int(sesion)
     try:
-        response = requests.get(f"{API_URL}?action=getAsistencias&key={API_KEY}", timeout=15)
-        data = response.json()
-        if data.get('success') and data.get('asistencias'):
-            df = pd.DataFrame(data['asistencias'])
-            if df.empty:
-                return pd.DataFrame()
-            if curso_id:
-                df = df[df['curso_id'].astype(str) == str(curso_id)]
-            if sesion is not None:
-                df = df[df['sesion'].astype(str) == str(sesion)]
-            return df
-        return pd.DataFrame()
+        return get_snapshot_cache(SNAPSHOT_DB_PATH).obtener(
+            "asistencias",
+            lambda: iter_paginas(API_URL, API_KEY, "getAsistencias", "asistencias"),
+            max_edad=60,
+            filtros=filtros
+        )
     except Exception:
         return pd.DataFrame()
 
-# Función para obtener registros de inscripción
+def get_asistencias_reporte(curso_id=None, sesion=None):
+    """
+    Obtiene las asistencias que alimentan los reportes.
+
+    Si el buffer tiene un marcador de reconciliación vigente (contiene a la
+    hoja Asistencias), se sirven desde DuckDB; si no, desde la descarga
+    compartida de Sheets.
+
+    Args:
+        curso_id: ID del curso (opcional)
+        sesion: Número de sesión (opcional)
+
+    Returns:
+        tuple: (pd.DataFrame, str) - (asistencias, fuente: 'buffer' o 'sheets')
+    """
+    buffer = get_buffer()
+    if buffer.esta_reconciliado():
+        return get_asistencias_from_buffer(curso_id, sesion), 'buffer'
+    return get_asistencias_desde_sheets(curso_id, sesion), 'sheets'
+
+def get_motor_reportes(curso_id, sesion):
+    """
+    Motor DuckDB para los reportes de un curso y sesión.
+
+    Usa asistencias_buffer cuando el buffer está reconciliado con Sheets;
+    si no, registra la vista de Sheets del curso y sesión como relación.
+
+    Registros y asistencias de Sheets se leen del snapshot local filtrados
+    por curso (y sesión). El motor se guarda en la sesión del usuario y se
+    reutiliza en cada rerun mientras no cambien el curso, la sesión ni las
+    revisiones de los snapshots; al reemplazarlo se cierra su cursor.
+
+    Args:
+        curso_id: ID del curso
+        sesion: Número de sesión
+
+    Returns:
+        MotorReportes: Motor con registros y asistencias registrados
+    """
+    buffer = get_buffer()
+    df_registros = get_registros_curso(curso_id)
+    df_asistencias = None
+    if not buffer.esta_reconciliado():
+        df_asistencias = get_asistencias_desde_sheets(curso_id, sesion)
+    clave = (str(curso_id), str(sesion), df_registros.attrs.get('revision'),
+             None if df_asistencias is None else df_asistencias.attrs.get('revision', ''))
+
+    previo = st.session_state.get("motor_reportes")
+    if previo is not None:
+        clave_previa, motor = previo
+        if clave_previa == clave:
+            return motor
+        motor.close()
+
+    motor = MotorReportes(buffer.conn, df_registros, df_asistencias)
+    st.session_state["motor_reportes"] = (clave, motor)
+    return motor
+
+# Función para obtener registros de inscripción (descarga paginada)
 @st.cache_data(ttl=180)  # Cache por 3 minutos
 def get_registros_data():
     try:
-        response = requests.get(f"{API_URL}?action=getRegistros&key={API_KEY}")
-        data = response.json()
-
-        if data['success']:
-            return pd.DataFrame(data['registros'])
-        else:
-            st.error(f"Error al obtener registros: {data.get('error', 'Error desconocido')}")
-            return pd.DataFrame()
+        return _leer_registros(get_snapshot_cache(SNAPSHOT_DB_PATH))
+    except SheetsAPIError as e:
+        st.error(f"Error al obtener registros: {str(e)}")
+        return pd.DataFrame()
     except Exception as e:
         st.error(f"Error al conectar con la API: {str(e)}")
         return pd.DataFrame()
 
+def get_registros_curso(curso_id):
+    """
+    Registros de inscripción de un curso, leídos del snapshot local sin
+    cargar la hoja completa.
+
+    Returns:
+        pd.DataFrame: Registros del curso (attrs 'revision' del snapshot)
+    """
+    try:
+        return _leer_registros(get_snapshot_cache(SNAPSHOT_DB_PATH),
+                               {'curso_id': str(curso_id)})
+    except Exception as e:
+        st.error(f"Error al obtener registros: {str(e)}")
+        return pd.DataFrame()
+
 # ==================== FUNCIONES DE BUFFER ====================
 
+# Filas que conserva la vista en vivo de llegadas
+FEED_MAX_FILAS = 200
+
 def guardar_asistencia_buffer(curso_id, rut, sesion):
     """
     Guarda asistencia en el buffer local (instantáneo).
@@ -156,14 +260,58 @@ def get_asistencias_from_buffer(curso_id=None, sesion=None):
         return buffer.get_asistencias_curso(curso_id)
     else:
         # Obtener todas las asistencias
-        return buffer.conn.execute("SELECT * FROM asistencias_buffer").df()
+        return buffer.conn.execute("SELECT * FROM asistencias_vista").df()
 
 # ==================== FUNCIONES AUXILIARES ====================
 
+# QR de la cédula chilena: https://portal.sidiv.registrocivil.cl/docstatus?RUN=12345678-9&...
+_PATRON_RUN = re.compile(r'RUN=([0-9kK.\-]+)')
+
+def extraer_ruts(texto):
+    """
+    Extrae RUTs normalizados de una lista pegada, un CSV o lecturas de escáner.
+
+    Acepta separadores de línea, coma, punto y coma o espacio, RUTs con o sin
+    puntos/guión y la URL del QR de la cédula (parámetro RUN).
+
+    Args:
+        texto: Texto con uno o más RUTs
+
+    Returns:
+        list: RUTs en formato 12345678-9, sin repetidos y en el orden leído
+    """
+    ruts = []
+    for token in re.split(r'[\s,;]+', texto or ''):
+        coincidencia = _PATRON_RUN.search(token)
+        if coincidencia:
+            token = coincidencia.group(1)
+        token = normalizar_rut(token)
+        if len(token) < 2:
+            continue
+        if token not in ruts:
+            ruts.append(token)
+    return ruts
+
+def _acumular_escaneo():
+    """Callback del modo escáner: agrega la lectura a la lista y limpia el campo."""
+    escaneados = st.session_state.setdefault("lote_escaneados", [])
+    for rut in extraer_ruts(st.session_state.get("lote_escaner", "")):
+        if rut not in escaneados:
+            escaneados.append(rut)
+    st.session_state["lote_escaner"] = ""
+
+@st.cache_data(max_entries=4)
+def _sesiones_materializadas(dia, revision, _df_cursos):
+    """Sesiones de un día; solo se recalcula al cambiar el día o la revisión de Config."""
+    return sesiones_del_dia(_df_cursos, dia)
+
 def get_cursos_con_sesion_hoy(df_cursos):
     """
     Filtra cursos que tienen sesión hoy y devuelve DataFrame con información adicional.
 
+    El resultado se materializa una vez por día calendario y revisión de Config,
+    de modo que los reruns de la página de participante no repiten el cálculo.
+
     Args:
         df_cursos: DataFrame con configuración de cursos
 
@@ -174,175 +322,176 @@ def get_cursos_con_sesion_hoy(df_cursos):
         return pd.DataFrame()
 
     hoy_d = pd.Timestamp.now().date()
-    cursos_hoy = []
-
-    for _, curso in df_cursos.iterrows():
-        encontrado = False
-
-        # 1. Verificar fecha_jornada (sesión única explícita)
-        if 'fecha_jornada' in curso and pd.notna(curso['fecha_jornada']):
-            if pd.to_datetime(curso['fecha_jornada']).date() == hoy_d:
-                curso_dict = curso.to_dict()
-                curso_dict['sesion_hoy'] = 1
-                curso_dict['fecha_sesion_hoy'] = curso['fecha_jornada']
-                cursos_hoy.append(curso_dict)
-                encontrado = True
-
-        # 2. Verificar fecha_sesion_1/2/3 (cursos multi-sesión)
-        if not encontrado:
-            for sesion_num in [1, 2, 3]:
-                fecha_col = f'fecha_sesion_{sesion_num}'
-                if fecha_col in curso and pd.notna(curso[fecha_col]):
-                    if pd.to_datetime(curso[fecha_col]).date() == hoy_d:
-                        curso_dict = curso.to_dict()
-                        curso_dict['sesion_hoy'] = sesion_num
-                        curso_dict['fecha_sesion_hoy'] = curso[fecha_col]
-                        cursos_hoy.append(curso_dict)
-                        encontrado = True
-                        break
-
-        # 3. Fallback: hoy está dentro del rango fecha_inicio – fecha_fin
-        if not encontrado:
-            inicio = curso.get('fecha_inicio')
-            fin = curso.get('fecha_fin')
-            if pd.notna(inicio) and pd.notna(fin):
-                inicio_d = pd.to_datetime(inicio, dayfirst=True).date()
-                fin_d = pd.to_datetime(fin, dayfirst=True).date()
-                if inicio_d <= hoy_d <= fin_d:
-                    curso_dict = curso.to_dict()
-                    curso_dict['sesion_hoy'] = 1
-                    curso_dict['fecha_sesion_hoy'] = inicio
-                    cursos_hoy.append(curso_dict)
-
-    if cursos_hoy:
-        return pd.DataFrame(cursos_hoy)
-    else:
-        return pd.DataFrame()
+    revision = df_cursos.attrs.get('revision')
+    if revision is None:
+        return sesiones_del_dia(df_cursos, hoy_d)
+
+    return _sesiones_materializadas(hoy_d, revision, df_cursos)
+
+@st.cache_resource(max_entries=2)
+def _indice_por_revision(revision, _df_registros):
+    """Índice de inscritos; solo se reconstruye cuando cambia la revisión del snapshot."""
+    return IndiceInscritos(_df_registros, revision=revision)
+
+@st.cache_resource(ttl=180)  # Misma vigencia que get_registros_data
+def get_indice_inscritos():
+    """
+    Obtiene el índice hash de inscritos compartido por todas las sesiones.
+
+    Returns:
+        IndiceInscritos: Índice (curso_id, rut normalizado) → datos del participante
+    """
+    df_registros = get_registros_data()
+    revision = df_registros.attrs.get('revision')
+    if revision is None:
+        return IndiceInscritos(df_registros)
+    return _indice_por_revision(revision, df_registros)
 
-def validar_participante_inscrito(rut, curso_id, df_registros):
+def validar_participante_inscrito(rut, curso_id, indice):
     """
     Verifica si un participante está inscrito en un curso.
 
     Args:
         rut: RUT del participante
         curso_id: ID del curso
-        df_registros: DataFrame con registros de inscripciones
+        indice: IndiceInscritos (ver get_indice_inscritos)
 
     Returns:
         tuple: (bool, dict) - (está_inscrito, datos_participante)
     """
-    if df_registros.empty:
-        return False, None
+    # Lookup O(1) — comparación case-insensitive (ej: 12345678-k == 12345678-K)
+    datos = indice.buscar(curso_id, rut)
+    return datos is not None, datos
 
-    # Buscar participante — comparación case-insensitive (ej: 12345678-k == 12345678-K)
-    rut_norm = str(rut).upper().strip()
-    participante = df_registros[
-        (df_registros['rut'].astype(str).str.upper().str.strip() == rut_norm) &
-        (df_registros['curso_id'] == curso_id)
-    ]
+@st.cache_resource
+def get_roster():
+    """
+    Obtiene el roster de inscritos de hoy (precalentado al iniciar la app y
+    refrescado cada 5 minutos y a medianoche).
 
-    if not participante.empty:
-        return True, participante.iloc[0].to_dict()
-    else:
-        return False, None
-
-# ==================== GENERACIÓN DE REPORTES EXCEL ====================
-
-def _split_rut(rut_str):
-    partes = str(rut_str).strip().upper().split('-')
-    return (partes[0].replace('.', ''), partes[1]) if len(partes) == 2 else (rut_str, '')
-
-def _sexo_codigo(sexo):
-    return 1 if str(sexo).upper() == 'HOMBRE' else 2
-
-def _nac_codigo(nac):
-    return 1 if str(nac).upper() == 'CHILENO' else 2
-
-_ROL_MK = {'PROFESIONAL SST': 1, 'TRABAJADOR': 2, 'MIEMBRO DE COMITÉ PARITARIO': 3,
-            'MIEMBRO COMITE PARITARIO': 3, 'MONITOR O DELEGADO': 4, 'DIRIGENTE SINDICAL': 5}
-_ROL_MK_DISPLAY = {1: "Profesional SST", 2: "Trabajador", 3: "Miembro Comité Paritario",
-                   4: "Monitor o Delegado", 5: "Dirigente Sindical"}
-
-def generar_excel_ist(df):
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Campos inscripción ISTeduca"
-    headers = ["RUT trabajador (Sin puntos ni dv)", "DV", "Nombres", "Apellidos (ambos)",
-               "Email (individual)", "Género", "Rol trabajador", "Región", "Comuna",
-               "Rut empresa (Sin puntos, con guión)", "Razón social"]
-    hf = Font(name="Arial", bold=True, color="FFFFFF", size=10)
-    hfill = PatternFill("solid", fgColor="1F4E79")
-    thin = Side(style='thin', color="AAAAAA")
-    brd = Border(left=thin, right=thin, top=thin, bottom=thin)
-    for c, h in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=c, value=h)
-        cell.font = hf; cell.fill = hfill
-        cell.alignment = Alignment(horizontal="center", wrap_text=True)
-        cell.border = brd
-    ws.row_dimensions[1].height = 30
-    for c, w in enumerate([22,6,25,30,30,10,25,30,25,28,35], 1):
-        ws.column_dimensions[ws.cell(row=1, column=c).column_letter].width = w
-    df_ = Font(name="Arial", size=10)
-    for ri, row in enumerate(df.itertuples(index=False), 2):
-        rb, dv = _split_rut(getattr(row, 'rut', ''))
-        ap = f"{getattr(row,'apellido_paterno','')} {getattr(row,'apellido_materno','')}".strip()
-        for c, v in enumerate([rb, dv, getattr(row,'nombres',''), ap,
-            getattr(row,'email',''), getattr(row,'sexo',''), getattr(row,'rol',''),
-            getattr(row,'region',''), getattr(row,'comuna',''),
-            getattr(row,'rut_empresa',''), getattr(row,'razon_social','')], 1):
-            cell = ws.cell(row=ri, column=c, value=v)
-            cell.font = df_; cell.border = brd
-    buf = io.BytesIO(); wb.save(buf); buf.seek(0)
-    return buf
-
-def generar_excel_mk(df, fecha_sesion=None):
-    wb = Workbook()
-    ws = wb.active; ws.title = "Datos"
-    headers = ["Rut","Nombres","Apellido Paterno","Apellido Materno",
-               "Sexo","Nacionalidad","Rol Trabajador","Otro Rol",
-               "Rut empresa (Sin puntos, con guión)", "Razón social", "Comuna", "Fecha 1"]
-    hf = Font(name="Arial", bold=True, color="FFFFFF", size=10)
-    hfill = PatternFill("solid", fgColor="2E75B6")
-    thin = Side(style='thin', color="AAAAAA")
-    brd = Border(left=thin, right=thin, top=thin, bottom=thin)
-    for c, h in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=c, value=h)
-        cell.font = hf; cell.fill = hfill
-        cell.alignment = Alignment(horizontal="center"); cell.border = brd
-    for c, w in enumerate([18,25,25,25,8,14,16,25,28,35,25,20], 1):
-        ws.column_dimensions[ws.cell(row=1, column=c).column_letter].width = w
-    df_ = Font(name="Arial", size=10)
-    for ri, row in enumerate(df.itertuples(index=False), 2):
-        rol = str(getattr(row,'rol','')).upper()
-        rc = _ROL_MK.get(rol, 2)
-        otro = rol if rol not in _ROL_MK else ''
-        
-        # Obtener datos adicionales
-        re = getattr(row, 'rut_empresa', '')
-        rs = getattr(row, 'razon_social', '')
-        co = getattr(row, 'comuna', '')
-        fe = fecha_sesion if fecha_sesion else ''
-        
-        sexo_txt = str(getattr(row,'sexo','')).capitalize()
-        nac_txt  = str(getattr(row,'nacionalidad','')).capitalize()
-        rol_txt  = _ROL_MK_DISPLAY.get(rc, rol.capitalize())
-        for c, v in enumerate([getattr(row,'rut',''), getattr(row,'nombres',''),
-            getattr(row,'apellido_paterno',''), getattr(row,'apellido_materno',''),
-            sexo_txt, nac_txt, rol_txt, otro, re, rs, co, fe], 1):
-            cell = ws.cell(row=ri, column=c, value=v)
-            cell.font = df_; cell.border = brd
-    for sh, rows in [("Parametros",[("Descripcion","Valor"),("Largo máximo Rut",15),
-                      ("Largo máximo nombres",50),("Largo máximo apellido paterno",50),
-                      ("Largo máximo apellido materno",50)]),
-                     ("MaeSexo",[("Codigo","Valor"),(1,"Hombre"),(2,"Mujer")]),
-                     ("MaeNacionalidad",[("Codigo","Valor"),(1,"Chileno"),(2,"Extranjero")]),
-                     ("MaeRolTrabajador",[("Codigo","Valor"),(1,"Profesional SST"),(2,"Trabajador"),
-                      (3,"Miembro Comité Paritario"),(4,"Monitor o Delegado"),(5,"Dirigente Sindical")])]:
-        ws2 = wb.create_sheet(sh)
-        for r in rows: ws2.append(r)
-    buf = io.BytesIO(); wb.save(buf); buf.seek(0)
-    return buf
+    Returns:
+        RosterDia: Roster compartido por todas las sesiones
+    """
+    snapshots = get_snapshot_cache(SNAPSHOT_DB_PATH)
+    return RosterDia(
+        cargar_cursos=lambda: _leer_config(snapshots),
+        cargar_registros=lambda cursos: _leer_registros(snapshots, {'curso_id': sorted(cursos)}),
+        conn=get_buffer().conn,
+        intervalo_refresco=300
+    )
+
+@st.cache_resource
+def get_analitica():
+    """
+    Obtiene los agregados de asistencia materializados sobre el buffer
+    (se actualizan en cada asistencia marcada).
 
+    Returns:
+        AnaliticaAsistencia: Instancia compartida por todas las sesiones
+    """
+    return AnaliticaAsistencia(get_buffer())
+
+def validar_participante_hoy(rut, curso_id):
+    """
+    Valida inscripción contra el roster de hoy, sin descargar registros.
+
+    Solo si el RUT no está en el roster (ej: inscripción posterior al último
+    refresco) se consulta el índice completo de inscritos.
+
+    Args:
+        rut: RUT del participante
+        curso_id: ID del curso
+
+    Returns:
+        tuple: (bool, dict) - (está_inscrito, datos_participante)
+    """
+    roster = get_roster()
+    esta_inscrito, datos = validar_participante_inscrito(rut, curso_id, roster)
+    if not esta_inscrito:
+        esta_inscrito, datos = validar_participante_inscrito(rut, curso_id, get_indice_inscritos())
+        if esta_inscrito:
+            roster.agregar(datos)
+    return esta_inscrito, datos
+
+@st.cache_resource
+def get_control_admision():
+    """
+    Obtiene el control de admisión del servidor para los check-ins.
+
+    Returns:
+        ControlAdmision: Instancia compartida por todas las sesiones
+    """
+    return ControlAdmision(tasa=15, rafaga=30, max_concurrentes=8, reserva_admin=2)
+
+@st.cache_resource
+def get_envios_recientes():
+    """
+    Obtiene la caché de envíos en vuelo/recientes por (curso_id, rut, sesion),
+    compartida por todas las sesiones.
+
+    Returns:
+        ColapsadorEnvios: Instancia compartida
+    """
+    return ColapsadorEnvios(ttl=20)
+
+def procesar_checkin(curso_id, rut, sesion):
+    """
+    Valida la inscripción y marca la asistencia de un participante.
+
+    Args:
+        curso_id: ID del curso
+        rut: RUT del participante (ya validado y normalizado)
+        sesion: Número de sesión
+
+    Returns:
+        tuple: (str, str) - (nivel: 'ok', 'error' o 'aviso', mensaje para mostrar)
+    """
+    perfil = get_perfilador()
+    with perfil.fase("validación: inscripción"):
+        esta_inscrito, datos = validar_participante_hoy(rut, curso_id)
+    if not esta_inscrito:
+        return 'error', "❌ No estás inscrito en este curso. Contacta al administrador."
+
+    with perfil.fase("buffer: marcar asistencia"):
+        resultado = guardar_asistencia_buffer(curso_id=curso_id, rut=rut, sesion=sesion)
+    if not resultado['success']:
+        return 'aviso', f"ℹ️ {resultado['message']}"
+
+    nombre_completo = f"{datos.get('nombres', '')} {datos.get('apellido_paterno', '')}".strip() or rut
+    return 'ok', f"✅ ¡Asistencia registrada para {nombre_completo}!"
+
+def intentar_checkin(curso_id, sesion, clave):
+    """
+    Procesa el check-in pendiente de la sesión si el control de admisión lo permite.
+
+    El RUT pendiente se lee de st.session_state[f"checkin_pendiente_{clave}"] y el
+    resultado queda en st.session_state[f"checkin_resultado_{clave}"].
+
+    Args:
+        curso_id: ID del curso
+        sesion: Número de sesión
+        clave: Clave del formulario (curso y sesión)
+
+    Returns:
+        int: Posición en la fila (0 si ya se procesó)
+    """
+    control = get_control_admision()
+    ticket = st.session_state.setdefault("ticket_admision", uuid.uuid4().hex)
+
+    admitido, posicion = control.solicitar(ticket)
+    if not admitido:
+        return posicion
+
+    try:
+        rut = st.session_state.pop(f"checkin_pendiente_{clave}")
+        # Envíos idénticos simultáneos (doble click, otra pestaña) se ejecutan una vez
+        st.session_state[f"checkin_resultado_{clave}"] = get_envios_recientes().ejecutar(
+            (str(curso_id), rut, int(sesion)),
+            lambda: procesar_checkin(curso_id, rut, sesion)
+        )
+    finally:
+        control.liberar()
+    return 0
 
 # ==================== INTERFAZ PRINCIPAL ====================
 
@@ -351,6 +500,7 @@ def main():
 
     # Obtener instancia del buffer
     buffer = get_buffer()
+    perfil = get_perfilador()
 
     # ==================== SIDEBAR CON AUTENTICACIÓN ====================
 
@@ -365,7 +515,8 @@ def main():
 
         # Recargar asistencias desde Sheets al iniciar sesión admin (solo una vez por sesión)
         if not st.session_state.get("admin_hydrated"):
-            with st.spinner("🔄 Cargando asistencias desde Google Sheets..."):
+            with st.spinner("🔄 Cargando asistencias desde Google Sheets..."), \
+                    perfil.fase("buffer: hidratación"):
                 n = buffer.force_hydrate()
             st.session_state["admin_hydrated"] = True
             st.sidebar.info(f"✅ {n} asistencias cargadas desde Sheets")
@@ -373,7 +524,8 @@ def main():
         # Mostrar estadísticas del buffer (solo para admin)
         st.sidebar.divider()
         st.sidebar.subheader("📊 Estado del Buffer")
-        stats = buffer.get_estadisticas()
+        with perfil.fase("buffer: estadísticas"):
+            stats = buffer.get_estadisticas()
 
         col1, col2 = st.sidebar.columns(2)
         with col1:
@@ -383,12 +535,32 @@ def main():
             st.metric("Pendientes", stats['pendientes'])
             st.metric("Fallidas", stats['fallidas'])
 
+        roster_stats = get_roster().get_estadisticas()
+        st.sidebar.caption(
+            f"👥 Roster de hoy: {roster_stats['inscritos']} inscritos "
+            f"en {roster_stats['cursos']} cursos"
+        )
+        if roster_stats['ultimo_error'] is not None:
+            cuando, error = roster_stats['ultimo_error']
+            st.sidebar.warning(f"⚠️ Falló el refresco del roster ({cuando:%H:%M:%S}): {error}")
+        for dataset, fallo in get_snapshot_cache(SNAPSHOT_DB_PATH).fallos().items():
+            st.sidebar.warning(
+                f"⚠️ '{dataset}' sin actualizar desde {fallo['desde']:%H:%M:%S} "
+                f"(se sirve la última copia): {fallo['error']}"
+            )
+        admision_stats = get_control_admision().get_estadisticas()
+        st.sidebar.caption(
+            f"🚦 Check-ins en curso: {admision_stats['en_curso']} · "
+            f"en fila: {admision_stats['en_fila']}"
+        )
+        panel_perfilador()
+
         st.sidebar.divider()
 
         # Botones de control (solo para admin)
         if st.sidebar.button("🔄 Sincronizar Ahora"):
-            with st.spinner("Sincronizando con Google Sheets..."):
-                resultado = buffer.sincronizar(batch_size=300)  # Aumentado a 300
+            with st.spinner("Sincronizando con Google Sheets..."), perfil.fase("buffer: sincronizar"):
+                resultado = buffer.sincronizar()  # Lote y concurrencia adaptativos
 
             st.sidebar.success(f"✅ Sincronizados: {resultado['sincronizados']}")
             if resultado['fallidos'] > 0:
@@ -399,8 +571,7 @@ def main():
             st.sidebar.success(f"✅ Eliminados: {eliminados} registros")
 
         if st.sidebar.button("🚨 Borrar Todo el Buffer", type="primary"):
-            buffer.conn.execute("DELETE FROM asistencias_buffer")
-            buffer.hydrate_from_sheets()
+            buffer.reiniciar()
             st.sidebar.success("✅ Buffer vaciado y recargado desde Sheets")
             st.rerun()
     else:
@@ -411,7 +582,9 @@ def main():
 
     # Botón para limpiar cache (útil si se actualizaron datos en Sheets)
     if st.sidebar.button("🔄 Actualizar datos"):
+        get_snapshot_cache(SNAPSHOT_DB_PATH).invalidar()
         st.cache_data.clear()
+        get_indice_inscritos.clear()
         st.rerun()
 
     # ==================== MODO PARTICIPANTE (SIN PASSWORD) ====================
@@ -419,9 +592,14 @@ def main():
     if not admin_mode:
         st.info("👤 **Modo Participante:** Marca tu asistencia ingresando tu RUT")
 
+        # Precalentar el roster de hoy (solo la primera vez por proceso)
+        get_roster()
+
         # Obtener cursos con sesión hoy
-        df_cursos = get_config_data()
-        df_cursos_hoy = get_cursos_con_sesion_hoy(df_cursos)
+        with perfil.fase("datos: cursos"):
+            df_cursos = get_config_data()
+        with perfil.fase("filtrado: cursos con sesión hoy"):
+            df_cursos_hoy = get_cursos_con_sesion_hoy(df_cursos)
 
         if df_cursos_hoy.empty:
             st.warning("⚠️ No hay cursos con sesión programada para hoy.")
@@ -436,6 +614,8 @@ def main():
                 st.write(f"**Región:** {region}")
                 st.write(f"**Fecha:** {fecha_str}")
 
+                clave = f"{curso_id}_{sesion_hoy}"
+
                 with st.form(key=f"form_{curso_id}_{sesion_hoy}", clear_on_submit=True):
                     rut_input = st.text_input(
                         "Ingresa tu RUT (sin puntos, con guión)",
@@ -445,32 +625,44 @@ def main():
                     submit = st.form_submit_button("✅ Marcar Asistencia")
 
                     if submit and rut_input:
-                        rut_input = rut_input.strip().upper()
+                        rut_input = normalizar_rut(rut_input)
 
-                        if not rut_chile.is_valid_rut(rut_input):
+                        if not rut_valido(rut_input):
                             st.error("❌ RUT inválido. Verifica el formato.")
                         else:
-                            df_registros = get_registros_data()
-                            esta_inscrito, datos = validar_participante_inscrito(
-                                rut_input, curso_id, df_registros
-                            )
-
-                            if not esta_inscrito:
-                                st.error("❌ No estás inscrito en este curso. Contacta al administrador.")
+                            # Un reenvío reciente devuelve el resultado anterior sin hacer fila
+                            anterior = get_envios_recientes().reciente(
+                                (str(curso_id), rut_input, int(sesion_hoy)))
+                            if anterior is not None:
+                                st.session_state[f"checkin_resultado_{clave}"] = anterior
                             else:
-                                resultado = guardar_asistencia_buffer(
-                                    curso_id=curso_id,
-                                    rut=rut_input,
-                                    sesion=sesion_hoy
-                                )
-
-                                if resultado['success']:
-                                    nombre_completo = f"{datos.get('nombres', '')} {datos.get('apellido_paterno', '')}".strip() or rut_input
-                                    st.success(f"✅ ¡Asistencia registrada para {nombre_completo}!")
-                                    st.info("🎉 Ya puedes cerrar esta pestaña.")
-                                    st.balloons()
-                                else:
-                                    st.warning(f"ℹ️ {resultado['message']}")
+                                st.session_state[f"checkin_pendiente_{clave}"] = rut_input
+
+                # Con el servidor saturado el check-in espera su turno en la fila
+                if st.session_state.get(f"checkin_pendiente_{clave}"):
+                    if intentar_checkin(curso_id, sesion_hoy, clave):
+
+                        @st.fragment(run_every=2)
+                        def esperar_en_fila():
+                            posicion = intentar_checkin(curso_id, sesion_hoy, clave)
+                            if not posicion:
+                                st.rerun()
+                            st.info(f"⏳ Hay muchas personas marcando asistencia. Estás en la fila, "
+                                    f"posición {posicion}. No cierres esta página.")
+
+                        esperar_en_fila()
+
+                resultado = st.session_state.pop(f"checkin_resultado_{clave}", None)
+                if resultado:
+                    nivel, mensaje = resultado
+                    if nivel == 'ok':
+                        st.success(mensaje)
+                        st.info("🎉 Ya puedes cerrar esta pestaña.")
+                        st.balloons()
+                    elif nivel == 'error':
+                        st.error(mensaje)
+                    else:
+                        st.warning(mensaje)
 
         for _, curso in df_cursos_hoy.iterrows():
             formulario_asistencia(
@@ -486,13 +678,16 @@ def main():
 
     if admin_mode:
         # Tabs para diferentes funciones
-        tab1, tab2, tab3 = st.tabs(["📝 Gestionar Asistencia", "📊 Ver Asistencias", "🔧 Mantenimiento"])
+        tab1, tab2, tab3, tab4, tab5 = st.tabs(["📝 Gestionar Asistencia", "📊 Ver Asistencias",
+                                                "🔧 Mantenimiento", "📦 Exportación Masiva",
+                                                "📈 Analítica"])
 
         # TAB 1: Gestionar Asistencia Manual
         with tab1:
             st.subheader("📝 Registro Manual de Asistencia")
 
-            df_cursos = get_config_data()
+            with perfil.fase("datos: cursos"):
+                df_cursos = get_config_data()
 
             if df_cursos.empty:
                 st.warning("⚠️ No hay cursos disponibles")
@@ -533,26 +728,32 @@ def main():
                         submit = st.form_submit_button("💾 Registrar")
 
                         if submit and rut:
-                            if not rut_chile.is_valid_rut(rut):
+                            rut = normalizar_rut(rut)
+                            if not rut_valido(rut):
                                 st.error("❌ RUT inválido")
                             else:
                                 # Verificar inscripción
-                                df_registros = get_registros_data()
                                 esta_inscrito, datos = validar_participante_inscrito(
-                                    rut, curso_seleccionado, df_registros
+                                    rut, curso_seleccionado, get_indice_inscritos()
                                 )
 
+                                control = get_control_admision()
                                 if not esta_inscrito:
                                     st.error("❌ Participante no inscrito en este curso")
+                                elif not control.solicitar(None, admin=True)[0]:
+                                    st.warning("⏳ Servidor saturado. Reintenta en unos segundos.")
                                 else:
-                                    # Marcar en buffer
-                                    resultado = buffer.marcar_asistencia(
-                                        curso_id=curso_seleccionado,
-                                        rut=rut,
-                                        sesion=sesion_seleccionada,
-                                        estado=estado,
-                                        metodo='admin_manual'
-                                    )
+                                    # Marcar en buffer (cupo prioritario de admin)
+                                    try:
+                                        resultado = buffer.marcar_asistencia(
+                                            curso_id=curso_seleccionado,
+                                            rut=rut,
+                                            sesion=sesion_seleccionada,
+                                            estado=estado,
+                                            metodo='admin_manual'
+                                        )
+                                    finally:
+                                        control.liberar()
 
                                     if resultado['success']:
                                         nombre_completo = f"{datos.get('nombres', '')} {datos.get('apellido_paterno', '')}".strip() or rut
@@ -560,11 +761,74 @@ def main():
                                     else:
                                         st.error(f"❌ {resultado['message']}")
 
+                    # Registro masivo: lista en papel, CSV o lector de códigos
+                    st.divider()
+                    st.write("### 📋 Registro Masivo")
+                    modo_lote = st.radio("Origen de los RUTs", ["Pegar lista", "Archivo CSV", "Escáner"],
+                                         horizontal=True, key="lote_modo")
+
+                    ruts_lote = []
+                    if modo_lote == "Pegar lista":
+                        texto_lote = st.text_area("RUTs (uno por línea o separados por coma)",
+                                                  height=200, key="lote_texto")
+                        ruts_lote = extraer_ruts(texto_lote)
+                    elif modo_lote == "Archivo CSV":
+                        archivo_lote = st.file_uploader("CSV con columna 'rut'", type=["csv"], key="lote_csv")
+                        if archivo_lote is not None:
+                            df_csv = pd.read_csv(archivo_lote, dtype=str)
+                            col_rut = 'rut' if 'rut' in df_csv.columns else df_csv.columns[0]
+                            ruts_lote = extraer_ruts("\n".join(df_csv[col_rut].dropna()))
+                    else:
+                        st.text_input("Escanea la cédula o escribe un RUT y presiona Enter",
+                                      key="lote_escaner", on_change=_acumular_escaneo)
+                        ruts_lote = st.session_state.get("lote_escaneados", [])
+                        if ruts_lote and st.button("🧹 Vaciar lista escaneada"):
+                            st.session_state["lote_escaneados"] = []
+                            st.rerun()
+
+                    if ruts_lote:
+                        with perfil.fase("validación: lote"):
+                            indice = get_indice_inscritos()
+                            inscritos_lote = [r for r in ruts_lote if indice.buscar(curso_seleccionado, r)]
+                        encontrados = set(inscritos_lote)
+                        no_inscritos = [r for r in ruts_lote if r not in encontrados]
+
+                        st.write(f"**{len(ruts_lote)}** RUTs leídos · **{len(inscritos_lote)}** inscritos "
+                                 f"en {curso_seleccionado}")
+                        if no_inscritos:
+                            with st.expander(f"⚠️ {len(no_inscritos)} RUTs inválidos o no inscritos"):
+                                st.write(", ".join(no_inscritos))
+
+                        estado_lote = st.selectbox("Estado", ["presente", "ausente", "justificado"],
+                                                   key="lote_estado")
+                        if st.button(f"💾 Registrar {len(inscritos_lote)} asistencias",
+                                     disabled=not inscritos_lote, key="lote_registrar"):
+                            control = get_control_admision()
+                            if not control.solicitar(None, admin=True)[0]:
+                                st.warning("⏳ Servidor saturado. Reintenta en unos segundos.")
+                            else:
+                                try:
+                                    with perfil.fase("buffer: marcar lote"):
+                                        resultado = buffer.marcar_asistencias(
+                                            [{'curso_id': curso_seleccionado, 'rut': r,
+                                              'sesion': sesion_seleccionada} for r in inscritos_lote],
+                                            estado=estado_lote
+                                        )
+                                finally:
+                                    control.liberar()
+
+                                if resultado['success']:
+                                    st.success(f"✅ {resultado['message']}")
+                                    st.session_state["lote_escaneados"] = []
+                                else:
+                                    st.error(f"❌ {resultado['message']}")
+
         # TAB 2: Ver Asistencias
         with tab2:
             st.subheader("📊 Visualizar Asistencias")
 
-            df_cursos = get_config_data()
+            with perfil.fase("datos: cursos"):
+                df_cursos = get_config_data()
 
             if not df_cursos.empty:
                 curso_ids = df_cursos['curso_id'].tolist()
@@ -572,15 +836,59 @@ def main():
 
                 sesion_ver = st.selectbox("Sesión", [1, 2, 3], key="ver_sesion")
 
-                # Obtener asistencias desde el buffer
-                df_asist = get_asistencias_from_buffer(curso_ver, sesion_ver)
+                # Vista en vivo: contadores + solo las filas nuevas en cada refresco
+                en_vivo = st.toggle("🔴 Ver llegadas en vivo", key="ver_en_vivo")
+
+                @st.fragment(run_every=5 if en_vivo else None)
+                def panel_en_vivo():
+                    if not en_vivo:
+                        return
+
+                    feed = st.session_state.get("feed_en_vivo")
+                    if feed is None or feed['clave'] != (curso_ver, sesion_ver):
+                        feed = {'clave': (curso_ver, sesion_ver), 'ultimo_seq': 0,
+                                'filas': pd.DataFrame()}
+                        st.session_state["feed_en_vivo"] = feed
+
+                    nuevas = buffer.get_asistencias_desde(curso_ver, sesion_ver,
+                                                          feed['ultimo_seq'], limit=FEED_MAX_FILAS)
+                    if not nuevas.empty:
+                        feed['ultimo_seq'] = int(nuevas['seq'].iloc[-1])
+                        # Una fila re-marcada vuelve a llegar con seq nuevo: queda la última
+                        feed['filas'] = pd.concat([feed['filas'], nuevas]) \
+                            .drop_duplicates(subset=['rut'], keep='last').tail(FEED_MAX_FILAS)
+
+                    with perfil.fase("analítica: contadores en vivo"):
+                        analitica = get_analitica()
+                        analitica.actualizar_dimensiones(df_cursos, get_registros_data())
+                        contadores = analitica.contadores(curso_ver, sesion_ver)
+
+                    col1, col2, col3 = st.columns(3)
+                    with col1:
+                        st.metric("👥 Presentes", contadores['presentes'], delta=len(nuevas) or None)
+                    with col2:
+                        st.metric("📋 Inscritos", contadores['inscritos'])
+                    with col3:
+                        st.metric("🕒 Actualizado", datetime.now().strftime('%H:%M:%S'))
+
+                    if not feed['filas'].empty:
+                        st.dataframe(
+                            feed['filas'].iloc[::-1][['fecha_registro', 'rut', 'estado', 'metodo']],
+                            use_container_width=True, hide_index=True
+                        )
+
+                panel_en_vivo()
 
-                if not df_asist.empty:
-                    st.write(f"**Total registros:** {len(df_asist)}")
+                # Cruces y conteos resueltos en DuckDB sobre el buffer
+                with perfil.fase("consultas: resumen"):
+                    motor = get_motor_reportes(curso_ver, sesion_ver)
+                    total_asist, sincronizadas = motor.resumen(curso_ver, sesion_ver)
+
+                if total_asist:
+                    st.write(f"**Total registros:** {total_asist}")
 
                     # Mostrar estado de sincronización
-                    sincronizadas = df_asist['sincronizado'].sum()
-                    pendientes = len(df_asist) - sincronizadas
+                    pendientes = total_asist - sincronizadas
 
                     col1, col2 = st.columns(2)
                     with col1:
@@ -589,16 +897,19 @@ def main():
                         st.metric("⏳ Pendientes", pendientes)
 
                     # Mostrar tabla
-                    st.dataframe(
-                        df_asist[['rut', 'estado', 'fecha_registro', 'sincronizado', 'intentos_sync']],
-                        use_container_width=True
-                    )
-
-                    # Botón para exportar CSV
-                    csv = df_asist.to_csv(index=False).encode('utf-8')
+                    with perfil.fase("consultas: tabla de asistencias"):
+                        st.dataframe(
+                            motor.asistencias(curso_ver, sesion_ver, COLUMNAS_VISTA).df(),
+                            use_container_width=True
+                        )
+
+                    # CSV generado al renderizar (COPY ... TO): el botón no debe usar el
+                    # cursor del motor desde el thread de descarga
+                    with perfil.fase("consultas: CSV"):
+                        csv_asistencias = motor.csv_asistencias(curso_ver, sesion_ver)
                     st.download_button(
                         "📥 Descargar CSV",
-                        csv,
+                        csv_asistencias,
                         f"asistencias_{curso_ver}_sesion_{sesion_ver}.csv",
                         "text/csv"
                     )
@@ -606,47 +917,48 @@ def main():
                     # Descargar Reportes Excel
                     st.divider()
                     st.subheader("📥 Descargar Reportes")
-                    df_reg_rep = get_registros_data()
-                    if not df_reg_rep.empty and 'rut' in df_reg_rep.columns and 'curso_id' in df_reg_rep.columns:
-                        df_asist_sheets = get_asistencias_desde_sheets(curso_ver, sesion_ver)
-                        ruts_asist = df_asist_sheets['rut'].astype(str).str.upper().str.strip().unique() if not df_asist_sheets.empty else []
-                        df_reg_c = df_reg_rep[df_reg_rep['curso_id'] == curso_ver].copy()
-                        df_reg_c['rut_norm'] = df_reg_c['rut'].astype(str).str.upper().str.strip()
-                        df_asistentes = df_reg_c[df_reg_c['rut_norm'].isin(ruts_asist)].copy()
+                    if motor.tiene_registros:
+                        if motor.fuente == 'asistencias_buffer':
+                            reconciliado_en = buffer.get_reconciliacion()['reconciliado_en']
+                            st.caption(f"Fuente: buffer local (reconciliado con Sheets a las {reconciliado_en:%H:%M})")
+                        else:
+                            st.caption("Fuente: Google Sheets")
+                        with perfil.fase("consultas: asistentes"):
+                            df_asistentes = motor.asistentes(curso_ver, sesion_ver).df()
                         if df_asistentes.empty:
                             st.info("ℹ️ No hay asistentes con datos de inscripción para exportar.")
                         else:
                             col_r1, col_r2 = st.columns(2)
                             with col_r1:
                                 st.markdown("**Formato IST Educa**")
+                                # Se genera solo al hacer click (no en cada rerun)
                                 st.download_button(
                                     label="📥 Descargar IST Educa (.xlsx)",
-                                    data=generar_excel_ist(df_asistentes),
+                                    data=lambda: get_cache_reportes().obtener(
+                                        "ist", curso_ver, sesion_ver, df_asistentes,
+                                        lambda: perfil.medir("excel: IST Educa",
+                                                             generar_excel_ist, df_asistentes)
+                                    ),
                                     file_name=f"IST_{curso_ver}_s{sesion_ver}.xlsx",
-                                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                                    mime=MIME_XLSX
                                 )
                             with col_r2:
                                 st.markdown("**Formato MK Capacitaciones**")
                                 # Obtener fecha de la sesión para el Excel
                                 curso_info = df_cursos[df_cursos['curso_id'] == curso_ver].iloc[0]
-                                fecha_col = f'fecha_sesion_{sesion_ver}'
-                                if fecha_col not in curso_info or pd.isna(curso_info[fecha_col]):
-                                    # Fallback a fecha_jornada o fecha_inicio si no hay sesión específica
-                                    fecha_sesion = curso_info.get('fecha_jornada', curso_info.get('fecha_inicio', ''))
-                                else:
-                                    fecha_sesion = curso_info[fecha_col]
-                                
-                                # Convertir fecha a string dd-mm-yyyy
-                                if hasattr(fecha_sesion, 'strftime'):
-                                    fecha_sesion_str = fecha_sesion.strftime('%d-%m-%Y')
-                                else:
-                                    fecha_sesion_str = str(fecha_sesion)
+                                fecha_sesion_str = fecha_sesion_curso(curso_info, sesion_ver)
 
                                 st.download_button(
                                     label="📥 Descargar MK Capacitaciones (.xlsx)",
-                                    data=generar_excel_mk(df_asistentes, fecha_sesion=fecha_sesion_str),
+                                    data=lambda: get_cache_reportes().obtener(
+                                        "mk", curso_ver, sesion_ver, df_asistentes,
+                                        lambda: perfil.medir("excel: MK Capacitaciones",
+                                                             generar_excel_mk, df_asistentes,
+                                                             fecha_sesion=fecha_sesion_str),
+                                        extra=(fecha_sesion_str,)
+                                    ),
                                     file_name=f"MK_{curso_ver}_s{sesion_ver}.xlsx",
-                                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                                    mime=MIME_XLSX
                                 )
                 else:
                     st.info("ℹ️ No hay asistencias registradas para este curso y sesión")
@@ -656,14 +968,94 @@ def main():
             st.subheader("🔧 Mantenimiento del Sistema")
 
             st.write("### Sincronización Manual")
-            batch_size = st.number_input("Tamaño del lote", min_value=10, max_value=200, value=50)
+            st.caption("El tamaño de lote se ajusta solo: crece mientras Sheets responde rápido "
+                       "y baja ante \"ocupado\", timeouts o cuota. Los envíos van de a uno "
+                       "(el Apps Script escribe con bloqueo).")
+            control = buffer.control_sync.a_dict()
+            col_s1, col_s2, col_s3 = st.columns(3)
+            col_s1.metric("Tamaño de lote", control['lote'])
+            col_s2.metric("Envíos en paralelo", control['concurrencia'])
+            col_s3.metric("Latencia media",
+                          f"{control['latencia_media']:.1f} s"
+                          if control['latencia_media'] is not None else "—")
+
+            col_b1, col_b2 = st.columns(2)
+            with col_b1:
+                if st.button("🚀 Sincronizar Lote Completo"):
+                    with st.spinner("Sincronizando..."), perfil.fase("buffer: sincronizar"):
+                        resultado = buffer.sincronizar()
+
+                    st.write("**Resultado:**")
+                    st.json(resultado)
+            with col_b2:
+                if st.button("↺ Reiniciar Ajuste de Lote"):
+                    buffer.reiniciar_control_sync()
+                    st.rerun()
 
-            if st.button("🚀 Sincronizar Lote Completo"):
-                with st.spinner("Sincronizando..."):
-                    resultado = buffer.sincronizar(batch_size=batch_size)
+            st.divider()
 
-                st.write("**Resultado:**")
-                st.json(resultado)
+            st.write("### Cola de Fallidas")
+            df_fallidas = buffer.get_resumen_fallidas()
+            if df_fallidas.empty:
+                st.success("✅ No hay asistencias en la cola de fallidas")
+            else:
+                st.dataframe(df_fallidas, use_container_width=True, hide_index=True)
+                clase_reenvio = st.selectbox("Reenviar", ["Todas"] + df_fallidas['clase_error'].tolist(),
+                                             key="fallidas_clase")
+                if st.button("🔁 Reenviar Fallidas"):
+                    with st.spinner("Reenviando a Google Sheets..."), perfil.fase("buffer: reenviar fallidas"):
+                        resultado = buffer.reenviar_fallidas(
+                            clase_error=None if clase_reenvio == "Todas" else clase_reenvio)
+                    st.write("**Resultado:**")
+                    st.json(resultado)
+
+            st.divider()
+
+            st.write("### Reconciliación con Google Sheets")
+            st.caption("Compara conteos y hashes por curso y sesión; solo descarga los que difieren.")
+            if st.button("🔍 Reconciliar con Sheets"):
+                with st.spinner("Comparando con Google Sheets..."), perfil.fase("buffer: reconciliar"):
+                    try:
+                        resultado = buffer.reconciliar()
+                    except SheetsAPIError as e:
+                        resultado = None
+                        st.error(f"❌ El Apps Script no entregó los checksums: {e}")
+                if resultado is not None:
+                    st.write("**Resultado:**")
+                    st.json(resultado)
+
+            st.divider()
+
+            st.write("### Diario de Check-ins")
+            stats_diario = buffer.diario.get_estadisticas()
+            col_d1, col_d2, col_d3 = st.columns(3)
+            col_d1.metric("Último LSN", stats_diario['ultimo_lsn'])
+            col_d2.metric("Segmentos", stats_diario['segmentos'])
+            col_d3.metric("Tamaño", f"{stats_diario['bytes'] / 1024:.0f} KB")
+            if stats_diario['cuarentena']:
+                st.warning(f"⚠️ {stats_diario['cuarentena']} entradas del diario no se pudieron "
+                           "aplicar y quedaron en cuarentena (cuarentena.jsonl)")
+            if stats_diario['fallo']:
+                st.error(f"❌ El diario está detenido ({stats_diario['fallo']}): los check-ins "
+                         "fallan hasta reiniciar la app, que reproduce lo pendiente")
+
+            if st.button("🗜️ Compactar Diario"):
+                with perfil.fase("buffer: compactar diario"):
+                    buffer.diario.rotar()
+                    compactados = buffer.diario.compactar(buffer._lsn_sincronizado)
+                st.success(f"✅ {compactados} segmentos compactados")
+
+            st.caption("Reconstruye el buffer con los check-ins registrados hasta la fecha y hora indicadas.")
+            col_r1, col_r2 = st.columns(2)
+            with col_r1:
+                fecha_pitr = st.date_input("Fecha", key="pitr_fecha")
+            with col_r2:
+                hora_pitr = st.time_input("Hora", key="pitr_hora")
+            if st.button("⏪ Recuperar hasta ese momento", type="secondary"):
+                with st.spinner("Reproduciendo diario..."), perfil.fase("buffer: recuperar diario"):
+                    aplicadas = buffer.recuperar_desde_diario(
+                        hasta=datetime.combine(fecha_pitr, hora_pitr))
+                st.success(f"✅ Buffer reconstruido con {aplicadas} entradas del diario")
 
             st.divider()
 
@@ -675,5 +1067,106 @@ def main():
                 st.success(f"✅ Eliminados {eliminados} registros antiguos")
 
 
+        # TAB 4: Exportación masiva (todos los reportes en un ZIP)
+        with tab4:
+            st.subheader("📦 Exportación Masiva de Reportes")
+            st.caption("Genera IST Educa, MK Capacitaciones y registros de todos los cursos "
+                       "seleccionados en un solo ZIP.")
+
+            df_cursos = get_config_data()
+            regiones_cfg = sorted(df_cursos['region'].dropna().unique()) \
+                if 'region' in df_cursos.columns else []
+            region_exp = st.selectbox("Región", ["Todas las regiones"] + regiones_cfg, key="exp_region")
+            rango = st.date_input("Rango de fechas de sesión (opcional)", value=(), key="exp_rango")
+
+            job = st.session_state.get("exportacion")
+            en_curso = job is not None and job.estado == 'en_curso'
+
+            if st.button("📦 Generar ZIP", disabled=en_curso):
+                # Solo el admin exporta: el pool de procesos se importa al usarlo
+                from exportacion import ExportacionMasiva
+                desde, hasta = (tuple(rango) + (None, None))[:2]
+                job = ExportacionMasiva(
+                    df_cursos,
+                    get_registros_data(),
+                    get_asistencias_reporte()[0],
+                    region=None if region_exp == "Todas las regiones" else region_exp,
+                    desde=desde,
+                    hasta=hasta or desde
+                )
+                job.iniciar()
+                st.session_state["exportacion"] = job
+                en_curso = True
+
+            # El panel se refresca solo mientras el trabajo corre (no bloquea otras sesiones)
+            @st.fragment(run_every=1 if en_curso else None)
+            def panel_exportacion():
+                job = st.session_state.get("exportacion")
+                if job is None:
+                    return
+
+                hechos, total = job.progreso()
+                if job.estado == 'en_curso':
+                    st.progress(hechos / total if total else 0.0,
+                                text=f"Generando archivos... {hechos}/{total}")
+                elif en_curso:
+                    st.rerun()  # Terminó: rerun completo para detener el refresco
+                elif job.estado == 'error':
+                    st.error(f"❌ Error en la exportación: {job.error}")
+                elif total == 0:
+                    st.info("ℹ️ No hay reportes para los filtros seleccionados.")
+                else:
+                    segundos = (job.terminado_en - job.iniciado_en).total_seconds()
+                    st.success(f"✅ {total} archivos generados en {segundos:.1f}s")
+                    st.download_button(
+                        "📥 Descargar ZIP",
+                        job.zip_bytes,
+                        f"reportes_{job.iniciado_en:%Y%m%d_%H%M}.zip",
+                        "application/zip"
+                    )
+
+            panel_exportacion()
+
+        # TAB 5: Analítica entre sesiones
+        with tab5:
+            st.subheader("📈 Analítica de Asistencia")
+
+            with perfil.fase("analítica: dimensiones"):
+                df_cursos = get_config_data()
+                analitica = get_analitica()
+                analitica.actualizar_dimensiones(df_cursos, get_registros_data())
+
+            etiquetas = {'curso': "Curso", 'sesion': "Sesión", 'region': "Región",
+                         'rol': "Rol", 'empresa': "Empresa (RUT)"}
+            por = st.radio("Tasa de asistencia por", list(etiquetas),
+                           format_func=etiquetas.get, horizontal=True, key="analitica_por")
+            with perfil.fase("analítica: tasa de asistencia"):
+                df_tasa = analitica.tasa_asistencia(por)
+            if df_tasa.empty:
+                st.info("ℹ️ Aún no hay sesiones con asistencia registrada.")
+            else:
+                st.dataframe(df_tasa, use_container_width=True, hide_index=True)
+
+            st.write("### Retención entre sesiones")
+            with perfil.fase("analítica: retención"):
+                df_ret = analitica.retencion()
+            if df_ret.empty:
+                st.info("ℹ️ Se necesitan al menos dos sesiones realizadas de un mismo curso.")
+            else:
+                st.dataframe(df_ret, use_container_width=True, hide_index=True)
+
+            st.write("### Inasistentes")
+            if not df_cursos.empty:
+                col1, col2 = st.columns(2)
+                with col1:
+                    curso_ina = st.selectbox("Curso", df_cursos['curso_id'].tolist(), key="ina_curso")
+                with col2:
+                    sesion_ina = st.selectbox("Sesión", [1, 2, 3], key="ina_sesion")
+                df_ina = analitica.inasistentes(curso_ina, sesion_ina)
+                st.write(f"**{len(df_ina)}** inscritos sin asistencia")
+                st.dataframe(df_ina, use_container_width=True, hide_index=True)
+
+
 if __name__ == "__main__":
-    main()
+    with get_perfilador().rerun("asistencia"):
+        main()
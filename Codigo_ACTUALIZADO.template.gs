@@ -19,6 +19,10 @@ const REGISTROS_SHEET_NAME = 'Inscripciones';
 const CONFIG_SHEET_NAME = 'Config';
 const SHEET_NAME_ASISTENCIAS = 'Asistencias';
 
+// Sesión máxima y estados que acepta el buffer (db_buffer.SESION_MAX / ESTADOS)
+const SESION_MAX = 127;
+const ESTADOS = ['presente', 'ausente', 'justificado'];
+
 // Clave de API - REEMPLAZAR CON TU CLAVE SEGURA
 const API_KEY = '<<TU_API_KEY_AQUI>>'; // Debe coincidir con la del secrets.toml
 
@@ -59,7 +63,7 @@ function doGet(e) {
         break;
       case 'getRegistros':
         console.log("Ejecutando getRegistrosData()");
-        result = getRegistrosData();
+        result = paginarHoja(REGISTROS_SHEET_NAME, 'registros', e.parameter, getRegistrosData);
         break;
       case 'getCursoActivo':
         console.log("Ejecutando getCursoActivo()");
@@ -67,7 +71,15 @@ function doGet(e) {
         break;
       case 'getAsistencias':
         console.log("Ejecutando getAsistencias()");
-        result = getAsistencias();
+        if (e.parameter.curso_id || e.parameter.sesion) {
+          result = filtrarAsistencias(e.parameter);
+        } else {
+          result = paginarHoja(SHEET_NAME_ASISTENCIAS, 'asistencias', e.parameter, getAsistencias);
+        }
+        break;
+      case 'getChecksumsAsistencias':
+        console.log("Ejecutando getChecksumsAsistencias()");
+        result = getChecksumsAsistencias();
         break;
       default:
         console.log("Acción no reconocida: " + action);
@@ -88,6 +100,215 @@ function doGet(e) {
   }
 }
 
+// Pagina una hoja según los parámetros offset/limit leyendo solo la ventana
+// pedida (cada página cuesta lo mismo, sin importar el largo de la hoja);
+// 'total' sale de getLastRow(). Sin 'limit' devuelve leerTodo() completo
+// (compatibilidad con clientes antiguos). 'next_offset' es null en la última página.
+function paginarHoja(nombreHoja, campo, params, leerTodo) {
+  if (!params.limit) {
+    return leerTodo();
+  }
+
+  try {
+    const offset = Math.max(parseInt(params.offset || '0', 10), 0);
+    const limit = parseInt(params.limit, 10);
+    const sheet = SpreadsheetApp.openById(SPREADSHEET_ID).getSheetByName(nombreHoja);
+    const total = Math.max(sheet.getLastRow() - 1, 0);
+    const n = Math.min(limit, total - offset);
+
+    const result = { success: true, total: total, next_offset: null };
+    result[campo] = [];
+    if (n <= 0) {
+      return result;
+    }
+
+    const lastCol = sheet.getLastColumn();
+    const headers = sheet.getRange(1, 1, 1, lastCol).getValues()[0];
+    result[campo] = sheet.getRange(offset + 2, 1, n, lastCol).getValues()
+      .map(function(fila) { return filaAObjeto(headers, fila); });
+    result.next_offset = (offset + n < total) ? offset + n : null;
+    return result;
+  } catch (error) {
+    return { success: false, error: error.toString() };
+  }
+}
+
+// Convierte una fila de getValues() en un objeto {encabezado: valor}.
+function filaAObjeto(headers, fila) {
+  const obj = {};
+  headers.forEach(function(h, i) {
+    if (h !== '') obj[h] = fila[i];
+  });
+  return obj;
+}
+
+// Agrega muchas inscripciones en una sola escritura (importación masiva).
+// Agregar en doPost:
+//   case 'addRegistros': result = addRegistros(JSON.parse(e.postData.contents).registros); break;
+function addRegistros(filas) {
+  const lock = LockService.getScriptLock();
+  if (!lock.tryLock(30000)) {
+    return { success: false, error: 'Sistema ocupado, intente nuevamente' };
+  }
+
+  try {
+    if (!filas || filas.length === 0) {
+      return { success: true, agregados: 0 };
+    }
+
+    const sheet = SpreadsheetApp.openById(SPREADSHEET_ID).getSheetByName(REGISTROS_SHEET_NAME);
+    const headers = sheet.getRange(1, 1, 1, sheet.getLastColumn()).getValues()[0];
+    const valores = filas.map(function(fila) {
+      return headers.map(function(h) {
+        return fila[h] !== undefined ? fila[h] : '';
+      });
+    });
+
+    sheet.getRange(sheet.getLastRow() + 1, 1, valores.length, headers.length).setValues(valores);
+    return { success: true, agregados: valores.length };
+  } catch (error) {
+    return { success: false, error: error.toString() };
+  } finally {
+    lock.releaseLock();
+  }
+}
+
+// Agrega muchas asistencias en una sola escritura (sincronización del buffer
+// y reenvío de la cola de fallidas). Las ya registradas (mismo curso_id, rut
+// y sesion) se omiten, igual que 'ya existe' en addAsistencia.
+// Agregar en doPost:
+//   case 'addAsistencias': result = addAsistencias(JSON.parse(e.postData.contents).asistencias); break;
+function addAsistencias(filas) {
+  const lock = LockService.getScriptLock();
+  if (!lock.tryLock(30000)) {
+    return { success: false, error: 'Sistema ocupado, intente nuevamente' };
+  }
+
+  try {
+    if (!filas || filas.length === 0) {
+      return { success: true, agregados: 0, existentes: 0 };
+    }
+
+    const sheet = SpreadsheetApp.openById(SPREADSHEET_ID).getSheetByName(SHEET_NAME_ASISTENCIAS);
+    const headers = sheet.getRange(1, 1, 1, sheet.getLastColumn()).getValues()[0];
+    const iCurso = headers.indexOf('curso_id');
+    const iRut = headers.indexOf('rut');
+    const iSesion = headers.indexOf('sesion');
+
+    const existentes = {};
+    if (sheet.getLastRow() > 1) {
+      sheet.getRange(2, 1, sheet.getLastRow() - 1, headers.length).getValues()
+        .forEach(function(fila) {
+          existentes[fila[iCurso] + '|' + fila[iRut] + '|' + fila[iSesion]] = true;
+        });
+    }
+
+    const valores = [];
+    filas.forEach(function(fila) {
+      const clave = fila.curso_id + '|' + fila.rut + '|' + fila.sesion;
+      if (existentes[clave]) return;
+      existentes[clave] = true;
+      valores.push(headers.map(function(h) {
+        return fila[h] !== undefined ? fila[h] : '';
+      }));
+    });
+
+    if (valores.length > 0) {
+      sheet.getRange(sheet.getLastRow() + 1, 1, valores.length, headers.length).setValues(valores);
+    }
+    return { success: true, agregados: valores.length, existentes: filas.length - valores.length };
+  } catch (error) {
+    return { success: false, error: error.toString() };
+  } finally {
+    lock.releaseLock();
+  }
+}
+
+// Conteo y hash por (curso_id, sesion) de la hoja Asistencias, para que el
+// buffer se reconcilie sin descargar la hoja completa. El hash es la suma
+// (mod 2^32) de los primeros 4 bytes del MD5 de cada RUT: no depende del orden.
+// Cuenta las mismas filas que carga el buffer al hidratarse (RUT con forma de
+// RUT, sesión 1..127, estado conocido, sin repetidos) y hashea el RUT en la
+// forma canónica del buffer (rutCanonico), para que ambos lados coincidan.
+function getChecksumsAsistencias() {
+  try {
+    const sheet = SpreadsheetApp.openById(SPREADSHEET_ID).getSheetByName(SHEET_NAME_ASISTENCIAS);
+    const datos = sheet.getDataRange().getValues();
+    const headers = datos.shift();
+    const iCurso = headers.indexOf('curso_id');
+    const iRut = headers.indexOf('rut');
+    const iSesion = headers.indexOf('sesion');
+    const iEstado = headers.indexOf('estado');
+
+    const buckets = {};
+    const vistos = {};
+    datos.forEach(function(fila) {
+      const rut = rutCanonico(fila[iRut]);
+      const sesion = Math.floor(Number(fila[iSesion]));
+      const estado = iEstado < 0 ? 'presente' : String(fila[iEstado]);
+      if (!rut || !(sesion >= 1 && sesion <= SESION_MAX) || ESTADOS.indexOf(estado) < 0) return;
+
+      const curso = String(fila[iCurso]);
+      const clave = curso + '|' + sesion;
+      if (vistos[clave + '|' + rut]) return;
+      vistos[clave + '|' + rut] = true;
+
+      const bytes = Utilities.computeDigest(Utilities.DigestAlgorithm.MD5, rut, Utilities.Charset.UTF_8);
+      const h = (((bytes[0] & 255) << 24) | ((bytes[1] & 255) << 16) |
+                 ((bytes[2] & 255) << 8) | (bytes[3] & 255)) >>> 0;
+      if (!buckets[clave]) {
+        buckets[clave] = { curso_id: curso, sesion: sesion, filas: 0, hash: 0 };
+      }
+      buckets[clave].filas += 1;
+      buckets[clave].hash = (buckets[clave].hash + h) % 4294967296;
+    });
+
+    return { success: true, checksums: Object.keys(buckets).map(function(k) { return buckets[k]; }) };
+  } catch (error) {
+    return { success: false, error: error.toString() };
+  }
+}
+
+// RUT en la forma canónica del buffer (validacion.normalizar_rut + codificar_rut):
+// sin puntos ni espacios, en mayúsculas, con guion y sin ceros a la izquierda
+// (' 12.345.678-k' → '12345678-K'). Devuelve null si no tiene forma de RUT.
+function rutCanonico(rut) {
+  const texto = String(rut).replace(/[.\s]/g, '').toUpperCase();
+  const partes = /^(\d{1,8})-?([0-9K])$/.exec(texto);
+  if (!partes) return null;
+  return Number(partes[1]) + '-' + partes[2];
+}
+
+// Asistencias de un curso y/o sesión (parámetros curso_id y sesion), filtradas
+// en el servidor: la reconciliación descarga solo las filas de los buckets que
+// difieren, no la hoja completa. Respeta offset/limit como paginarHoja.
+function filtrarAsistencias(params) {
+  try {
+    const sheet = SpreadsheetApp.openById(SPREADSHEET_ID).getSheetByName(SHEET_NAME_ASISTENCIAS);
+    const datos = sheet.getDataRange().getValues();
+    const headers = datos.shift();
+    const iCurso = headers.indexOf('curso_id');
+    const iSesion = headers.indexOf('sesion');
+
+    const filas = datos.filter(function(fila) {
+      return (!params.curso_id || String(fila[iCurso]) === String(params.curso_id)) &&
+             (!params.sesion || String(fila[iSesion]) === String(params.sesion));
+    });
+
+    const result = { success: true, total: filas.length, next_offset: null };
+    const offset = Math.max(parseInt(params.offset || '0', 10), 0);
+    const limit = params.limit ? parseInt(params.limit, 10) : filas.length;
+    result.asistencias = filas.slice(offset, offset + limit)
+      .map(function(fila) { return filaAObjeto(headers, fila); });
+    if (params.limit && offset + limit < filas.length) {
+      result.next_offset = offset + limit;
+    }
+    return result;
+  } catch (error) {
+    return { success: false, error: error.toString() };
+  }
+}
+
 // NOTA: El resto del código continúa igual que en Codigo_ACTUALIZADO.gs
 // Por brevedad, este template solo muestra las primeras líneas que contienen
 // información sensible. El archivo completo debe copiarse desde Codigo_ACTUALIZADO.gs
@@ -1,28 +1,27 @@
 import streamlit as st
 import pandas as pd
-import json
 import time
 import requests
 from datetime import datetime
-from rut_chile import rut_chile
-import io
+
+from sheets_api import descargar_config, iter_paginas, SheetsAPIError
+from sheets_cache import get_snapshot_cache
+from reportes import generar_excel_registros, get_cache_reportes
+from indices import IndiceInscritos
+from datos_estaticos import REGIONES, COMUNAS_POR_REGION, CODIGO_REGION
+from perfilador import get_perfilador, panel_perfilador
+from validacion import normalizar_rut, normalizar_ruts, rut_valido, email_valido
+from importacion import (leer_planilla, validar_importacion, registros_para_envio,
+                         COLUMNAS_IMPORTACION)
 
 # Configuración básica
 st.set_page_config(page_title="Inscripción de Participantes", layout="wide")
 
 # Constantes
-COMUNAS_REGIONES_PATH = "comunas-regiones.json"
 SECRET_PASSWORD = st.secrets["SECRET_PASSWORD"]
 API_URL = st.secrets["API_URL"]  # URL del Apps Script publicado como aplicación web
 API_KEY = st.secrets["API_KEY"]  # Clave API configurada en el Apps Script
 
-def _rut_valido(rut_str):
-    """Valida RUT sin lanzar excepción para entradas no numéricas."""
-    try:
-        return bool(rut_chile.is_valid_rut(str(rut_str).strip()))
-    except Exception:
-        return False
-
 # Listas para formulario
 ROLES = ["TRABAJADOR", "PROFESIONAL SST", "MIEMBRO DE COMITÉ PARITARIO",
          "MONITOR O DELEGADO", "DIRIGENTE SINDICAL", "EMPLEADOR", 
@@ -30,51 +29,48 @@ ROLES = ["TRABAJADOR", "PROFESIONAL SST", "MIEMBRO DE COMITÉ PARITARIO",
 SEXO =['MUJER','HOMBRE']
 NACIONALIDAD = ['CHILENO', 'EXTRANJERO']
 
-# Cargar archivo JSON de comunas y regiones
-with open(COMUNAS_REGIONES_PATH, "r", encoding='utf-8') as file:
-    comunas_regiones = json.load(file)
+# Regiones y comunas: cargadas una vez por proceso en datos_estaticos
+regiones = REGIONES
 
-# Obtener lista de regiones
-regiones = [region["region"] for region in comunas_regiones["regiones"]]
+# Snapshots locales de Sheets: tras un reinicio se sirven sin esperar al API
+SNAPSHOT_DB_PATH = "sheets_cache_inscripcion.duckdb"
 
 # Función para obtener datos de configuración desde la API
 @st.cache_data(ttl=300)  # Cache por 5 minutos
 def get_config_data():
     try:
-        response = requests.get(f"{API_URL}?action=getConfig&key={API_KEY}")
-        data = response.json()
-        
-        if data['success']:
-            df = pd.DataFrame(data['cursos'])
-            if not df.empty:
-                # Convertir columnas de fecha a datetime (probando múltiples formatos)
-                date_cols = ['fecha_inicio', 'fecha_fin', 'fecha_jornada']
-                for col in date_cols:
-                    if col in df.columns:
-                        df[col] = pd.to_datetime(df[col], dayfirst=True, errors='coerce')
-
-                if 'cupo_maximo' in df.columns:
-                    df['cupo_maximo'] = pd.to_numeric(df['cupo_maximo'], errors='coerce')
-            return df
-        else:
-            st.error(f"Error al obtener configuración: {data.get('error', 'Error desconocido')}")
-            return pd.DataFrame()
+        df = get_snapshot_cache(SNAPSHOT_DB_PATH).obtener(
+            "config", lambda: descargar_config(API_URL, API_KEY), max_edad=300
+        )
+        if not df.empty:
+            # Convertir columnas de fecha a datetime (probando múltiples formatos)
+            date_cols = ['fecha_inicio', 'fecha_fin', 'fecha_jornada']
+            for col in date_cols:
+                if col in df.columns:
+                    df[col] = pd.to_datetime(df[col], dayfirst=True, errors='coerce')
+
+            if 'cupo_maximo' in df.columns:
+                df['cupo_maximo'] = pd.to_numeric(df['cupo_maximo'], errors='coerce')
+        return df
+    except SheetsAPIError as e:
+        st.error(f"Error al obtener configuración: {str(e)}")
+        return pd.DataFrame()
     except Exception as e:
         st.error(f"Error al conectar con la API: {str(e)}")
         return pd.DataFrame()
 
-# Función para obtener registros desde la API
+# Función para obtener registros desde la API (descarga paginada)
 @st.cache_data(ttl=180)  # Cache por 3 minutos (se actualiza más frecuentemente)
 def get_registros_data():
     try:
-        response = requests.get(f"{API_URL}?action=getRegistros&key={API_KEY}")
-        data = response.json()
-        
-        if data['success']:
-            return pd.DataFrame(data['registros'])
-        else:
-            st.error(f"Error al obtener registros: {data.get('error', 'Error desconocido')}")
-            return pd.DataFrame()
+        return get_snapshot_cache(SNAPSHOT_DB_PATH).obtener(
+            "registros",
+            lambda: iter_paginas(API_URL, API_KEY, "getRegistros", "registros"),
+            max_edad=180
+        )
+    except SheetsAPIError as e:
+        st.error(f"Error al obtener registros: {str(e)}")
+        return pd.DataFrame()
     except Exception as e:
         st.error(f"Error al conectar con la API: {str(e)}")
         return pd.DataFrame()
@@ -182,6 +178,65 @@ def guardar_registro(registro, max_retries=3):
 
     return False
 
+def _enviar_lote_registros(lote, max_retries=3):
+    """
+    Envía un lote de registros con la acción addRegistros (una escritura en Sheets).
+
+    Returns:
+        list: (bool, str) por registro - (guardado, mensaje de error)
+    """
+    import random
+
+    for attempt in range(max_retries):
+        try:
+            if attempt > 0:
+                time.sleep(random.uniform(0.5, 2.0))
+
+            response = requests.post(
+                API_URL,
+                params={"action": "addRegistros", "key": API_KEY},
+                json={"registros": lote},
+                timeout=60
+            )
+            data = response.json()
+
+            if data['success']:
+                return [(True, '')] * len(lote)
+
+            error_msg = data.get('error', 'Error desconocido')
+            if 'ocupado' in error_msg.lower() or 'busy' in error_msg.lower():
+                continue
+            # Apps Script sin addRegistros: se envía uno a uno
+            if 'acción no válida' in error_msg.lower():
+                return [(guardar_registro(r, max_retries), '') for r in lote]
+            return [(False, error_msg)] * len(lote)
+
+        except requests.exceptions.Timeout:
+            continue
+        except Exception as e:
+            if attempt == max_retries - 1:
+                return [(False, str(e))] * len(lote)
+
+    return [(False, 'Sistema sobrecargado o sin respuesta')] * len(lote)
+
+def guardar_registros(registros, tamano_lote=100, max_retries=3):
+    """
+    Guarda muchos registros en lotes con addRegistros.
+
+    Args:
+        registros: Lista de diccionarios con datos de participantes
+        tamano_lote: Registros por request
+        max_retries: Reintentos por lote (sistema ocupado / timeout)
+
+    Returns:
+        list: (bool, str) por registro, en el mismo orden - (guardado, error)
+    """
+    resultados = []
+    for inicio in range(0, len(registros), tamano_lote):
+        resultados.extend(_enviar_lote_registros(registros[inicio:inicio + tamano_lote],
+                                                 max_retries))
+    return resultados
+
 # Función auxiliar para formatear fechas
 def formato_fecha_dd_mm_yyyy(fecha):
     """Convierte una fecha a formato dd-mm-yyyy para mostrar al usuario"""
@@ -210,15 +265,12 @@ def get_curso_activo():
 
 # Función para actualizar comunas basado en la región seleccionada
 def update_comunas_state():
-    # Reinicia la lista de comunas cada vez que se selecciona una región
-    st.session_state.comunas = []
-    # Si una región ha sido seleccionada
-    if st.session_state.region:
-        # Busca la región seleccionada y guarda las comunas en st.session_state
-        for reg in comunas_regiones["regiones"]:
-            if reg["region"] == st.session_state.region:
-                st.session_state.comunas = reg["comunas"]
-                break
+    # Comunas de la región seleccionada (lista vacía si no hay región)
+    st.session_state.comunas = COMUNAS_POR_REGION.get(st.session_state.region, [])
+
+# Perfilador opt-in (se activa desde el panel admin): mide el rerun completo
+perfil = get_perfilador()
+rerun_perfil = perfil.iniciar_rerun("inscripcion")
 
 try:
     # Panel de Administración
@@ -227,15 +279,18 @@ try:
 
     # Botón para limpiar cache (útil cuando hay actualizaciones)
     if st.sidebar.button("🔄 Actualizar Datos"):
+        get_snapshot_cache(SNAPSHOT_DB_PATH).invalidar()
         st.cache_data.clear()
         st.sidebar.success("✅ Cache limpiado. Datos actualizados.")
         st.rerun()
 
     if password == SECRET_PASSWORD:
         st.sidebar.success("✅ Acceso concedido")
+        panel_perfilador()
 
         # Obtener configuración de cursos
-        df_cursos = get_config_data()
+        with perfil.fase("datos: cursos"):
+            df_cursos = get_config_data()
 
         # Filtro regional para admin
         st.sidebar.subheader("Filtrar por Región")
@@ -286,26 +341,6 @@ try:
             key="region_nuevo_curso"
         )
 
-        # Mapeo de regiones a códigos cortos
-        region_codigo_map = {
-            "Región de Arica y Parinacota": "ARI",
-            "Región de Tarapacá": "TAR",
-            "Región de Antofagasta": "ANT",
-            "Región de Atacama": "ATA",
-            "Región de Coquimbo": "COQ",
-            "Región de Valparaíso": "VAL",
-            "Región Metropolitana de Santiago": "RM",
-            "Región del Libertador Gral. Bernardo O'Higgins": "OHI",
-            "Región del Maule": "MAU",
-            "Región de Ñuble": "ÑUB",
-            "Región del Biobío": "BIO",
-            "Región de la Araucanía": "ARA",
-            "Región de Los Ríos": "RIO",
-            "Región de Los Lagos": "LAG",
-            "Región Aysén del Gral. Carlos Ibáñez del Campo": "AYS",
-            "Región de Magallanes y de la Antártica Chilena": "MAG"
-        }
-
         fecha_inicio = st.sidebar.date_input("Fecha de Inicio")
         fecha_fin = st.sidebar.date_input("Fecha de Término")
 
@@ -320,7 +355,7 @@ try:
         }
         mes_nombre = meses_esp[fecha_inicio.month]
         anio_corto = str(fecha_inicio.year)[2:]  # Últimos 2 dígitos del año
-        codigo_region = region_codigo_map.get(region_curso, "OTR")
+        codigo_region = CODIGO_REGION.get(region_curso, "OTR")
 
         curso_id_generado = f"{codigo_region}-{mes_nombre}{anio_corto}"
 
@@ -360,7 +395,8 @@ try:
         st.sidebar.subheader("Gestión de Registros")
         
         # Obtener registros existentes
-        df_registros = get_registros_data()
+        with perfil.fase("datos: registros"):
+            df_registros = get_registros_data()
         
         # Selector de curso para descargar
         if not df_cursos.empty:
@@ -378,35 +414,15 @@ try:
                     registros_curso = df_registros[df_registros['curso_id'] == curso_seleccionado_descarga]
                     
                     if not registros_curso.empty:
-                        # Preparar Excel para descarga
-                        buffer = io.BytesIO()
-                        with pd.ExcelWriter(buffer, engine='xlsxwriter') as writer:
-                            registros_curso.to_excel(
-                                writer,
-                                sheet_name='Datos',
-                                index=False,
-                                float_format='%.2f'
-                            )
-                            
-                            # Formato para el archivo Excel
-                            workbook = writer.book
-                            worksheet = writer.sheets['Datos']
-                            header_format = workbook.add_format({
-                                'bold': True,
-                                'bg_color': '#D8E4BC',
-                                'border': 1
-                            })
-                            
-                            for col_num, value in enumerate(registros_curso.columns.values):
-                                worksheet.write(0, col_num, value, header_format)
-                                worksheet.set_column(col_num, col_num, len(str(value)) + 2)
-                            
-                            worksheet.freeze_panes(1, 0)
-                        
-                        buffer.seek(0)
+                        # Preparar Excel para descarga (reutiliza el último si los datos no cambiaron)
+                        contenido = get_cache_reportes().obtener(
+                            "registros", curso_seleccionado_descarga, None, registros_curso,
+                            lambda: perfil.medir("excel: registros", generar_excel_registros,
+                                                 registros_curso)
+                        )
                         st.sidebar.download_button(
                             label=f"📥 Descargar Registros ({len(registros_curso)} inscritos)",
-                            data=buffer.getvalue(),
+                            data=contenido,
                             file_name=f"registros_curso_{curso_seleccionado_descarga}.xlsx",
                             mime="application/vnd.ms-excel"
                         )
@@ -415,12 +431,74 @@ try:
                 else:
                     st.sidebar.warning("No hay registros disponibles")
 
+        # Importación masiva desde planilla de la empresa
+        with st.expander("📥 Importación Masiva de Inscripciones (CSV / XLSX)"):
+            if df_cursos_filtrados.empty:
+                st.info("No hay cursos para la región seleccionada.")
+            else:
+                curso_importacion = st.selectbox("Curso de destino",
+                                                 df_cursos_filtrados['curso_id'].tolist(),
+                                                 key="curso_importacion")
+                archivo = st.file_uploader("Planilla de trabajadores", type=["csv", "xlsx"],
+                                           key="archivo_importacion")
+                st.caption("Columnas: " + ", ".join(COLUMNAS_IMPORTACION))
+
+                if archivo is not None:
+                    curso_imp = df_cursos_filtrados[
+                        df_cursos_filtrados['curso_id'] == curso_importacion].iloc[0].to_dict()
+                    df_registros = get_registros_data()
+                    inscritos_imp = int((df_registros['curso_id'] == curso_importacion).sum()) \
+                        if 'curso_id' in df_registros.columns else 0
+
+                    with perfil.fase("validación: importación"):
+                        reporte = validar_importacion(
+                            leer_planilla(archivo), curso_imp, IndiceInscritos(df_registros),
+                            inscritos_imp,
+                            COMUNAS_POR_REGION,
+                            {'sexo': SEXO, 'nacionalidad': NACIONALIDAD, 'rol': ROLES}
+                        )
+                    validos = int((reporte['estado'] == 'VALIDO').sum())
+
+                    col1, col2, col3 = st.columns(3)
+                    with col1:
+                        st.metric("Filas", len(reporte))
+                    with col2:
+                        st.metric("Válidas", validos)
+                    with col3:
+                        st.metric("Con errores", len(reporte) - validos)
+
+                    if st.button(f"✅ Inscribir {validos} trabajadores", disabled=validos == 0,
+                                 key="confirmar_importacion"):
+                        with st.spinner("Enviando inscripciones..."), \
+                                perfil.fase("api: inscripción masiva"):
+                            resultados = guardar_registros(
+                                registros_para_envio(reporte, curso_importacion))
+                        guardados = reporte['estado'] == 'VALIDO'
+                        reporte.loc[guardados, 'estado'] = [
+                            'INSCRITO' if ok else 'ERROR' for ok, _ in resultados]
+                        reporte.loc[guardados, 'detalle'] = [error for _, error in resultados]
+                        st.success(f"✅ {int((reporte['estado'] == 'INSCRITO').sum())} inscripciones guardadas")
+
+                        get_snapshot_cache(SNAPSHOT_DB_PATH).invalidar("registros")
+                        get_registros_data.clear()
+
+                    st.dataframe(reporte[['fila', 'rut', 'nombres', 'apellido_paterno',
+                                          'estado', 'detalle']],
+                                 use_container_width=True, hide_index=True)
+                    st.download_button(
+                        "📄 Descargar reporte por fila (.csv)",
+                        reporte.to_csv(index=False).encode('utf-8'),
+                        f"importacion_{curso_importacion}.csv",
+                        "text/csv"
+                    )
+
     # Mostrar formulario de inscripción
     try:
         st.title("Inscripción Jornada de Difusión sobre el Nuevo Protocolo de Ruido ISP (Res. Ex. Nº 5.921) - Empresas Adherentes de IST")
 
         # Obtener todos los cursos
-        df_cursos = get_config_data()
+        with perfil.fase("datos: cursos"):
+            df_cursos = get_config_data()
 
         if df_cursos.empty:
             st.warning("No hay cursos disponibles. El administrador debe crear uno.")
@@ -429,17 +507,18 @@ try:
         # Filtrar cursos disponibles: fecha_fin >= hoy (cursos vigentes o futuros)
         hoy = pd.Timestamp.now().normalize()
 
-        if 'fecha_fin' in df_cursos.columns:
-            # Convertir ambas fechas a la misma zona horaria (sin timezone)
-            df_cursos_copia = df_cursos.copy()
-            fecha_fin_parsed = pd.to_datetime(df_cursos_copia['fecha_fin'], dayfirst=True, errors='coerce')
-            if fecha_fin_parsed.dt.tz is not None:
-                fecha_fin_parsed = fecha_fin_parsed.dt.tz_convert(None)
-            df_cursos_copia['fecha_fin'] = fecha_fin_parsed.dt.normalize()
-            # Filtrar cursos donde la fecha_fin sea mayor o igual a hoy
-            df_cursos_disponibles = df_cursos_copia[df_cursos_copia['fecha_fin'] >= hoy].copy()
-        else:
-            df_cursos_disponibles = df_cursos
+        with perfil.fase("filtrado: cursos vigentes"):
+            if 'fecha_fin' in df_cursos.columns:
+                # Convertir ambas fechas a la misma zona horaria (sin timezone)
+                df_cursos_copia = df_cursos.copy()
+                fecha_fin_parsed = pd.to_datetime(df_cursos_copia['fecha_fin'], dayfirst=True, errors='coerce')
+                if fecha_fin_parsed.dt.tz is not None:
+                    fecha_fin_parsed = fecha_fin_parsed.dt.tz_convert(None)
+                df_cursos_copia['fecha_fin'] = fecha_fin_parsed.dt.normalize()
+                # Filtrar cursos donde la fecha_fin sea mayor o igual a hoy
+                df_cursos_disponibles = df_cursos_copia[df_cursos_copia['fecha_fin'] >= hoy].copy()
+            else:
+                df_cursos_disponibles = df_cursos
 
         if df_cursos_disponibles.empty:
             st.warning("No hay cursos disponibles para inscripción. Todos los cursos han finalizado.")
@@ -511,7 +590,8 @@ try:
                     st.write(f"📅 Sesión 3: {formato_fecha_dd_mm_yyyy(curso_actual['fecha_sesion_3'])}")
 
             # Verificar cupos disponibles
-            df_registros = get_registros_data()
+            with perfil.fase("datos: registros"):
+                df_registros = get_registros_data()
             if not df_registros.empty:
                 inscritos_actuales = len(df_registros[df_registros['curso_id'] == curso_actual['curso_id']])
                 cupos_disponibles = int(curso_actual['cupo_maximo']) - inscritos_actuales
@@ -543,10 +623,7 @@ try:
             # Inicializar comunas en la primera carga si no existen
             if 'comunas' not in st.session_state or not st.session_state.comunas:
                 # Cargar comunas de la primera región por defecto
-                for reg in comunas_regiones["regiones"]:
-                    if reg["region"] == regiones[0]:
-                        st.session_state.comunas = reg["comunas"]
-                        break
+                st.session_state.comunas = COMUNAS_POR_REGION[regiones[0]]
 
             region = st.selectbox("Región del participante (*)", regiones, key='region', on_change=update_comunas_state)
             comuna = st.selectbox("Comuna (*)", st.session_state.get('comunas', []), key='comuna')
@@ -585,17 +662,18 @@ try:
                         cupos_disponibles = int(curso_actual['cupo_maximo'])
 
                     # Normalizar RUT para comparación (formato estándar: 12345678-5)
-                    rut_normalizado = rut_chile.format_rut_without_dots(rut).upper()
+                    rut_normalizado = normalizar_rut(rut)
 
                     # Verificar si el usuario ya está inscrito en este curso
                     if not df_registros.empty:
-                        # Normalizar todos los RUTs en el dataframe para comparación
-                        df_registros['rut_normalizado'] = df_registros['rut'].apply(lambda x: rut_chile.format_rut_without_dots(str(x)).upper() if x else '')
+                        with perfil.fase("validación: duplicados"):
+                            # Normalizar todos los RUTs en el dataframe para comparación
+                            df_registros['rut_normalizado'] = normalizar_ruts(df_registros['rut'])
 
-                        usuario_ya_inscrito = df_registros[
-                            (df_registros['rut_normalizado'] == rut_normalizado) &
-                            (df_registros['curso_id'] == curso_actual['curso_id'])
-                        ]
+                            usuario_ya_inscrito = df_registros[
+                                (df_registros['rut_normalizado'] == rut_normalizado) &
+                                (df_registros['curso_id'] == curso_actual['curso_id'])
+                            ]
 
                         if not usuario_ya_inscrito.empty:
                             st.error("⚠️ Ya estás inscrito en este curso")
@@ -607,16 +685,16 @@ try:
                     elif not all([rut, nombres, apellido_paterno, nacionalidad, email,
                                  rut_empresa, razon_social, region, comuna, direccion]):
                         st.error("Complete todos los campos obligatorios")
-                    elif not _rut_valido(rut):
+                    elif not rut_valido(rut):
                         st.error("RUT personal inválido. Formato esperado: 12345678-9")
-                    elif not _rut_valido(rut_empresa):
+                    elif not rut_valido(rut_empresa):
                         st.error("RUT empresa inválido. Formato esperado: 12345678-9 (sin puntos, con guión)")
-                    elif '@' not in email or '.' not in email:
+                    elif not email_valido(email):
                         st.error("Correo electrónico inválido")
                     else:
                         # Normalizar RUTs al formato estándar: 12345678-5 (sin puntos, con guión)
-                        rut_limpio = rut_chile.format_rut_without_dots(rut).upper()
-                        rut_empresa_limpio = rut_chile.format_rut_without_dots(rut_empresa).upper()
+                        rut_limpio = normalizar_rut(rut)
+                        rut_empresa_limpio = normalizar_rut(rut_empresa)
 
                         # Preparar nuevo registro
                         nuevo_registro = {
@@ -638,7 +716,9 @@ try:
                         }
                         
                         # Guardar registro
-                        if guardar_registro(nuevo_registro):
+                        with perfil.fase("api: guardar inscripción"):
+                            guardado = guardar_registro(nuevo_registro)
+                        if guardado:
                             st.write("Enviando registro:", nuevo_registro)
                             st.success("✅ Registro guardado exitosamente")
                             st.balloons()
@@ -649,4 +729,6 @@ try:
         st.error(f"Error al cargar cursos: {str(e)}")
 
 except Exception as e:
-    st.error(f"Error en la aplicación: {str(e)}")
\ No newline at end of file
+    st.error(f"Error en la aplicación: {str(e)}")
+finally:
+    perfil.terminar_rerun(rerun_perfil)
\ No newline at end of file
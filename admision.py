@@ -0,0 +1,274 @@
+"""
+Control de Admisión para el Check-in de Participantes
+=====================================================
+
+Cuando todo un auditorio escanea el QR a la vez, cientos de sesiones de
+Streamlit llegan juntas al formulario de asistencia. Este módulo limita el
+trabajo que entra al servidor y ordena al resto en una fila justa.
+
+Características:
+- Token bucket por servidor (tasa sostenida + ráfaga)
+- Concurrencia acotada para el procesamiento de check-ins
+- Fila FIFO con posición visible ("estás en la fila, posición N")
+- Tickets abandonados (pestaña cerrada) expiran y no bloquean la fila
+- Prioridad admin: no pasa por el bucket ni por la fila y tiene cupos reservados
+- Envíos repetidos del mismo (curso_id, rut, sesion) colapsados: los simultáneos
+  esperan a una sola ejecución y los recientes devuelven el resultado anterior
+
+Uso:
+    from admision import ControlAdmision, ColapsadorEnvios
+
+    control = ControlAdmision(tasa=15, rafaga=30, max_concurrentes=8)
+    admitido, posicion = control.solicitar(ticket)
+    if admitido:
+        try:
+            procesar()
+        finally:
+            control.liberar()
+
+    recientes = ColapsadorEnvios(ttl=20)
+    resultado = recientes.ejecutar((curso_id, rut, sesion), lambda: procesar(...))
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class TokenBucket:
+    """
+    Token bucket thread-safe: 'tasa' tokens por segundo, hasta 'capacidad'.
+    """
+
+    def __init__(self, tasa, capacidad):
+        """
+        Args:
+            tasa: Tokens repuestos por segundo
+            capacidad: Máximo de tokens acumulables (tamaño de ráfaga)
+        """
+        self.tasa = tasa
+        self.capacidad = capacidad
+        self._tokens = float(capacidad)
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consumir(self, n=1):
+        """
+        Intenta consumir n tokens.
+
+        Returns:
+            bool: True si había tokens suficientes
+        """
+        with self._lock:
+            ahora = time.monotonic()
+            self._tokens = min(self.capacidad,
+                               self._tokens + (ahora - self._ultimo) * self.tasa)
+            self._ultimo = ahora
+            if self._tokens >= n:
+                self._tokens -= n
+                return True
+            return False
+
+
+class ControlAdmision:
+    """
+    Admisión de check-ins con token bucket, concurrencia acotada y fila FIFO.
+    """
+
+    def __init__(self, tasa=15, rafaga=30, max_concurrentes=8,
+                 reserva_admin=2, ttl_ticket=10):
+        """
+        Args:
+            tasa: Check-ins admitidos por segundo (sostenido)
+            rafaga: Check-ins admitidos de golpe con el bucket lleno
+            max_concurrentes: Check-ins de participantes procesándose a la vez
+            reserva_admin: Cupos extra de concurrencia solo para admins
+            ttl_ticket: Segundos sin reintentar tras los que un ticket sale de la fila
+        """
+        self.max_concurrentes = max_concurrentes
+        self.reserva_admin = reserva_admin
+        self.ttl_ticket = ttl_ticket
+        self._bucket = TokenBucket(tasa, rafaga)
+        self._fila = OrderedDict()  # ticket → último reintento (monotonic)
+        self._en_curso = 0
+        self._admitidos = 0
+        self._en_espera = 0
+        self._lock = threading.Lock()
+
+    def solicitar(self, ticket, admin=False):
+        """
+        Pide un cupo para procesar un check-in.
+
+        Un ticket no admitido queda en la fila; al reintentar con el mismo
+        ticket conserva su lugar. Solo se admite a los primeros de la fila
+        mientras haya cupos libres y tokens en el bucket.
+
+        Args:
+            ticket: Identificador estable de la sesión que pide (ej: uuid en session_state)
+            admin: True para solicitudes de administradores (prioridad)
+
+        Returns:
+            tuple: (bool, int) - (admitido, posición en la fila; 0 si admitido)
+        """
+        with self._lock:
+            if admin:
+                if self._en_curso < self.max_concurrentes + self.reserva_admin:
+                    self._admitir()
+                    return True, 0
+                return False, 1
+
+            ahora = time.monotonic()
+            self._purgar(ahora)
+            self._fila[ticket] = ahora
+
+            posicion = list(self._fila).index(ticket)
+            libres = self.max_concurrentes - self._en_curso
+            if posicion < libres and self._bucket.consumir():
+                del self._fila[ticket]
+                self._admitir()
+                return True, 0
+
+            self._en_espera += 1
+            return False, posicion + 1
+
+    def liberar(self):
+        """Devuelve el cupo de un check-in admitido (llamar en finally)."""
+        with self._lock:
+            self._en_curso = max(0, self._en_curso - 1)
+
+    def abandonar(self, ticket):
+        """Saca un ticket de la fila (ej: el participante canceló)."""
+        with self._lock:
+            self._fila.pop(ticket, None)
+
+    def get_estadisticas(self):
+        """
+        Obtiene estadísticas de admisión.
+
+        Returns:
+            dict: Estadísticas
+        """
+        with self._lock:
+            self._purgar(time.monotonic())
+            return {
+                'en_curso': self._en_curso,
+                'en_fila': len(self._fila),
+                'admitidos': self._admitidos,
+                'esperas': self._en_espera
+            }
+
+    def _admitir(self):
+        self._en_curso += 1
+        self._admitidos += 1
+
+    def _purgar(self, ahora):
+        """Elimina tickets que dejaron de reintentar (pestañas cerradas)."""
+        limite = ahora - self.ttl_ticket
+        vencidos = [t for t, visto in self._fila.items() if visto < limite]
+        for ticket in vencidos:
+            del self._fila[ticket]
+
+
+class _Envio:
+    """Ejecución en vuelo o reciente de un envío."""
+
+    def __init__(self):
+        self.listo = threading.Event()
+        self.resultado = None
+        self.error = None
+        self.terminado_en = None
+
+
+class ColapsadorEnvios:
+    """
+    Caché de corta duración de envíos en vuelo y recientes, por clave.
+
+    - Envíos idénticos simultáneos: solo el primero ejecuta, el resto espera
+      su resultado
+    - Envíos idénticos dentro del TTL: devuelven el resultado anterior sin ejecutar
+    - Si la ejecución falla con una excepción no se guarda (el próximo reintenta)
+    """
+
+    def __init__(self, ttl=20, espera_max=30):
+        """
+        Args:
+            ttl: Segundos que se reutiliza un resultado terminado
+            espera_max: Segundos máximos que un envío duplicado espera al original
+        """
+        self.ttl = ttl
+        self.espera_max = espera_max
+        self._envios = {}
+        self._colapsados = 0
+        self._lock = threading.Lock()
+
+    def reciente(self, clave):
+        """
+        Resultado de un envío terminado dentro del TTL.
+
+        Returns:
+            object | None: Resultado anterior o None si no hay uno vigente
+        """
+        with self._lock:
+            envio = self._envios.get(clave)
+            if envio is not None and self._vigente(envio, time.monotonic()) \
+                    and envio.listo.is_set():
+                self._colapsados += 1
+                return envio.resultado
+        return None
+
+    def ejecutar(self, clave, funcion):
+        """
+        Ejecuta funcion() una sola vez por clave dentro del TTL.
+
+        Args:
+            clave: Clave del envío (ej: (curso_id, rut, sesion))
+            funcion: Función sin argumentos que procesa el envío
+
+        Returns:
+            object: Resultado de funcion() (propio o de la ejecución colapsada)
+        """
+        with self._lock:
+            ahora = time.monotonic()
+            self._purgar(ahora)
+            envio = self._envios.get(clave)
+            propio = envio is None or not self._vigente(envio, ahora)
+            if propio:
+                envio = _Envio()
+                self._envios[clave] = envio
+            else:
+                self._colapsados += 1
+
+        if not propio:
+            if envio.listo.wait(self.espera_max) and envio.error is None:
+                return envio.resultado
+            return funcion()  # El original falló o tardó demasiado
+
+        try:
+            envio.resultado = funcion()
+        except Exception as e:
+            envio.error = e
+            with self._lock:
+                if self._envios.get(clave) is envio:
+                    del self._envios[clave]
+            raise
+        finally:
+            envio.terminado_en = time.monotonic()
+            envio.listo.set()
+        return envio.resultado
+
+    def get_estadisticas(self):
+        """
+        Returns:
+            dict: {'claves': int, 'colapsados': int}
+        """
+        with self._lock:
+            return {'claves': len(self._envios), 'colapsados': self._colapsados}
+
+    def _vigente(self, envio, ahora):
+        """En vuelo, o terminado hace menos de ttl segundos."""
+        return envio.terminado_en is None or ahora - envio.terminado_en < self.ttl
+
+    def _purgar(self, ahora):
+        vencidos = [c for c, e in self._envios.items() if not self._vigente(e, ahora)]
+        for clave in vencidos:
+            del self._envios[clave]
@@ -0,0 +1,464 @@
+"""
+Analítica de Asistencia entre Sesiones
+======================================
+
+Agregados materializados sobre asistencias_buffer y las inscripciones para
+ver la asistencia de todos los cursos a la vez, no solo un (curso, sesión).
+
+Características:
+- Tasa de asistencia por curso, sesión, región, rol y empresa (rut_empresa)
+- Retención sesión a sesión (de los presentes en la sesión N, cuántos vuelven en N+1)
+- Listas de inasistentes por curso y sesión
+- Agregados en tablas DuckDB actualizados con cada asistencia marcada
+  (suscripción al buffer), sin recorrer asistencias_buffer en cada lectura;
+  el check-in solo encola el cambio y un thread los aplica por lotes
+  (una lectura aplica antes lo que quede en cola)
+- Dimensiones (inscritos, rol, empresa, región) recalculadas solo cuando
+  cambia la revisión del snapshot de registros o de Config
+
+Uso:
+    from analitica import AnaliticaAsistencia
+
+    analitica = AnaliticaAsistencia(buffer)
+    analitica.actualizar_dimensiones(df_cursos, df_registros)
+
+    analitica.tasa_asistencia('region')
+    analitica.retencion()
+    analitica.inasistentes("RM-Mar26", 1)
+"""
+
+import logging
+import threading
+
+import pandas as pd
+
+from indices import CAMPOS_PARTICIPANTE
+from validacion import codificar_ruts
+
+# Dimensiones de la tasa de asistencia → columnas de agrupación
+DIMENSIONES = {
+    'curso': ['curso_id'],
+    'sesion': ['curso_id', 'sesion'],
+    'region': ['region'],
+    'rol': ['rol'],
+    'empresa': ['rut_empresa'],
+}
+
+_CAMPOS_DIMENSION = CAMPOS_PARTICIPANTE[1:] + ['rol', 'rut_empresa']
+
+# Sesiones que caben en la máscara de bits de mat_participante (INTEGER, 32 bits)
+SESION_MAX_MASCARA = 30
+
+logger = logging.getLogger(__name__)
+
+
+class AnaliticaAsistencia:
+    """
+    Agregados de asistencia materializados en la base DuckDB del buffer.
+
+    - mat_participante: (curso_id, rut_cod) → máscara de bits de sesiones presentes
+    - mat_curso_sesion: (curso_id, sesion) → presentes
+    - dim_inscritos: inscritos con su rol, empresa y región
+    """
+
+    def __init__(self, buffer):
+        """
+        Crea las tablas, las reconstruye desde el buffer y se suscribe a sus cambios.
+
+        Args:
+            buffer: AsistenciaBuffer cuyas asistencias se agregan
+        """
+        self.conn = buffer.conn.cursor()
+        self.version = 0
+        self._rev_dimensiones = None
+        self._resultados = {}
+        self._lock = threading.RLock()
+
+        # Cambios del buffer pendientes de aplicar (los encola _on_cambio)
+        self._cambios = []
+        self._reconstruir_pendiente = False
+        self._lock_cambios = threading.Lock()
+        self._hay_cambios = threading.Event()
+
+        self._init_tablas()
+        self.reconstruir()
+        buffer.suscribir(self._on_cambio)
+        threading.Thread(target=self._aplicador, daemon=True).start()
+
+    def _init_tablas(self):
+        """
+        Crea las tablas materializadas.
+
+        Se recrean en cada inicio (se reconstruyen de todos modos), así un
+        archivo con un esquema anterior no requiere migración.
+        """
+        self.conn.execute("""
+            CREATE OR REPLACE TABLE mat_participante (
+                curso_id VARCHAR NOT NULL,
+                rut_cod INTEGER NOT NULL,
+                mascara INTEGER NOT NULL,
+                PRIMARY KEY (curso_id, rut_cod)
+            )
+        """)
+        self.conn.execute("""
+            CREATE OR REPLACE TABLE mat_curso_sesion (
+                curso_id VARCHAR NOT NULL,
+                sesion INTEGER NOT NULL,
+                presentes INTEGER NOT NULL,
+                PRIMARY KEY (curso_id, sesion)
+            )
+        """)
+        columnas = ", ".join(f"{c} VARCHAR" for c in _CAMPOS_DIMENSION)
+        self.conn.execute(f"""
+            CREATE OR REPLACE TABLE dim_inscritos (
+                curso_id VARCHAR NOT NULL,
+                rut_cod INTEGER NOT NULL,
+                region VARCHAR,
+                {columnas}
+            )
+        """)
+
+    # ==================== MANTENIMIENTO ====================
+
+    def reconstruir(self):
+        """Recalcula los agregados completos desde asistencias_buffer."""
+        with self._lock:
+            self.conn.execute("BEGIN TRANSACTION")
+            try:
+                self.conn.execute("DELETE FROM mat_participante")
+                self.conn.execute(f"""
+                    INSERT INTO mat_participante
+                    SELECT curso_id, rut_cod,
+                           CAST(bit_or(1 << (sesion - 1)) AS INTEGER)
+                    FROM asistencias_vista
+                    WHERE estado = 'presente' AND sesion BETWEEN 1 AND {SESION_MAX_MASCARA}
+                    GROUP BY 1, 2
+                """)
+                self.conn.execute("DELETE FROM mat_curso_sesion")
+                self.conn.execute(f"""
+                    INSERT INTO mat_curso_sesion
+                    SELECT curso_id, sesion, count(DISTINCT rut_cod)
+                    FROM asistencias_vista
+                    WHERE estado = 'presente' AND sesion BETWEEN 1 AND {SESION_MAX_MASCARA}
+                    GROUP BY 1, 2
+                """)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            self._invalidar()
+
+    def registrar(self, curso_id, rut_cod, sesion, estado='presente'):
+        """
+        Aplica una asistencia marcada a los agregados (ver registrar_lote).
+
+        Args:
+            curso_id: ID del curso
+            rut_cod: RUT codificado (validacion.codificar_rut)
+            sesion: Número de sesión
+            estado: Estado registrado (solo 'presente' cuenta como asistencia)
+        """
+        self.registrar_lote([(curso_id, rut_cod, sesion, estado)])
+
+    def registrar_lote(self, cambios):
+        """
+        Aplica asistencias marcadas a los agregados en una sola transacción,
+        sin recorrer el buffer. Sesiones fuera de 1..SESION_MAX_MASCARA se
+        omiten (reconstruir() también las omite).
+
+        Args:
+            cambios: Lista de tuplas (curso_id, rut_cod, sesion, estado), en orden
+        """
+        cambios = [(str(c), int(r), int(s), e) for c, r, s, e in cambios
+                   if 1 <= int(s) <= SESION_MAX_MASCARA]
+        if not cambios:
+            return
+
+        with self._lock:
+            claves = pd.DataFrame(sorted({(c, r) for c, r, _, _ in cambios}),
+                                  columns=['curso_id', 'rut_cod'])
+            self.conn.register('_claves', claves)
+            try:
+                antes = {(c, r): m for c, r, m in self.conn.execute("""
+                    SELECT p.curso_id, p.rut_cod, p.mascara
+                    FROM mat_participante p
+                    JOIN _claves k ON k.curso_id = p.curso_id AND k.rut_cod = p.rut_cod
+                """).fetchall()}
+            finally:
+                self.conn.unregister('_claves')
+
+            # Se pliegan los cambios en memoria: máscara final y delta de presentes
+            mascaras = dict(antes)
+            deltas = {}
+            for curso_id, rut_cod, sesion, estado in cambios:
+                bit = 1 << (sesion - 1)
+                previa = mascaras.get((curso_id, rut_cod), 0)
+                nueva = previa | bit if estado == 'presente' else previa & ~bit
+                if nueva != previa:
+                    mascaras[(curso_id, rut_cod)] = nueva
+                    deltas[(curso_id, sesion)] = deltas.get((curso_id, sesion), 0) + \
+                        (1 if nueva & bit else -1)
+
+            df_mascaras = pd.DataFrame(
+                [(c, r, m) for (c, r), m in mascaras.items() if antes.get((c, r), 0) != m],
+                columns=['curso_id', 'rut_cod', 'mascara'])
+            df_deltas = pd.DataFrame(
+                [(c, s, d) for (c, s), d in deltas.items() if d],
+                columns=['curso_id', 'sesion', 'presentes'])
+            if df_mascaras.empty:
+                return
+
+            self.conn.register('_mascaras', df_mascaras)
+            self.conn.register('_deltas', df_deltas)
+            self.conn.execute("BEGIN TRANSACTION")
+            try:
+                self.conn.execute("""
+                    INSERT INTO mat_participante SELECT * FROM _mascaras
+                    ON CONFLICT (curso_id, rut_cod) DO UPDATE SET mascara = EXCLUDED.mascara
+                """)
+                self.conn.execute("""
+                    INSERT INTO mat_curso_sesion SELECT * FROM _deltas
+                    ON CONFLICT (curso_id, sesion) DO UPDATE
+                    SET presentes = mat_curso_sesion.presentes + EXCLUDED.presentes
+                """)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            finally:
+                self.conn.unregister('_mascaras')
+                self.conn.unregister('_deltas')
+            self._invalidar()
+
+    def actualizar_dimensiones(self, df_cursos, df_registros):
+        """
+        Recalcula dim_inscritos si cambió la revisión de Config o de registros.
+
+        Args:
+            df_cursos: DataFrame con configuración de cursos (curso_id, region)
+            df_registros: DataFrame con registros de inscripción
+
+        Returns:
+            bool: True si se recalcularon las dimensiones
+        """
+        revision = (df_cursos.attrs.get('revision'), df_registros.attrs.get('revision'))
+        if revision == self._rev_dimensiones and None not in revision:
+            return False
+
+        if df_registros.empty or 'curso_id' not in df_registros.columns \
+                or 'rut' not in df_registros.columns:
+            df = pd.DataFrame(columns=['curso_id', 'rut_cod', 'region'] + _CAMPOS_DIMENSION)
+        else:
+            df = df_registros.reindex(columns=['curso_id', 'rut'] + _CAMPOS_DIMENSION)
+            df = df.astype('string').fillna('')
+            df['curso_id'] = df['curso_id'].str.strip()
+            df.insert(1, 'rut_cod', codificar_ruts(df.pop('rut')))
+            df = df.dropna(subset=['rut_cod'])
+            df = df.drop_duplicates(subset=['curso_id', 'rut_cod'], keep='first')
+            regiones = {}
+            if not df_cursos.empty and 'region' in df_cursos.columns:
+                regiones = dict(zip(df_cursos['curso_id'].astype(str), df_cursos['region']))
+            df.insert(2, 'region', df['curso_id'].map(regiones).fillna(''))
+
+        with self._lock:
+            self.conn.register('_dim_inscritos', df)
+            try:
+                self.conn.execute("BEGIN TRANSACTION")
+                self.conn.execute("DELETE FROM dim_inscritos")
+                self.conn.execute("""
+                    INSERT INTO dim_inscritos BY NAME SELECT * FROM _dim_inscritos
+                """)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            finally:
+                self.conn.unregister('_dim_inscritos')
+            self._rev_dimensiones = revision
+            self._invalidar()
+        return True
+
+    def _on_cambio(self, cambio):
+        """
+        Observador del buffer: encola una asistencia puntual, o None para
+        reconstruir. O(1); lo aplica el thread de _aplicador.
+        """
+        with self._lock_cambios:
+            if cambio is None:
+                self._reconstruir_pendiente = True
+                self._cambios = []
+            elif not self._reconstruir_pendiente:
+                self._cambios.append(cambio)
+        self._hay_cambios.set()
+
+    def _aplicador(self):
+        """Thread que aplica por lotes los cambios encolados."""
+        while True:
+            self._hay_cambios.wait()
+            self._hay_cambios.clear()
+            self._ponerse_al_dia()
+
+    def _ponerse_al_dia(self):
+        """
+        Aplica lo encolado sin propagar errores: se registran en el log y la
+        lectura sirve los agregados vigentes (se reconstruyen en el próximo intento).
+        """
+        try:
+            self._aplicar_pendientes()
+        except Exception:
+            logger.exception("Error al aplicar cambios a los agregados de asistencia")
+
+    def _aplicar_pendientes(self):
+        """
+        Aplica los cambios encolados. Si fallan, se marca una reconstrucción
+        para el próximo intento (los agregados no quedan a medias).
+        """
+        with self._lock:
+            with self._lock_cambios:
+                cambios, self._cambios = self._cambios, []
+                reconstruir, self._reconstruir_pendiente = self._reconstruir_pendiente, False
+            if not cambios and not reconstruir:
+                return
+            try:
+                if reconstruir:
+                    self.reconstruir()
+                else:
+                    self.registrar_lote(cambios)
+            except Exception:
+                with self._lock_cambios:
+                    self._reconstruir_pendiente = True
+                    self._cambios = []
+                raise
+
+    def _invalidar(self):
+        self.version += 1
+        self._resultados.clear()
+
+    def _consultar(self, clave, sql, params=None):
+        """Ejecuta una consulta sobre los agregados, memorizada hasta el próximo cambio."""
+        with self._lock:
+            self._ponerse_al_dia()
+            if clave not in self._resultados:
+                self._resultados[clave] = self.conn.execute(sql, params or []).df()
+            return self._resultados[clave]
+
+    # ==================== CONSULTAS ====================
+
+    def tasa_asistencia(self, por='curso'):
+        """
+        Tasa de asistencia agrupada por una dimensión.
+
+        Cada inscrito cuenta una vez por sesión realizada de su curso (sesión con
+        al menos un presente); la tasa es asistencias / asistencias esperadas.
+
+        Args:
+            por: 'curso', 'sesion', 'region', 'rol' o 'empresa'
+
+        Returns:
+            pd.DataFrame: Columnas de agrupación + esperadas, asistencias, tasa (%)
+        """
+        if por not in DIMENSIONES:
+            raise ValueError(f"Dimensión no soportada: {por}")
+        grupo = ", ".join(DIMENSIONES[por])
+        return self._consultar(('tasa', por), f"""
+            WITH esperadas AS (
+                SELECT i.*, s.sesion,
+                       coalesce((p.mascara >> (s.sesion - 1)) & 1, 0) AS asistio
+                FROM dim_inscritos i
+                JOIN mat_curso_sesion s ON s.curso_id = i.curso_id AND s.presentes > 0
+                LEFT JOIN mat_participante p ON p.curso_id = i.curso_id AND p.rut_cod = i.rut_cod
+            )
+            SELECT {grupo},
+                   count(*) AS esperadas,
+                   CAST(sum(asistio) AS INTEGER) AS asistencias,
+                   round(100.0 * sum(asistio) / count(*), 1) AS tasa
+            FROM esperadas
+            GROUP BY {grupo}
+            ORDER BY {grupo}
+        """)
+
+    def retencion(self, curso_id=None):
+        """
+        Retención entre sesiones consecutivas realizadas.
+
+        Args:
+            curso_id: ID del curso (None = todos)
+
+        Returns:
+            pd.DataFrame: curso_id, desde, hasta, presentes, continuan, retencion (%)
+        """
+        filtro = "WHERE s.curso_id = ?" if curso_id else ""
+        return self._consultar(('retencion', curso_id), f"""
+            SELECT s.curso_id, s.sesion AS desde, s.sesion + 1 AS hasta,
+                   count(*) AS presentes,
+                   count(*) FILTER (WHERE (p.mascara >> s.sesion) & 1 = 1) AS continuan,
+                   round(100.0 * continuan / count(*), 1) AS retencion
+            FROM mat_curso_sesion s
+            JOIN mat_curso_sesion sig
+              ON sig.curso_id = s.curso_id AND sig.sesion = s.sesion + 1 AND sig.presentes > 0
+            JOIN mat_participante p
+              ON p.curso_id = s.curso_id AND (p.mascara >> (s.sesion - 1)) & 1 = 1
+            {filtro}
+            GROUP BY 1, 2, 3
+            ORDER BY 1, 2
+        """, [str(curso_id)] if curso_id else None)
+
+    def inasistentes(self, curso_id, sesion):
+        """
+        Inscritos de un curso sin asistencia presente en la sesión.
+
+        Args:
+            curso_id: ID del curso
+            sesion: Número de sesión
+
+        Returns:
+            pd.DataFrame: Datos de los inscritos ausentes
+        """
+        columnas = ", ".join(f"i.{c}" for c in _CAMPOS_DIMENSION)
+        return self._consultar(('inasistentes', str(curso_id), int(sesion)), f"""
+            SELECT rut_texto(i.rut_cod) AS rut, {columnas}
+            FROM dim_inscritos i
+            LEFT JOIN mat_participante p ON p.curso_id = i.curso_id AND p.rut_cod = i.rut_cod
+            WHERE i.curso_id = ?
+              AND coalesce((p.mascara >> (? - 1)) & 1, 0) = 0
+            ORDER BY i.apellido_paterno, i.nombres
+        """, [str(curso_id), int(sesion)])
+
+    def contadores(self, curso_id, sesion):
+        """
+        Contadores de una sesión leídos de los agregados (sin recorrer el buffer).
+
+        Args:
+            curso_id: ID del curso
+            sesion: Número de sesión
+
+        Returns:
+            dict: {'presentes': int, 'inscritos': int}
+        """
+        with self._lock:
+            self._ponerse_al_dia()
+            presentes, inscritos = self.conn.execute("""
+                SELECT (SELECT coalesce(max(presentes), 0) FROM mat_curso_sesion
+                        WHERE curso_id = $curso AND sesion = $sesion),
+                       (SELECT count(*) FROM dim_inscritos WHERE curso_id = $curso)
+            """, {'curso': str(curso_id), 'sesion': int(sesion)}).fetchone()
+        return {'presentes': presentes, 'inscritos': inscritos}
+
+    def get_estadisticas(self):
+        """
+        Obtiene estadísticas de los agregados.
+
+        Returns:
+            dict: Estadísticas
+        """
+        with self._lock:
+            self._ponerse_al_dia()
+            participantes, inscritos = self.conn.execute("""
+                SELECT (SELECT count(*) FROM mat_participante),
+                       (SELECT count(*) FROM dim_inscritos)
+            """).fetchone()
+        return {
+            'participantes': participantes,
+            'inscritos': inscritos,
+            'version': self.version
+        }
@@ -0,0 +1,162 @@
+"""
+Consultas de Reportes sobre DuckDB
+==================================
+
+Resuelve el cruce asistencias × inscripciones dentro de DuckDB en lugar de
+normalizar y filtrar columnas con pandas en cada rerun.
+
+Características:
+- Registros y asistencias registrados como relaciones DuckDB (sin copiar)
+- Normalización de curso_id / RUT y semi-join en una sola consulta SQL
+- La misma consulta alimenta la tabla en pantalla, el CSV (COPY ... TO)
+  y los generadores Excel
+- Cursor propio por motor: las vistas temporales no se cruzan entre sesiones
+  (close() lo libera al reemplazar el motor)
+
+Uso:
+    from consultas import MotorReportes
+
+    motor = MotorReportes(buffer.conn, df_registros)          # asistencias del buffer
+    motor = MotorReportes(buffer.conn, df_registros, df_asis)  # asistencias de Sheets
+
+    df_asistentes = motor.asistentes("RM-Mar26", 1).df()
+    csv_bytes = motor.csv_asistencias("RM-Mar26", 1)
+"""
+
+import os
+import tempfile
+
+import pandas as pd
+
+# Columnas del buffer que se muestran en la pestaña "Ver Asistencias"
+COLUMNAS_VISTA = ['rut', 'estado', 'fecha_registro', 'sincronizado', 'intentos_sync']
+
+
+def _tiene_claves(df, *extra):
+    """True si el DataFrame trae las columnas necesarias para el cruce."""
+    return all(c in df.columns for c in ('curso_id', 'rut') + extra)
+
+
+class MotorReportes:
+    """
+    Vistas normalizadas de registros y asistencias sobre un cursor DuckDB.
+    """
+
+    def __init__(self, conn, df_registros, df_asistencias=None):
+        """
+        Registra las fuentes y crea las vistas normalizadas.
+
+        Args:
+            conn: Conexión DuckDB del buffer (contiene asistencias_buffer)
+            df_registros: DataFrame con registros de inscripción (curso_id, rut, ...)
+            df_asistencias: Asistencias de Sheets; None = usar asistencias_buffer
+        """
+        self.conn = conn.cursor()
+        self.tiene_registros = _tiene_claves(df_registros)
+
+        if self.tiene_registros:
+            self.conn.register('registros', df_registros)
+            self.conn.execute("""
+                CREATE OR REPLACE TEMP VIEW v_registros AS
+                SELECT *,
+                       CAST(curso_id AS VARCHAR) AS _curso,
+                       rut_codigo(rut) AS _rut
+                FROM registros
+            """)
+
+        self.fuente = 'asistencias_buffer'
+        if df_asistencias is not None:
+            self.fuente = 'asistencias_sheets'
+            if not _tiene_claves(df_asistencias, 'sesion'):
+                df_asistencias = pd.DataFrame(columns=['curso_id', 'rut', 'sesion'], dtype='string')
+            self.conn.register('asistencias_sheets', df_asistencias)
+
+        # En el buffer el RUT ya está codificado; el de Sheets se codifica al leer
+        if self.fuente == 'asistencias_buffer':
+            tabla, rut = 'asistencias_vista', 'rut_cod'
+        else:
+            tabla, rut = 'asistencias_sheets', 'rut_codigo(rut)'
+        self.conn.execute(f"""
+            CREATE OR REPLACE TEMP VIEW v_asistencias AS
+            SELECT CAST(curso_id AS VARCHAR) AS _curso,
+                   {rut} AS _rut,
+                   CAST(sesion AS VARCHAR) AS _sesion
+            FROM {tabla}
+        """)
+
+    def asistentes(self, curso_id, sesion):
+        """
+        Inscritos del curso que tienen asistencia en la sesión.
+
+        Equivale al filtro anterior registros[rut_norm.isin(ruts_asistencia)]:
+        una fila por inscripción, en el orden de la hoja de registros.
+
+        Args:
+            curso_id: ID del curso
+            sesion: Número de sesión
+
+        Returns:
+            duckdb.DuckDBPyRelation: Filas de registros (usar .df() para pandas)
+        """
+        if not self.tiene_registros:
+            raise ValueError("No hay registros de inscripción para cruzar")
+        return self.conn.sql("""
+            SELECT * EXCLUDE (_curso, _rut)
+            FROM v_registros
+            WHERE _curso = $curso
+              AND _rut IN (SELECT _rut FROM v_asistencias
+                           WHERE _curso = $curso AND _sesion = $sesion)
+        """, params={'curso': str(curso_id), 'sesion': str(sesion)})
+
+    def asistencias(self, curso_id, sesion, columnas=None):
+        """
+        Filas del buffer de un curso y sesión (RUT como texto, vía asistencias_vista).
+
+        Args:
+            curso_id: ID del curso
+            sesion: Número de sesión
+            columnas: Columnas a proyectar (None = todas)
+
+        Returns:
+            duckdb.DuckDBPyRelation: Asistencias ordenadas por fecha de registro
+        """
+        seleccion = ", ".join(columnas) if columnas else "*"
+        return self.conn.sql(f"""
+            SELECT {seleccion}
+            FROM asistencias_vista
+            WHERE curso_id = $curso AND sesion = $sesion
+            ORDER BY fecha_registro DESC
+        """, params={'curso': str(curso_id), 'sesion': int(sesion)})
+
+    def resumen(self, curso_id, sesion):
+        """
+        Conteos de sincronización de un curso y sesión.
+
+        Returns:
+            tuple: (total, sincronizadas)
+        """
+        return self.conn.execute("""
+            SELECT count(*), count(*) FILTER (WHERE sincronizado)
+            FROM asistencias_vista
+            WHERE curso_id = ? AND sesion = ?
+        """, [str(curso_id), int(sesion)]).fetchone()
+
+    def csv_asistencias(self, curso_id, sesion):
+        """
+        Exporta las asistencias del buffer a CSV (COPY ... TO vía write_csv).
+
+        Returns:
+            bytes: Contenido CSV con encabezado (UTF-8)
+        """
+        fd, ruta = tempfile.mkstemp(suffix='.csv')
+        os.close(fd)
+        try:
+            self.asistencias(curso_id, sesion).write_csv(ruta, header=True)
+            with open(ruta, 'rb') as f:
+                return f.read()
+        finally:
+            os.unlink(ruta)
+
+    def close(self):
+        """Cierra el cursor del motor (las vistas temporales se descartan)."""
+        self.conn.close()
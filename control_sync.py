@@ -0,0 +1,146 @@
+"""
+Control Adaptativo del Tamaño de Lote de Sincronización (AIMD)
+==============================================================
+
+El Apps Script no responde siempre igual: con la hoja chica y sin otros
+usuarios acepta lotes grandes y varios envíos a la vez; en plena jornada
+devuelve "sistema ocupado", timeouts o errores de cuota. En lugar de un
+tamaño de lote fijo, este módulo ajusta lote y concurrencia según la
+latencia y los errores observados en cada envío.
+
+Características:
+- Aumento aditivo: cada ronda sana (sin error, bajo la latencia objetivo y
+  con los lotes llenos) suma 'paso' filas al lote; varias rondas sanas
+  seguidas suman un envío concurrente, hasta concurrencia_max (1 por
+  defecto: addAsistencias toma el LockService del script y serializa los
+  envíos, así que enviar en paralelo solo agrega esperas y "ocupado")
+- Disminución multiplicativa: "ocupado", timeout o cuota reducen el lote a
+  la mitad y la concurrencia a uno; una ronda lenta (sobre la latencia
+  objetivo) solo reduce el lote
+- Otros errores (API Key, datos) no mueven el ajuste
+- Latencia media móvil (EWMA) para mostrar en el panel
+- Estado serializable (a_dict / desde_dict) para recordarlo entre reinicios
+
+Uso:
+    from control_sync import ControlLotesAIMD
+
+    control = ControlLotesAIMD.desde_dict(estado_guardado)
+    lote, concurrencia = control.lote, control.concurrencia
+    control.registrar(latencia=2.3, clase_error=None)
+    estado_guardado = control.a_dict()
+"""
+
+import threading
+
+# Clases de error (db_buffer.clasificar_error) que indican saturación del Apps Script
+ERRORES_SATURACION = ('ocupado', 'timeout', 'cuota')
+
+# Envíos en paralelo permitidos por defecto. addAsistencias escribe bajo
+# LockService.getScriptLock(), así que dos envíos simultáneos se atienden uno
+# tras otro y el segundo consume su espera de tryLock. Subirlo solo tiene
+# sentido con un Apps Script cuyo camino de escritura no tome el lock.
+CONCURRENCIA_MAX = 1
+
+
+class ControlLotesAIMD:
+    """
+    Tamaño de lote y concurrencia de la sincronización con ajuste AIMD thread-safe.
+    """
+
+    def __init__(self, lote=100, concurrencia=1, lote_min=10, lote_max=1000,
+                 concurrencia_max=CONCURRENCIA_MAX, paso=50, factor=0.5, latencia_objetivo=8.0,
+                 rondas_para_concurrencia=5):
+        """
+        Args:
+            lote: Tamaño de lote inicial (filas por envío)
+            concurrencia: Envíos en paralelo iniciales
+            lote_min: Tamaño mínimo de lote
+            lote_max: Tamaño máximo de lote
+            concurrencia_max: Máximo de envíos en paralelo (ver CONCURRENCIA_MAX)
+            paso: Filas que se suman al lote por ronda sana
+            factor: Multiplicador del lote ante saturación (0-1)
+            latencia_objetivo: Segundos por envío sobre los que se considera lento
+            rondas_para_concurrencia: Rondas sanas seguidas para sumar concurrencia
+        """
+        self.lote_min = lote_min
+        self.lote_max = lote_max
+        self.concurrencia_max = concurrencia_max
+        self.paso = paso
+        self.factor = factor
+        self.latencia_objetivo = latencia_objetivo
+        self.rondas_para_concurrencia = rondas_para_concurrencia
+
+        self.lote = min(max(int(lote), lote_min), lote_max)
+        self.concurrencia = min(max(int(concurrencia), 1), concurrencia_max)
+        self.latencia_media = None
+        self.ultimo_ajuste = None  # 'aumento', 'lento', 'saturacion' o None
+        self._rondas_sanas = 0
+        self._lock = threading.Lock()
+
+    def registrar(self, latencia, clase_error=None, lleno=True):
+        """
+        Ajusta lote y concurrencia con el resultado de una ronda de envíos.
+
+        Args:
+            latencia: Segundos que tardó el envío más lento (incluidos reintentos)
+            clase_error: Clase del error (clasificar_error) o None si fue exitoso
+            lleno: False si había menos pendientes que lote × concurrencia; una
+                ronda así no demuestra que un lote mayor sea sano y no aumenta
+        """
+        with self._lock:
+            self.latencia_media = latencia if self.latencia_media is None \
+                else 0.8 * self.latencia_media + 0.2 * latencia
+
+            if clase_error in ERRORES_SATURACION:
+                self.lote = max(self.lote_min, int(self.lote * self.factor))
+                self.concurrencia = 1
+                self._rondas_sanas = 0
+                self.ultimo_ajuste = 'saturacion'
+            elif clase_error is not None or not lleno:
+                return
+            elif latencia > self.latencia_objetivo:
+                self.lote = max(self.lote_min, int(self.lote * self.factor))
+                self._rondas_sanas = 0
+                self.ultimo_ajuste = 'lento'
+            else:
+                self.lote = min(self.lote_max, self.lote + self.paso)
+                self._rondas_sanas += 1
+                if self._rondas_sanas >= self.rondas_para_concurrencia:
+                    self.concurrencia = min(self.concurrencia_max, self.concurrencia + 1)
+                    self._rondas_sanas = 0
+                self.ultimo_ajuste = 'aumento'
+
+    def a_dict(self):
+        """
+        Returns:
+            dict: lote, concurrencia, latencia_media y ultimo_ajuste (serializable a JSON)
+        """
+        with self._lock:
+            return {
+                'lote': self.lote,
+                'concurrencia': self.concurrencia,
+                'latencia_media': self.latencia_media,
+                'ultimo_ajuste': self.ultimo_ajuste
+            }
+
+    @classmethod
+    def desde_dict(cls, estado=None, **kwargs):
+        """
+        Crea un control con los valores guardados por a_dict.
+
+        Args:
+            estado: dict de a_dict (None = valores iniciales)
+            **kwargs: Parámetros del constructor
+
+        Returns:
+            ControlLotesAIMD: Control con el lote y la concurrencia guardados
+        """
+        estado = estado or {}
+        if 'lote' in estado:
+            kwargs['lote'] = estado['lote']
+        if 'concurrencia' in estado:
+            kwargs['concurrencia'] = estado['concurrencia']
+        control = cls(**kwargs)
+        control.latencia_media = estado.get('latencia_media')
+        control.ultimo_ajuste = estado.get('ultimo_ajuste')
+        return control
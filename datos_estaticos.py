@@ -0,0 +1,61 @@
+"""
+Datos Estáticos de Regiones y Comunas
+=====================================
+
+Streamlit vuelve a ejecutar el script completo en cada interacción. Los
+datos que no cambian (regiones, comunas, códigos de región) se cargan una
+sola vez por proceso al importar este módulo y quedan como mapas de acceso
+directo, en lugar de releer el JSON y recorrer la lista en cada rerun.
+
+Características:
+- comunas-regiones.json leído una vez por proceso (ruta relativa al módulo)
+- Lista de regiones en el orden del archivo
+- Región → comunas y región → código corto en dicts (búsqueda O(1))
+
+Uso:
+    from datos_estaticos import REGIONES, COMUNAS_POR_REGION, CODIGO_REGION
+
+    comunas = COMUNAS_POR_REGION.get(region, [])
+    codigo = CODIGO_REGION.get(region, 'OTR')
+"""
+
+import json
+from pathlib import Path
+
+COMUNAS_REGIONES_PATH = Path(__file__).with_name("comunas-regiones.json")
+
+# Códigos cortos para el curso_id (CódigoRegión-MesAño)
+CODIGO_REGION = {
+    "Región de Arica y Parinacota": "ARI",
+    "Región de Tarapacá": "TAR",
+    "Región de Antofagasta": "ANT",
+    "Región de Atacama": "ATA",
+    "Región de Coquimbo": "COQ",
+    "Región de Valparaíso": "VAL",
+    "Región Metropolitana de Santiago": "RM",
+    "Región del Libertador Gral. Bernardo O'Higgins": "OHI",
+    "Región del Maule": "MAU",
+    "Región de Ñuble": "ÑUB",
+    "Región del Biobío": "BIO",
+    "Región de la Araucanía": "ARA",
+    "Región de Los Ríos": "RIO",
+    "Región de Los Lagos": "LAG",
+    "Región Aysén del Gral. Carlos Ibáñez del Campo": "AYS",
+    "Región de Magallanes y de la Antártica Chilena": "MAG"
+}
+
+
+def _cargar_comunas_regiones(path=COMUNAS_REGIONES_PATH):
+    """
+    Lee el JSON de regiones y comunas.
+
+    Returns:
+        dict: región → lista de comunas, en el orden del archivo
+    """
+    with open(path, "r", encoding='utf-8') as file:
+        datos = json.load(file)
+    return {reg["region"]: reg["comunas"] for reg in datos["regiones"]}
+
+
+COMUNAS_POR_REGION = _cargar_comunas_regiones()
+REGIONES = list(COMUNAS_POR_REGION)
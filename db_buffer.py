@@ -12,6 +12,20 @@ Características:
 - Manejo de 1000+ usuarios simultáneos
 - Persistencia en archivo para recuperación
 - Batch uploads a Google Sheets
+- Esquema compacto: id entero, dimensión cursos (curso_key), RUT como
+  entero (rut_cod) y ENUMs para estado / metodo; curso_id y RUT como
+  texto solo en la vista asistencias_vista y al enviar a Sheets
+- Cola de fallidas (dead-letter): tras MAX_INTENTOS_SYNC intentos la fila
+  sale de los pendientes y su payload queda en asistencias_fallidas,
+  agrupable por clase de error y reenviable en lote
+- Reconciliación por checksums: compara conteo y hash por (curso_id, sesion)
+  con la hoja Asistencias y descarga solo los buckets que difieren
+- Diario append-only (diario.py): los check-ins se escriben en JSONL con
+  fsync por grupo y se aplican a asistencias_buffer en grupos; tras una
+  caída se reproduce lo posterior al checkpoint y se puede reconstruir el
+  buffer a un punto en el tiempo
+- Lote y concurrencia de sincronización adaptativos (control_sync.py, AIMD)
+  según latencia y errores del Apps Script, recordados entre reinicios
 
 Uso:
     from db_buffer import AsistenciaBuffer
@@ -19,17 +33,104 @@ Uso:
     buffer = AsistenciaBuffer()
     buffer.marcar_asistencia(curso_id="RM-Mar26", rut="12345678-9", sesion=1)
     buffer.sincronizar()  # Forzar sync a Google Sheets
+    buffer.reenviar_fallidas()  # Reintentar la cola de fallidas
+    buffer.reconciliar()  # Corregir diferencias con Sheets
 """
 
 import duckdb
 import streamlit as st
 import pandas as pd
 import requests
+import json
+import logging
+import random
 import time
 from datetime import datetime
 from pathlib import Path
 import threading
 import atexit
+from concurrent.futures import ThreadPoolExecutor
+
+from sheets_api import iter_paginas, descargar_checksums, descargar_dataframe
+from validacion import (normalizar_ruts, ruts_validos, codificar_rut, codificar_ruts,
+                        decodificar_rut, crear_macros_sql)
+from diario import DiarioAsistencias
+from control_sync import ControlLotesAIMD, ERRORES_SATURACION
+
+logger = logging.getLogger(__name__)
+
+
+# Valores de los ENUM; 'otro' recibe métodos desconocidos de archivos antiguos
+ESTADOS = ('presente', 'ausente', 'justificado')
+METODOS = ('streamlit', 'streamlit_buffer', 'admin_manual', 'admin_lote',
+           'sheets_hydration', 'otro')
+
+# Errores al aplicar una entrada del diario que se deben a la entrada misma
+# (fuera de rango, tipo inválido): la entrada pasa a cuarentena
+_ERRORES_DATOS_DIARIO = (ValueError, KeyError, TypeError, duckdb.DataError,
+                         duckdb.IntegrityError)
+
+# Hash de un RUT para los checksums (igual al de getChecksumsAsistencias del
+# Apps Script: primeros 4 bytes del MD5); el de un bucket es la suma mod 2^32
+_HASH_RUT = "('0x' || left(md5({rut}), 8))::UBIGINT"
+
+# Intentos de sincronización antes de pasar a la cola de fallidas
+MAX_INTENTOS_SYNC = 5
+
+# Mayor número de sesión que admite el esquema (columna sesion TINYINT)
+SESION_MAX = 127
+
+# Asistencias con claves compactas: id entero, curso como clave de la
+# dimensión cursos, RUT codificado (validacion.codificar_rut) y ENUMs.
+# sincronizado: true = en Sheets, false = pendiente, NULL = en la cola de fallidas.
+# lsn: entrada del diario que escribió la fila por última vez
+_DDL_ASISTENCIAS = """
+    CREATE TABLE IF NOT EXISTS {tabla} (
+        id BIGINT PRIMARY KEY DEFAULT nextval('seq_id_asistencias'),
+        curso_key INTEGER NOT NULL,
+        rut_cod INTEGER NOT NULL,
+        sesion TINYINT NOT NULL,
+        fecha_registro TIMESTAMP NOT NULL,
+        estado estado_asistencia DEFAULT 'presente',
+        metodo metodo_registro DEFAULT 'streamlit',
+        sincronizado BOOLEAN DEFAULT false,
+        intentos_sync TINYINT DEFAULT 0,
+        ultimo_error VARCHAR,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        seq BIGINT DEFAULT nextval('seq_asistencias'),
+        lsn BIGINT,
+        UNIQUE(curso_key, rut_cod, sesion)
+    )
+"""
+
+
+def clasificar_error(mensaje):
+    """
+    Clase de un error de sincronización, para agrupar la cola de fallidas.
+
+    Args:
+        mensaje: Texto del error (respuesta del Apps Script o excepción)
+
+    Returns:
+        str: 'timeout', 'ocupado', 'cuota', 'conexion', 'respuesta_invalida',
+        'accion_no_valida', 'api' o 'desconocido'
+    """
+    texto = (mensaje or '').lower()
+    if not texto or texto == 'error desconocido':
+        return 'desconocido'
+    if 'timed out' in texto or 'timeout' in texto:
+        return 'timeout'
+    if 'ocupado' in texto or 'busy' in texto:
+        return 'ocupado'
+    if 'quota' in texto or 'cuota' in texto or 'rate limit' in texto or '429' in texto:
+        return 'cuota'
+    if 'connection' in texto or 'max retries' in texto or 'name resolution' in texto:
+        return 'conexion'
+    if 'expecting value' in texto or 'json' in texto:
+        return 'respuesta_invalida'
+    if 'acción no válida' in texto:
+        return 'accion_no_valida'
+    return 'api'
 
 
 class AsistenciaBuffer:
@@ -42,7 +143,8 @@ class AsistenciaBuffer:
                  db_path="asistencias_buffer.duckdb",
                  api_url=None,
                  api_key=None,
-                 auto_sync_interval=60):
+                 auto_sync_interval=60,
+                 diario_dir=None):
         """
         Inicializa el buffer de asistencias.
 
@@ -51,20 +153,47 @@ class AsistenciaBuffer:
             api_url: URL del Apps Script API
             api_key: Key del API
             auto_sync_interval: Intervalo de sincronización en segundos (0 = manual)
+            diario_dir: Carpeta del diario de check-ins (default: <db>_diario
+                junto al archivo DuckDB)
         """
         self.db_path = db_path
         self.api_url = api_url or st.secrets.get("API_URL")
         self.api_key = api_key or st.secrets.get("API_KEY")
         self.auto_sync_interval = auto_sync_interval
-        self.conn = None
+        self._db = None
+        self._local = threading.local()  # Cursor DuckDB por thread (ver conn)
+        # Una sola escritura a la vez: dos transacciones sobre las mismas filas
+        # desde cursores distintos chocarían (conflicto de escritura en DuckDB)
+        self._escritura = threading.RLock()
         self._sync_thread = None
         self._stop_sync = False
+        self._suscriptores = []
+        self._cursos = {}  # curso_id → curso_key
 
         self._init_database()
 
-        # Hidratar desde Google Sheets para recuperar estado tras reinicios
+        # Lote y concurrencia de sincronización ajustados en ejecuciones anteriores
+        self.control_sync = self._cargar_control_sync()
+
+        # Diario de check-ins: se reproduce lo escrito después del último checkpoint
+        # (caída entre el fsync y la aplicación, o archivo DuckDB perdido)
+        db = Path(db_path)
+        self.diario = DiarioAsistencias(diario_dir or db.with_name(f"{db.stem}_diario"),
+                                        aplicar=self._aplicar_grupo,
+                                        errores_datos=_ERRORES_DATOS_DIARIO)
+        if self.diario.reproducir(desde_lsn=self._checkpoint_diario()):
+            self._notificar()
+
+        # Hidratar desde Google Sheets para recuperar estado tras reinicios.
+        # Si el archivo ya trae datos de la ejecución anterior se sirven de
+        # inmediato y la hidratación corre en segundo plano.
         if self.api_url and self.api_key:
-            self.hydrate_from_sheets()
+            tiene_datos = self.conn.execute(
+                "SELECT COUNT(*) > 0 FROM asistencias_buffer").fetchone()[0]
+            if tiene_datos:
+                threading.Thread(target=self.hydrate_from_sheets, daemon=True).start()
+            else:
+                self.hydrate_from_sheets()
 
         # Iniciar sincronización automática si está habilitada
         if auto_sync_interval > 0:
@@ -73,39 +202,199 @@ class AsistenciaBuffer:
         # Registrar cleanup al cerrar
         atexit.register(self.close)
 
+    @property
+    def conn(self):
+        """
+        Cursor DuckDB del thread actual (None si la base no está abierta).
+
+        Cada thread (sesiones de Streamlit, escritor del diario, sync automático,
+        hidratación en segundo plano) usa su propio cursor sobre la misma base:
+        nunca lee el resultado de un execute ajeno ni comparte una transacción.
+        """
+        if self._db is None:
+            return None
+        cursor = getattr(self._local, 'cursor', None)
+        if cursor is None:
+            cursor = self._local.cursor = self._db.cursor()
+        return cursor
+
     def _init_database(self):
         """Inicializa la base de datos DuckDB y crea tablas."""
-        self.conn = duckdb.connect(self.db_path)
+        self._db = duckdb.connect(self.db_path)
+        crear_macros_sql(self.conn)
 
-        # Tabla para asistencias pendientes de sincronizar
+        # Secuencia monótona para leer solo lo nuevo ("desde el último seq")
+        self.conn.execute("CREATE SEQUENCE IF NOT EXISTS seq_asistencias")
+        self.conn.execute("CREATE SEQUENCE IF NOT EXISTS seq_id_asistencias")
+        self.conn.execute("CREATE SEQUENCE IF NOT EXISTS seq_cursos")
+
+        self.conn.execute("CREATE TYPE IF NOT EXISTS estado_asistencia AS ENUM "
+                          f"({', '.join(repr(e) for e in ESTADOS)})")
+        self.conn.execute("CREATE TYPE IF NOT EXISTS metodo_registro AS ENUM "
+                          f"({', '.join(repr(m) for m in METODOS)})")
+
+        # Dimensión de cursos: cada asistencia guarda solo curso_key
         self.conn.execute("""
-            CREATE TABLE IF NOT EXISTS asistencias_buffer (
-                id VARCHAR PRIMARY KEY,
-                curso_id VARCHAR NOT NULL,
-                rut VARCHAR NOT NULL,
-                sesion INTEGER NOT NULL,
-                fecha_registro TIMESTAMP NOT NULL,
-                estado VARCHAR DEFAULT 'presente',
-                metodo VARCHAR DEFAULT 'streamlit',
-                sincronizado BOOLEAN DEFAULT false,
-                intentos_sync INTEGER DEFAULT 0,
-                ultimo_error VARCHAR,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(curso_id, rut, sesion)
+            CREATE TABLE IF NOT EXISTS cursos (
+                curso_key INTEGER PRIMARY KEY DEFAULT nextval('seq_cursos'),
+                curso_id VARCHAR NOT NULL UNIQUE
             )
         """)
 
-        # Índices para búsquedas rápidas
+        # Tabla para asistencias pendientes de sincronizar
+        self.conn.execute(_DDL_ASISTENCIAS.format(tabla='asistencias_buffer'))
+
+        # Archivos creados antes de la columna seq
+        tiene_seq = self.conn.execute("""
+            SELECT COUNT(*) > 0 FROM information_schema.columns
+            WHERE table_name = 'asistencias_buffer' AND column_name = 'seq'
+        """).fetchone()[0]
+        if not tiene_seq:
+            self.conn.execute("""
+                ALTER TABLE asistencias_buffer
+                ADD COLUMN seq BIGINT DEFAULT nextval('seq_asistencias')
+            """)
+
+        # Archivos con id VARCHAR y curso_id / RUT como texto
+        self._migrar_esquema()
+
+        # Archivos anteriores al diario
+        self.conn.execute("ALTER TABLE asistencias_buffer ADD COLUMN IF NOT EXISTS lsn BIGINT")
+
+        # Vista para mostrar y exportar: curso_id y RUT como texto
         self.conn.execute("""
-            CREATE INDEX IF NOT EXISTS idx_sincronizado
-            ON asistencias_buffer(sincronizado)
+            CREATE OR REPLACE VIEW asistencias_vista AS
+            SELECT a.id, c.curso_id, rut_texto(a.rut_cod) AS rut, a.rut_cod,
+                   CAST(a.sesion AS INTEGER) AS sesion, a.fecha_registro,
+                   CAST(a.estado AS VARCHAR) AS estado, CAST(a.metodo AS VARCHAR) AS metodo,
+                   a.sincronizado, CAST(a.intentos_sync AS INTEGER) AS intentos_sync,
+                   a.ultimo_error, a.created_at, a.seq
+            FROM asistencias_buffer a
+            JOIN cursos c USING (curso_key)
         """)
 
+        # Cola de fallidas: payload tal como se envió a Sheets y motivo del fallo
         self.conn.execute("""
-            CREATE INDEX IF NOT EXISTS idx_curso_sesion
-            ON asistencias_buffer(curso_id, sesion)
+            CREATE TABLE IF NOT EXISTS asistencias_fallidas (
+                id BIGINT PRIMARY KEY,
+                payload VARCHAR NOT NULL,
+                clase_error VARCHAR NOT NULL,
+                ultimo_error VARCHAR,
+                intentos INTEGER NOT NULL,
+                registrado_en TIMESTAMP,
+                movido_en TIMESTAMP NOT NULL,
+                reenvios INTEGER DEFAULT 0,
+                ultimo_reenvio TIMESTAMP
+            )
         """)
 
+        # Metadatos del buffer (ej: marcador de reconciliación con Sheets)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS buffer_meta (
+                clave VARCHAR PRIMARY KEY,
+                valor VARCHAR,
+                actualizado_en TIMESTAMP NOT NULL
+            )
+        """)
+
+        # Archivos anteriores a la cola: sus fallidas siguen en asistencias_buffer
+        self._mover_a_fallidas()
+
+    def _migrar_esquema(self):
+        """
+        Reconstruye asistencias_buffer con el esquema compacto si el archivo es anterior.
+
+        Cubre archivos con el RUT como VARCHAR y archivos con rut_cod pero con
+        id / curso_id / estado / metodo como texto. Filas sin forma de RUT se
+        descartan; si dos textos del mismo RUT chocan en (curso, rut, sesion)
+        queda la marca más reciente. Los índices antiguos se van con la tabla.
+        """
+        columnas = {fila[0] for fila in self.conn.execute("""
+            SELECT column_name FROM information_schema.columns
+            WHERE table_name = 'asistencias_buffer'
+        """).fetchall()}
+        if 'curso_key' in columnas:
+            return
+
+        rut = 'rut_codigo(a.rut)' if 'rut' in columnas else 'a.rut_cod'
+        self.conn.execute("BEGIN TRANSACTION")
+        try:
+            self.conn.execute("DROP TABLE IF EXISTS asistencias_migracion")
+            self.conn.execute(_DDL_ASISTENCIAS.format(tabla='asistencias_migracion'))
+            self.conn.execute("""
+                INSERT INTO cursos (curso_id)
+                SELECT DISTINCT curso_id FROM asistencias_buffer
+                WHERE curso_id NOT IN (SELECT curso_id FROM cursos)
+            """)
+            self.conn.execute(f"""
+                INSERT INTO asistencias_migracion
+                (curso_key, rut_cod, sesion, fecha_registro, estado, metodo,
+                 sincronizado, intentos_sync, ultimo_error, created_at, seq)
+                SELECT c.curso_key, {rut}, a.sesion, a.fecha_registro,
+                       coalesce(TRY_CAST(a.estado AS estado_asistencia), 'presente'),
+                       coalesce(TRY_CAST(a.metodo AS metodo_registro), 'otro'),
+                       a.sincronizado, least(a.intentos_sync, 127), a.ultimo_error,
+                       a.created_at, a.seq
+                FROM asistencias_buffer a
+                JOIN cursos c USING (curso_id)
+                WHERE {rut} IS NOT NULL AND a.sesion BETWEEN 1 AND 127
+                QUALIFY row_number() OVER (
+                    PARTITION BY c.curso_key, {rut}, a.sesion ORDER BY a.seq DESC) = 1
+                ORDER BY a.seq
+            """)
+            self.conn.execute("DROP TABLE asistencias_buffer")
+            self.conn.execute("ALTER TABLE asistencias_migracion RENAME TO asistencias_buffer")
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def _curso_key(self, curso_id):
+        """
+        Clave entera de un curso en la dimensión cursos (la crea si no existe).
+
+        Returns:
+            int: curso_key
+        """
+        curso_id = str(curso_id)
+        clave = self._cursos.get(curso_id)
+        if clave is None:
+            with self._escritura:
+                self.conn.execute("""
+                    INSERT INTO cursos (curso_id) SELECT ?
+                    WHERE ? NOT IN (SELECT curso_id FROM cursos)
+                """, [curso_id, curso_id])
+                clave = self.conn.execute(
+                    "SELECT curso_key FROM cursos WHERE curso_id = ?", [curso_id]).fetchone()[0]
+            self._cursos[curso_id] = clave
+        return clave
+
+    def _buscar_curso_key(self, curso_id):
+        """
+        Clave entera de un curso sin crearlo (para consultas de solo lectura).
+
+        Returns:
+            int | None: curso_key, o None si el curso no está en la dimensión
+        """
+        curso_id = str(curso_id)
+        clave = self._cursos.get(curso_id)
+        if clave is None:
+            fila = self.conn.execute(
+                "SELECT curso_key FROM cursos WHERE curso_id = ?", [curso_id]).fetchone()
+            if fila is None:
+                return None
+            clave = self._cursos[curso_id] = fila[0]
+        return clave
+
+    def _registrar_cursos(self, tabla):
+        """Agrega a la dimensión cursos los curso_id de una relación registrada que falten."""
+        with self._escritura:
+            self.conn.execute(f"""
+                INSERT INTO cursos (curso_id)
+                SELECT DISTINCT curso_id FROM {tabla}
+                WHERE curso_id NOT IN (SELECT curso_id FROM cursos)
+            """)
+
     def marcar_asistencia(self, curso_id, rut, sesion,
                           estado='presente', metodo='streamlit'):
         """
@@ -119,24 +408,37 @@ class AsistenciaBuffer:
             metodo: Método de registro
 
         Returns:
-            dict: {'success': True/False, 'message': str, 'id': str}
+            dict: {'success': True/False, 'message': str, 'id': int}
         """
         try:
-            # Generar ID único
-            timestamp = int(time.time() * 1000)
-            asist_id = f"ASIST-{curso_id}-{rut}-{sesion}-{timestamp}"
-
-            # Insertar en DuckDB (ultra rápido, <100ms)
-            self.conn.execute("""
-                INSERT INTO asistencias_buffer
-                (id, curso_id, rut, sesion, fecha_registro, estado, metodo)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-                ON CONFLICT (curso_id, rut, sesion) DO UPDATE
-                SET fecha_registro = EXCLUDED.fecha_registro,
-                    estado = EXCLUDED.estado,
-                    metodo = EXCLUDED.metodo
-            """, [asist_id, curso_id, rut, sesion,
-                  datetime.now(), estado, metodo])
+            rut_cod = codificar_rut(rut)
+            if rut_cod is None:
+                return {'success': False, 'message': 'RUT inválido', 'id': None}
+            if estado not in ESTADOS or metodo not in METODOS:
+                return {'success': False, 'message': f'Estado o método inválido: {estado}, {metodo}',
+                        'id': None}
+            # Lo que entra al diario debe caber en el esquema (sesion es TINYINT)
+            curso_id = str(curso_id or '').strip()
+            if not curso_id:
+                return {'success': False, 'message': 'Curso inválido', 'id': None}
+            try:
+                sesion = int(sesion)
+            except (TypeError, ValueError):
+                sesion = 0
+            if not 1 <= sesion <= SESION_MAX:
+                return {'success': False, 'message': 'Sesión inválida', 'id': None}
+
+            # Diario + group commit: vuelve cuando el grupo quedó aplicado (<100ms)
+            asist_id = self.diario.agregar([{
+                'curso_id': curso_id,
+                'rut': decodificar_rut(rut_cod),
+                'sesion': sesion,
+                'fecha_registro': datetime.now().isoformat(),
+                'estado': estado,
+                'metodo': metodo
+            }])[0]
+
+            self._notificar((curso_id, rut_cod, sesion, estado))
 
             return {
                 'success': True,
@@ -152,6 +454,158 @@ class AsistenciaBuffer:
                 'id': None
             }
 
+    def marcar_asistencias(self, filas, estado='presente', metodo='admin_lote'):
+        """
+        Marca muchas asistencias en una sola transacción (lista en papel, escáner).
+
+        Las filas se validan (RUT con dígito verificador, sesión numérica, estado),
+        se deduplican por (curso_id, rut, sesion) y se escriben en el diario
+        de una vez; se aplican con INSERT ... SELECT en grupos.
+
+        Args:
+            filas: DataFrame o lista de dicts con curso_id, rut, sesion y
+                opcionalmente estado
+            estado: Estado por defecto para filas sin 'estado'
+            metodo: Método de registro
+
+        Returns:
+            dict: {'success': bool, 'message': str, 'insertados': int,
+                   'invalidos': list de dicts con las filas rechazadas}
+        """
+        df = pd.DataFrame(filas).reindex(columns=['curso_id', 'rut', 'sesion', 'estado'])
+        df['curso_id'] = df['curso_id'].astype('string').str.strip()
+        df['rut'] = normalizar_ruts(df['rut'])
+        df['sesion'] = pd.to_numeric(df['sesion'], errors='coerce')
+        df['estado'] = df['estado'].fillna(estado).astype(str)
+
+        validos = df['curso_id'].fillna('').ne('') & df['sesion'].between(1, SESION_MAX) \
+            & ruts_validos(df['rut']) & df['estado'].isin(ESTADOS)
+        invalidos = df[~validos]
+
+        df = df[validos].assign(rut_cod=codificar_ruts(df.loc[validos, 'rut']))
+        df = df.drop_duplicates(subset=['curso_id', 'rut_cod', 'sesion'], keep='last')
+        if df.empty:
+            return {'success': False, 'message': 'No hay filas válidas para registrar',
+                    'insertados': 0, 'invalidos': invalidos.to_dict('records')}
+
+        if metodo not in METODOS:
+            return {'success': False, 'message': f'Método de registro inválido: {metodo}',
+                    'insertados': 0, 'invalidos': invalidos.to_dict('records')}
+
+        fecha = datetime.now().isoformat()
+        entradas = [{'curso_id': c, 'rut': r, 'sesion': int(ses), 'fecha_registro': fecha,
+                     'estado': e, 'metodo': metodo}
+                    for c, r, ses, e in df[['curso_id', 'rut', 'sesion', 'estado']]
+                    .itertuples(index=False)]
+
+        try:
+            self.diario.agregar(entradas)
+        except Exception as e:
+            return {'success': False, 'message': f'Error al registrar en buffer: {str(e)}',
+                    'insertados': 0, 'invalidos': invalidos.to_dict('records')}
+
+        self._notificar()
+
+        return {
+            'success': True,
+            'message': f'{len(df)} asistencias registradas en buffer local',
+            'insertados': len(df),
+            'invalidos': invalidos.to_dict('records')
+        }
+
+    def _aplicar_grupo(self, entradas, sincronizado=False):
+        """
+        Aplica un grupo de entradas del diario a asistencias_buffer en una transacción.
+
+        Si una misma (curso_id, rut, sesion) se repite en el grupo queda la de
+        mayor lsn. El checkpoint del diario (diario_lsn) se guarda en la misma
+        transacción, así una entrada nunca se aplica a medias.
+
+        Args:
+            entradas: dicts del diario (n, curso_id, rut, sesion, fecha_registro,
+                estado, metodo)
+            sincronizado: True para entradas que ya están en Sheets (compactadas)
+
+        Returns:
+            dict: lsn → id de la asistencia
+        """
+        with self._escritura:
+            # Clave → última entrada del grupo; el resto de las entradas apunta a ella
+            ultimas, claves = {}, {}
+            for entrada in entradas:
+                rut_cod = codificar_rut(entrada['rut'])
+                if rut_cod is None:
+                    continue
+                clave = (self._curso_key(entrada['curso_id']), rut_cod, int(entrada['sesion']))
+                ultimas[clave] = entrada
+                claves[entrada['n']] = clave
+
+            filas = []
+            self.conn.execute("BEGIN TRANSACTION")
+            try:
+                if ultimas:
+                    valores = []
+                    for (curso_key, rut_cod, sesion), e in ultimas.items():
+                        valores += [curso_key, rut_cod, sesion,
+                                    datetime.fromisoformat(e['fecha_registro']),
+                                    e['estado'], e['metodo'], sincronizado, e['n']]
+                    filas = self.conn.execute(f"""
+                        INSERT INTO asistencias_buffer
+                        (curso_key, rut_cod, sesion, fecha_registro, estado, metodo, sincronizado, lsn)
+                        VALUES {', '.join(['(?, ?, ?, ?, ?, ?, ?, ?)'] * len(ultimas))}
+                        ON CONFLICT (curso_key, rut_cod, sesion) DO UPDATE
+                        SET fecha_registro = EXCLUDED.fecha_registro,
+                            estado = EXCLUDED.estado,
+                            metodo = EXCLUDED.metodo,
+                            lsn = EXCLUDED.lsn,
+                            seq = nextval('seq_asistencias')
+                        RETURNING id, lsn
+                    """, valores).fetchall()
+                self._set_meta('diario_lsn', max(e['n'] for e in entradas))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+        id_por_lsn = dict((lsn, id_) for id_, lsn in filas)
+        return {n: id_por_lsn.get(ultimas[clave]['n']) for n, clave in claves.items()}
+
+    def _checkpoint_diario(self):
+        """Último lsn del diario aplicado a la base (0 si nunca se aplicó)."""
+        meta = self._get_meta('diario_lsn')
+        return int(meta[0]) if meta else 0
+
+    def _lsn_sincronizado(self, desde, hasta):
+        """True si todas las filas escritas por las entradas desde..hasta están en Sheets."""
+        return self.conn.execute("""
+            SELECT COUNT(*) = 0 FROM asistencias_buffer
+            WHERE lsn BETWEEN ? AND ? AND sincronizado IS NOT TRUE
+        """, [desde, hasta]).fetchone()[0]
+
+    def recuperar_desde_diario(self, hasta=None):
+        """
+        Reconstruye asistencias_buffer desde el diario (recuperación a un punto en el tiempo).
+
+        Vacía el buffer y la cola de fallidas y aplica las entradas con
+        fecha_registro <= hasta: las compactadas como sincronizadas y el
+        resto como pendientes (Sheets omite las que ya tiene). El checkpoint
+        queda al final del diario para que un reinicio no reaplique lo posterior.
+
+        Args:
+            hasta: datetime límite (None = todo el diario)
+
+        Returns:
+            int: Entradas aplicadas
+        """
+        with self._escritura:
+            self.conn.execute("DELETE FROM asistencias_buffer")
+            self.conn.execute("DELETE FROM asistencias_fallidas")
+            self.conn.execute("DELETE FROM buffer_meta WHERE clave = 'reconciliado'")
+            aplicadas = self.diario.reproducir(desde_lsn=0, hasta=hasta)
+            self._set_meta('diario_lsn', self.diario.ultimo_lsn)
+        self._notificar()
+        return aplicadas
+
     def get_asistencias_pendientes(self, limit=50):
         """
         Obtiene asistencias pendientes de sincronizar.
@@ -165,9 +619,8 @@ class AsistenciaBuffer:
         query = """
             SELECT id, curso_id, rut, sesion, fecha_registro,
                    estado, metodo, intentos_sync
-            FROM asistencias_buffer
+            FROM asistencias_vista
             WHERE sincronizado = false
-              AND intentos_sync < 5
             ORDER BY created_at ASC
             LIMIT ?
         """
@@ -180,60 +633,88 @@ class AsistenciaBuffer:
 
         return [dict(zip(columns, row)) for row in result]
 
-    def sincronizar(self, batch_size=300):
+    def sincronizar(self, batch_size=None):
         """
         Sincroniza asistencias pendientes con Google Sheets en lotes.
 
+        Sin batch_size el tamaño de lote y la cantidad de envíos en paralelo
+        los decide self.control_sync (AIMD) según la latencia y los errores
+        de los envíos anteriores; cada envío vuelve a alimentar el ajuste.
+
         Args:
-            batch_size: Tamaño del lote (default: 300, optimizado para 600+ usuarios)
+            batch_size: Tamaño fijo de un único lote (None = adaptativo)
 
         Returns:
-            dict: Estadísticas de sincronización
+            dict: Estadísticas de sincronización (incluye lote y concurrencia usados)
         """
+        if batch_size is None:
+            lote, concurrencia = self.control_sync.lote, self.control_sync.concurrencia
+        else:
+            lote, concurrencia = batch_size, 1
+
         stats = {
             'total_pendientes': 0,
             'sincronizados': 0,
             'fallidos': 0,
-            'errores': []
+            'errores': [],
+            'lote': lote,
+            'concurrencia': concurrencia
         }
 
         try:
             # Obtener asistencias pendientes
-            pendientes = self.get_asistencias_pendientes(limit=batch_size)
+            pendientes = self.get_asistencias_pendientes(limit=lote * concurrencia)
             stats['total_pendientes'] = len(pendientes)
 
             if not pendientes:
                 return stats
 
-            # Enviar cada asistencia a Google Sheets
-            for asistencia in pendientes:
-                resultado = self._enviar_a_google_sheets(asistencia)
-
-                if resultado['success']:
-                    # Marcar como sincronizado
-                    self.conn.execute("""
-                        UPDATE asistencias_buffer
-                        SET sincronizado = true
-                        WHERE id = ?
-                    """, [asistencia['id']])
-                    stats['sincronizados'] += 1
-                else:
-                    # Incrementar contador de intentos
-                    self.conn.execute("""
-                        UPDATE asistencias_buffer
-                        SET intentos_sync = intentos_sync + 1,
-                            ultimo_error = ?
-                        WHERE id = ?
-                    """, [resultado.get('error', 'Error desconocido'),
-                          asistencia['id']])
-                    stats['fallidos'] += 1
-                    stats['errores'].append({
-                        'id': asistencia['id'],
-                        'error': resultado.get('error')
-                    })
-
-                # Pequeño delay para no saturar API
-                time.sleep(0.1)
+            # Cada lote va en una sola escritura a Google Sheets; los lotes en paralelo
+            lotes = [pendientes[i:i + lote] for i in range(0, len(pendientes), lote)]
+            with ThreadPoolExecutor(max_workers=len(lotes)) as pool:
+                envios = list(pool.map(
+                    lambda grupo: self._enviar_lote_medido(
+                        [self._payload(asistencia) for asistencia in grupo]),
+                    lotes))
+
+            # Una observación por ronda: el envío más lento y el error más grave
+            clases = [clasificar_error(r.get('error'))
+                      for resultados, _ in envios for r in resultados if not r['success']]
+            saturacion = [c for c in clases if c in ERRORES_SATURACION]
+            self.control_sync.registrar(
+                max(latencia for _, latencia in envios),
+                (saturacion or clases or [None])[0],
+                lleno=len(pendientes) >= lote * concurrencia)
+
+            with self._escritura:
+                ok = []
+                for grupo, (resultados, _) in zip(lotes, envios):
+                    for asistencia, resultado in zip(grupo, resultados):
+                        if resultado['success']:
+                            ok.append(asistencia['id'])
+                            continue
+                        # Incrementar contador de intentos
+                        self.conn.execute("""
+                            UPDATE asistencias_buffer
+                            SET intentos_sync = intentos_sync + 1,
+                                ultimo_error = ?
+                            WHERE id = ?
+                        """, [resultado.get('error', 'Error desconocido'), asistencia['id']])
+                        stats['fallidos'] += 1
+                        stats['errores'].append({
+                            'id': asistencia['id'],
+                            'error': resultado.get('error')
+                        })
+
+                self._marcar_sincronizados(ok)
+                stats['sincronizados'] = len(ok)
+                self._guardar_control_sync()
+
+                # Las que agotaron los intentos dejan la cola de pendientes
+                self._mover_a_fallidas()
+
+            # Segmentos del diario ya sincronizados pasan al compactado
+            self.diario.compactar(self._lsn_sincronizado)
 
             return stats
 
@@ -241,12 +722,271 @@ class AsistenciaBuffer:
             stats['errores'].append({'error': f'Error general: {str(e)}'})
             return stats
 
-    def _enviar_a_google_sheets(self, asistencia):
+    def _enviar_lote_medido(self, payloads):
+        """
+        Envía un lote (ver _enviar_lote_a_google_sheets) y mide cuánto tardó.
+
+        Returns:
+            tuple: (resultados por payload, segundos)
+        """
+        inicio = time.perf_counter()
+        resultados = self._enviar_lote_a_google_sheets(payloads)
+        return resultados, time.perf_counter() - inicio
+
+    def _cargar_control_sync(self):
+        """Control AIMD con el lote y la concurrencia guardados en buffer_meta."""
+        meta = self._get_meta('control_sync')
+        try:
+            estado = json.loads(meta[0]) if meta else None
+        except (TypeError, ValueError):
+            estado = None
+        return ControlLotesAIMD.desde_dict(estado)
+
+    def _guardar_control_sync(self):
+        self._set_meta('control_sync', json.dumps(self.control_sync.a_dict()))
+
+    def reiniciar_control_sync(self):
+        """Vuelve el lote y la concurrencia de sincronización a los valores iniciales."""
+        self.control_sync = ControlLotesAIMD()
+        self._guardar_control_sync()
+
+    def _marcar_sincronizados(self, ids):
+        """Marca como sincronizadas las asistencias con esos id."""
+        if ids:
+            with self._escritura:
+                self.conn.execute("""
+                    UPDATE asistencias_buffer
+                    SET sincronizado = true, intentos_sync = 0, ultimo_error = NULL
+                    WHERE id IN (SELECT unnest(?::BIGINT[]))
+                """, [ids])
+
+    @staticmethod
+    def _payload(asistencia):
+        """
+        Fila de la hoja Asistencias tal como se envía al Apps Script.
+
+        Args:
+            asistencia: Dict con curso_id, rut, sesion, fecha_registro, estado, metodo
+
+        Returns:
+            dict: Payload serializable a JSON
+        """
+        return {
+            'curso_id': asistencia['curso_id'],
+            'rut': asistencia['rut'],
+            'sesion': int(asistencia['sesion']),
+            'fecha_registro': asistencia['fecha_registro'].isoformat(),
+            'estado': asistencia['estado'],
+            'metodo': asistencia['metodo']
+        }
+
+    def _enviar_lote_a_google_sheets(self, payloads, max_retries=3):
+        """
+        Envía un lote de asistencias con la acción addAsistencias (una escritura en Sheets).
+
+        Si el Apps Script todavía no tiene addAsistencias, el lote se envía
+        fila por fila con addAsistencia.
+
+        Args:
+            payloads: Lista de dicts de _payload
+            max_retries: Reintentos del lote (sistema ocupado / timeout)
+
+        Returns:
+            list: {'success': bool, 'error': str} por payload, en el mismo orden
+        """
+        error = 'Sistema sobrecargado o sin respuesta'
+        for attempt in range(max_retries):
+            try:
+                if attempt > 0:
+                    time.sleep(random.uniform(0.5, 2.0))
+
+                response = requests.post(
+                    self.api_url,
+                    params={"action": "addAsistencias", "key": self.api_key},
+                    json={"asistencias": payloads},
+                    timeout=60
+                )
+                data = response.json()
+
+                if data.get('success'):
+                    return [{'success': True}] * len(payloads)
+
+                error = data.get('error', 'Error desconocido')
+                if 'ocupado' in error.lower() or 'busy' in error.lower():
+                    continue
+                # Apps Script sin addAsistencias: se envía uno a uno
+                if 'acción no válida' in error.lower():
+                    return [self._enviar_a_google_sheets(p) for p in payloads]
+                break
+
+            except requests.exceptions.Timeout as e:
+                error = str(e) or 'Timeout'
+            except Exception as e:
+                error = str(e)
+                break
+
+        return [{'success': False, 'error': error}] * len(payloads)
+
+    def _mover_a_fallidas(self):
+        """
+        Pasa a la cola de fallidas las pendientes con MAX_INTENTOS_SYNC intentos o más.
+
+        El payload se guarda tal como se envió a Sheets y la fila queda en
+        asistencias_buffer con sincronizado = NULL: sigue contando como
+        asistencia marcada, pero ya no entra en pendientes ni estadísticas.
+
+        Returns:
+            int: Filas movidas
+        """
+        with self._escritura:
+            agotadas = self.conn.execute("""
+                SELECT id, curso_id, rut, sesion, fecha_registro, estado, metodo,
+                       intentos_sync, ultimo_error, created_at
+                FROM asistencias_vista
+                WHERE sincronizado = false AND intentos_sync >= ?
+            """, [MAX_INTENTOS_SYNC]).df()
+            if agotadas.empty:
+                return 0
+
+            fallidas = pd.DataFrame({
+                'id': agotadas['id'],
+                'payload': [json.dumps(self._payload(fila)) for fila in agotadas.to_dict('records')],
+                'clase_error': agotadas['ultimo_error'].map(clasificar_error),
+                'ultimo_error': agotadas['ultimo_error'],
+                'intentos': agotadas['intentos_sync'],
+                'registrado_en': agotadas['created_at'],
+                'movido_en': datetime.now()
+            })
+
+            self.conn.register('_fallidas', fallidas)
+            self.conn.execute("BEGIN TRANSACTION")
+            try:
+                self.conn.execute("""
+                    INSERT INTO asistencias_fallidas
+                    (id, payload, clase_error, ultimo_error, intentos, registrado_en, movido_en)
+                    SELECT id, payload, clase_error, ultimo_error, intentos, registrado_en, movido_en
+                    FROM _fallidas
+                    ON CONFLICT (id) DO UPDATE
+                    SET payload = EXCLUDED.payload,
+                        clase_error = EXCLUDED.clase_error,
+                        ultimo_error = EXCLUDED.ultimo_error,
+                        intentos = EXCLUDED.intentos,
+                        movido_en = EXCLUDED.movido_en
+                """)
+                self.conn.execute("""
+                    UPDATE asistencias_buffer SET sincronizado = NULL
+                    WHERE id IN (SELECT id FROM _fallidas)
+                """)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            finally:
+                self.conn.unregister('_fallidas')
+
+        return len(fallidas)
+
+    def get_resumen_fallidas(self):
+        """
+        Cola de fallidas agrupada por clase de error.
+
+        Returns:
+            pd.DataFrame: clase_error, filas, ejemplo (último mensaje), primer_fallo,
+            ultimo_fallo, reenvios
+        """
+        return self.conn.execute("""
+            SELECT clase_error, count(*) AS filas,
+                   arg_max(ultimo_error, movido_en) AS ejemplo,
+                   min(movido_en) AS primer_fallo,
+                   max(coalesce(ultimo_reenvio, movido_en)) AS ultimo_fallo,
+                   CAST(sum(reenvios) AS INTEGER) AS reenvios
+            FROM asistencias_fallidas
+            GROUP BY clase_error
+            ORDER BY filas DESC
+        """).df()
+
+    def get_fallidas(self, clase_error=None, limit=500):
+        """
+        Filas de la cola de fallidas con su payload.
+
+        Args:
+            clase_error: Filtrar por clase (None = todas)
+            limit: Máximo de filas
+
+        Returns:
+            pd.DataFrame: Columnas de asistencias_fallidas, las más antiguas primero
+        """
+        return self.conn.execute("""
+            SELECT * FROM asistencias_fallidas
+            WHERE ? IS NULL OR clase_error = ?
+            ORDER BY movido_en, id
+            LIMIT ?
+        """, [clase_error, clase_error, limit]).df()
+
+    def reenviar_fallidas(self, clase_error=None, batch_size=300):
+        """
+        Reenvía la cola de fallidas por el camino en lote (tras corregir la causa).
+
+        Las que Sheets acepta se marcan sincronizadas y salen de la cola; las
+        que vuelven a fallar se quedan con el error nuevo.
+
+        Args:
+            clase_error: Reenviar solo esa clase (None = todas)
+            batch_size: Filas por request a addAsistencias
+
+        Returns:
+            dict: {'total': int, 'reenviados': int, 'fallidos': int, 'errores': list}
+        """
+        stats = {'total': 0, 'reenviados': 0, 'fallidos': 0, 'errores': []}
+        fallidas = self.conn.execute("""
+            SELECT id, payload FROM asistencias_fallidas
+            WHERE ? IS NULL OR clase_error = ?
+            ORDER BY movido_en, id
+        """, [clase_error, clase_error]).fetchall()
+        stats['total'] = len(fallidas)
+
+        for inicio in range(0, len(fallidas), batch_size):
+            lote = fallidas[inicio:inicio + batch_size]
+            resultados = self._enviar_lote_a_google_sheets([json.loads(p) for _, p in lote])
+
+            ok = [id_ for (id_, _), r in zip(lote, resultados) if r['success']]
+            errores = [(r.get('error') or 'Error desconocido', id_)
+                       for (id_, _), r in zip(lote, resultados) if not r['success']]
+
+            with self._escritura:
+                self.conn.execute("BEGIN TRANSACTION")
+                try:
+                    self._marcar_sincronizados(ok)
+                    if ok:
+                        self.conn.execute("""
+                            DELETE FROM asistencias_fallidas
+                            WHERE id IN (SELECT unnest(?::BIGINT[]))
+                        """, [ok])
+                    for error, id_ in errores:
+                        self.conn.execute("""
+                            UPDATE asistencias_fallidas
+                            SET reenvios = reenvios + 1, ultimo_reenvio = ?,
+                                ultimo_error = ?, clase_error = ?
+                            WHERE id = ?
+                        """, [datetime.now(), error, clasificar_error(error), id_])
+                    self.conn.execute("COMMIT")
+                except Exception as e:
+                    self.conn.execute("ROLLBACK")
+                    stats['errores'].append({'error': f'Error general: {str(e)}'})
+                    break
+
+            stats['reenviados'] += len(ok)
+            stats['fallidos'] += len(errores)
+            stats['errores'].extend({'id': id_, 'error': error} for error, id_ in errores)
+
+        return stats
+
+    def _enviar_a_google_sheets(self, payload):
         """
         Envía una asistencia individual a Google Sheets.
 
         Args:
-            asistencia: Dict con datos de asistencia
+            payload: Dict de _payload
 
         Returns:
             dict: {'success': bool, 'error': str}
@@ -255,14 +995,7 @@ class AsistenciaBuffer:
             response = requests.post(
                 self.api_url,
                 params={"action": "addAsistencia", "key": self.api_key},
-                json={
-                    'curso_id': asistencia['curso_id'],
-                    'rut': asistencia['rut'],
-                    'sesion': asistencia['sesion'],
-                    'fecha_registro': asistencia['fecha_registro'].isoformat(),
-                    'estado': asistencia['estado'],
-                    'metodo': asistencia['metodo']
-                },
+                json=payload,
                 timeout=10
             )
 
@@ -309,7 +1042,7 @@ class AsistenciaBuffer:
         # Pendientes de sincronizar
         result = self.conn.execute("""
             SELECT COUNT(*) FROM asistencias_buffer
-            WHERE sincronizado = false AND intentos_sync < 5
+            WHERE sincronizado = false
         """).fetchone()
         stats['pendientes'] = result[0]
 
@@ -320,10 +1053,9 @@ class AsistenciaBuffer:
         """).fetchone()
         stats['sincronizadas'] = result[0]
 
-        # Fallidas (>5 intentos)
+        # Fallidas (en la cola de fallidas, no recorre asistencias_buffer)
         result = self.conn.execute("""
-            SELECT COUNT(*) FROM asistencias_buffer
-            WHERE sincronizado = false AND intentos_sync >= 5
+            SELECT COUNT(*) FROM asistencias_fallidas
         """).fetchone()
         stats['fallidas'] = result[0]
 
@@ -342,19 +1074,41 @@ class AsistenciaBuffer:
         """
         if sesion:
             query = """
-                SELECT * FROM asistencias_buffer
+                SELECT * FROM asistencias_vista
                 WHERE curso_id = ? AND sesion = ?
                 ORDER BY fecha_registro DESC
             """
             return self.conn.execute(query, [curso_id, sesion]).df()
         else:
             query = """
-                SELECT * FROM asistencias_buffer
+                SELECT * FROM asistencias_vista
                 WHERE curso_id = ?
                 ORDER BY fecha_registro DESC
             """
             return self.conn.execute(query, [curso_id]).df()
 
+    def get_asistencias_desde(self, curso_id, sesion, ultimo_seq=0, limit=500):
+        """
+        Obtiene solo las asistencias marcadas después de un seq dado (feed incremental).
+
+        Args:
+            curso_id: ID del curso
+            sesion: Número de sesión
+            ultimo_seq: Último seq ya recibido (0 = desde el inicio)
+            limit: Máximo de filas (se devuelven las más recientes)
+
+        Returns:
+            pd.DataFrame: seq, rut, estado, metodo, fecha_registro en orden de llegada
+        """
+        df = self.conn.execute("""
+            SELECT seq, rut, estado, metodo, fecha_registro
+            FROM asistencias_vista
+            WHERE curso_id = ? AND sesion = ? AND seq > ?
+            ORDER BY seq DESC
+            LIMIT ?
+        """, [curso_id, sesion, ultimo_seq, limit]).df()
+        return df.iloc[::-1].reset_index(drop=True)
+
     def verificar_asistencia(self, curso_id, rut, sesion):
         """
         Verifica si ya existe asistencia registrada.
@@ -367,10 +1121,14 @@ class AsistenciaBuffer:
         Returns:
             bool: True si ya existe
         """
+        curso_key = self._buscar_curso_key(curso_id)
+        if curso_key is None:
+            return False  # Curso sin asistencias en el buffer
+
         result = self.conn.execute("""
             SELECT COUNT(*) FROM asistencias_buffer
-            WHERE curso_id = ? AND rut = ? AND sesion = ?
-        """, [curso_id, rut, sesion]).fetchone()
+            WHERE curso_key = ? AND rut_cod = ? AND sesion = ?
+        """, [curso_key, codificar_rut(rut), sesion]).fetchone()
 
         return result[0] > 0
 
@@ -379,55 +1137,276 @@ class AsistenciaBuffer:
         Carga asistencias existentes desde Google Sheets al iniciar el buffer.
         Evita duplicados cuando la app se reinicia y el buffer queda vacío.
 
+        La hoja se descarga por páginas y cada página se inserta en un solo
+        INSERT ... SELECT, de modo que la memoria queda acotada al tamaño de
+        página y las primeras filas están disponibles antes de terminar.
+
         Returns:
             int: Número de registros cargados desde Sheets
         """
+        cargados = 0
+        filas_sheets = 0
+        completo = True
         try:
-            response = requests.get(
-                self.api_url,
-                params={"action": "getAsistencias", "key": self.api_key},
-                timeout=15
-            )
-            data = response.json()
+            for pagina in iter_paginas(self.api_url, self.api_key,
+                                       "getAsistencias", "asistencias"):
+                filas_sheets += len(pagina)
+                try:
+                    cargados += self._insertar_pagina_sheets(pagina)
+                except Exception:
+                    completo = False
+                    continue
+        except Exception:
+            completo = False  # Si falla la hidratación, el buffer sigue funcionando normal
 
-            if not data.get('success') or not data.get('asistencias'):
-                return 0
+        # Solo una lectura completa de la hoja prueba que el buffer contiene a Sheets
+        if completo:
+            self._set_meta('reconciliado', filas_sheets)
 
-            cargados = 0
-            for asist in data['asistencias']:
-                try:
-                    # ID consistente para registros provenientes de Sheets
-                    asist_id = f"SHEETS-{asist.get('curso_id','')}-{asist.get('rut','')}-{asist.get('sesion','')}"
+        if cargados:
+            self._notificar()
 
-                    # Parsear fecha con fallback (compatible con sufijo Z de Apps Script)
-                    try:
-                        fecha_pd = pd.to_datetime(str(asist['fecha_registro']), utc=True, errors='coerce')
-                        fecha = fecha_pd.to_pydatetime().replace(tzinfo=None) if pd.notna(fecha_pd) else datetime.now()
-                    except Exception:
-                        fecha = datetime.now()
+        return cargados
 
-                    self.conn.execute("""
-                        INSERT INTO asistencias_buffer
-                        (id, curso_id, rut, sesion, fecha_registro, estado, metodo, sincronizado)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, true)
-                        ON CONFLICT (curso_id, rut, sesion) DO NOTHING
-                    """, [
-                        asist_id,
-                        str(asist.get('curso_id', '')),
-                        str(asist.get('rut', '')),
-                        int(asist.get('sesion', 0)),
-                        fecha,
-                        str(asist.get('estado', 'presente')),
-                        'sheets_hydration'
-                    ])
-                    cargados += 1
-                except Exception:
-                    continue
+    def _insertar_pagina_sheets(self, pagina):
+        """
+        Inserta una página de la hoja Asistencias como registros sincronizados.
 
-            return cargados
+        Args:
+            pagina: pd.DataFrame con columnas curso_id, rut, sesion, fecha_registro, estado
 
-        except Exception:
-            return 0  # Si falla la hidratación, el buffer sigue funcionando normal
+        Returns:
+            int: Número de filas válidas procesadas
+        """
+        def columna(nombre, defecto=''):
+            if nombre in pagina.columns:
+                return pagina[nombre]
+            return pd.Series(defecto, index=pagina.index, dtype=object)
+
+        df = pd.DataFrame({
+            'curso_id': columna('curso_id').astype(str),
+            'rut_cod': codificar_ruts(columna('rut')),
+            'sesion': pd.to_numeric(columna('sesion', 0), errors='coerce'),
+            'estado': columna('estado', 'presente').fillna('presente').astype(str),
+        })
+
+        # Parsear fecha con fallback (compatible con sufijo Z de Apps Script)
+        fechas = pd.to_datetime(columna('fecha_registro').astype(str), utc=True,
+                                errors='coerce', format='mixed')
+        df['fecha_registro'] = fechas.dt.tz_convert(None).fillna(pd.Timestamp(datetime.now()))
+
+        # Solo filas que caben en el esquema (RUT, sesión y estado válidos)
+        df = df[df['rut_cod'].notna() & df['sesion'].between(1, SESION_MAX)
+                & df['estado'].isin(ESTADOS)]
+        df = df.assign(sesion=df['sesion'].astype(int))
+        df = df.drop_duplicates(subset=['curso_id', 'rut_cod', 'sesion'])
+        if df.empty:
+            return 0
+
+        with self._escritura:
+            self.conn.register('_pagina_sheets', df)
+            try:
+                self._registrar_cursos('_pagina_sheets')
+                self.conn.execute("""
+                    INSERT INTO asistencias_buffer
+                    (curso_key, rut_cod, sesion, fecha_registro, estado, metodo, sincronizado)
+                    SELECT c.curso_key, p.rut_cod, p.sesion, p.fecha_registro, p.estado,
+                           'sheets_hydration', true
+                    FROM _pagina_sheets p
+                    JOIN cursos c USING (curso_id)
+                    ON CONFLICT (curso_key, rut_cod, sesion) DO NOTHING
+                """)
+            finally:
+                self.conn.unregister('_pagina_sheets')
+
+        return len(df)
+
+    def suscribir(self, callback):
+        """
+        Registra un observador de cambios en asistencias_buffer.
+
+        Args:
+            callback: Función que recibe (curso_id, rut_cod, sesion, estado) por cada
+                asistencia marcada, o None cuando cambian muchas filas a la vez
+                (hidratación, limpieza) y conviene recalcular todo
+        """
+        self._suscriptores.append(callback)
+
+    def _notificar(self, cambio=None):
+        """Avisa a los observadores; un observador con errores no afecta al buffer."""
+        for callback in self._suscriptores:
+            try:
+                callback(cambio)
+            except Exception:
+                logger.exception("Error en un observador del buffer (%r)", callback)
+
+    def _set_meta(self, clave, valor):
+        """Guarda un metadato del buffer con la hora actual."""
+        with self._escritura:
+            self.conn.execute("""
+                INSERT INTO buffer_meta (clave, valor, actualizado_en)
+                VALUES (?, ?, ?)
+                ON CONFLICT (clave) DO UPDATE
+                SET valor = EXCLUDED.valor, actualizado_en = EXCLUDED.actualizado_en
+            """, [clave, None if valor is None else str(valor), datetime.now()])
+
+    def _get_meta(self, clave):
+        """
+        Lee un metadato del buffer.
+
+        Returns:
+            tuple | None: (valor, actualizado_en) o None si no existe
+        """
+        return self.conn.execute("""
+            SELECT valor, actualizado_en FROM buffer_meta WHERE clave = ?
+        """, [clave]).fetchone()
+
+    def get_reconciliacion(self):
+        """
+        Obtiene el marcador de reconciliación con Google Sheets.
+
+        El marcador se escribe al terminar una hidratación completa (todas las
+        páginas leídas e insertadas) y se borra cuando se eliminan registros
+        sincronizados, porque entonces el buffer ya no contiene a Sheets.
+
+        Returns:
+            dict | None: {'filas_sheets': int, 'reconciliado_en': datetime} o None
+        """
+        meta = self._get_meta('reconciliado')
+        if meta is None:
+            return None
+        return {'filas_sheets': int(meta[0]), 'reconciliado_en': meta[1]}
+
+    def esta_reconciliado(self, max_edad=1800):
+        """
+        Indica si el buffer puede servir reportes en lugar de descargar Sheets.
+
+        Args:
+            max_edad: Segundos de validez del marcador (Sheets puede recibir
+                asistencias por otros medios)
+
+        Returns:
+            bool: True si hay un marcador vigente
+        """
+        reconciliacion = self.get_reconciliacion()
+        if reconciliacion is None:
+            return False
+        edad = (datetime.now() - reconciliacion['reconciliado_en']).total_seconds()
+        return edad <= max_edad
+
+    def get_checksums(self):
+        """
+        Conteo y hash por (curso_id, sesion) del buffer, comparables con
+        descargar_checksums (incluye pendientes y fallidas).
+
+        Returns:
+            pd.DataFrame: curso_id, sesion, filas, hash
+        """
+        return self.conn.execute(f"""
+            SELECT curso_id, sesion, count(*) AS filas,
+                   CAST(sum({_HASH_RUT.format(rut='rut')}) % 4294967296 AS BIGINT) AS hash
+            FROM asistencias_vista
+            GROUP BY curso_id, sesion
+        """).df()
+
+    def reconciliar(self):
+        """
+        Reconcilia el buffer con la hoja Asistencias comparando checksums.
+
+        Solo se descargan los buckets (curso_id, sesion) cuyo conteo o hash
+        difiere, de modo que el costo depende de la deriva y no del historial.
+        En cada bucket distinto:
+        - Filas sincronizadas que no están en Sheets vuelven a pendientes
+        - Pendientes o fallidas que ya están en Sheets se marcan sincronizadas
+        - Filas de Sheets que faltan en el buffer se importan como sincronizadas
+
+        Si todos los buckets se revisaron, el buffer contiene a Sheets y se
+        renueva el marcador de reconciliación.
+
+        Returns:
+            dict: {'buckets': int, 'distintos': int, 'reencolados': int,
+                   'confirmados': int, 'importados': int, 'pendientes': int,
+                   'errores': list}
+
+        Raises:
+            SheetsAPIError: Si el Apps Script no entrega los checksums
+        """
+        stats = {'buckets': 0, 'distintos': 0, 'reencolados': 0, 'confirmados': 0,
+                 'importados': 0, 'pendientes': 0, 'errores': []}
+
+        remoto = descargar_checksums(self.api_url, self.api_key)
+        local = self.get_checksums()
+        comparacion = local.merge(remoto, on=['curso_id', 'sesion'], how='outer',
+                                  suffixes=('_local', '_sheets'))
+        distintos = comparacion[
+            comparacion['filas_local'].ne(comparacion['filas_sheets'])
+            | comparacion['hash_local'].ne(comparacion['hash_sheets'])
+        ]
+        stats['buckets'] = len(comparacion)
+        stats['distintos'] = len(distintos)
+
+        for curso_id, sesion in distintos[['curso_id', 'sesion']].itertuples(index=False):
+            try:
+                self._reconciliar_bucket(str(curso_id), int(sesion), stats)
+            except Exception as e:
+                stats['errores'].append({'curso_id': curso_id, 'sesion': int(sesion),
+                                         'error': str(e)})
+
+        if not stats['errores']:
+            self._set_meta('reconciliado', int(remoto['filas'].sum()))
+        if stats['reencolados'] or stats['confirmados'] or stats['importados']:
+            self._notificar()
+
+        return stats
+
+    def _reconciliar_bucket(self, curso_id, sesion, stats):
+        """Compara fila a fila un bucket (curso_id, sesion) que difiere de Sheets."""
+        sheets = descargar_dataframe(self.api_url, self.api_key, "getAsistencias", "asistencias",
+                                     filtros={'curso_id': curso_id, 'sesion': sesion})
+        if not sheets.empty:
+            # Un Apps Script sin filtros devuelve la hoja completa
+            sheets = sheets[sheets['curso_id'].astype(str).eq(curso_id)
+                            & pd.to_numeric(sheets['sesion'], errors='coerce').eq(sesion)]
+            sheets = sheets.assign(rut_cod=codificar_ruts(sheets['rut']))
+            sheets = sheets[sheets['rut_cod'].notna()]
+        ruts_sheets = set(sheets['rut_cod'].astype(int)) if not sheets.empty else set()
+
+        with self._escritura:
+            local = self.conn.execute("""
+                SELECT id, rut_cod, sincronizado IS TRUE AS sincronizada,
+                       sincronizado IS FALSE AS pendiente
+                FROM asistencias_buffer
+                WHERE curso_key = ? AND sesion = ?
+            """, [self._curso_key(curso_id), sesion]).df()
+            en_sheets = local['rut_cod'].isin(ruts_sheets)
+
+            # Marcadas como sincronizadas pero ausentes en Sheets: reenviar
+            reencolar = local.loc[~en_sheets & local['sincronizada'], 'id'].tolist()
+            if reencolar:
+                self.conn.execute("""
+                    UPDATE asistencias_buffer
+                    SET sincronizado = false, intentos_sync = 0,
+                        ultimo_error = 'No está en Sheets (reconciliación)'
+                    WHERE id IN (SELECT unnest(?::BIGINT[]))
+                """, [reencolar])
+            stats['reencolados'] += len(reencolar)
+            stats['pendientes'] += int((~en_sheets & local['pendiente']).sum())
+
+            # Pendientes o fallidas que Sheets ya tiene: no reenviar
+            confirmar = local.loc[en_sheets & ~local['sincronizada'], 'id'].tolist()
+            if confirmar:
+                self._marcar_sincronizados(confirmar)
+                self.conn.execute("""
+                    DELETE FROM asistencias_fallidas WHERE id IN (SELECT unnest(?::BIGINT[]))
+                """, [confirmar])
+            stats['confirmados'] += len(confirmar)
+
+            # Filas de Sheets que el buffer no tiene
+            if not sheets.empty:
+                faltantes = sheets[~sheets['rut_cod'].isin(set(local['rut_cod']))]
+                if not faltantes.empty:
+                    stats['importados'] += self._insertar_pagina_sheets(
+                        faltantes.drop(columns='rut_cod'))
 
     def force_hydrate(self):
         """
@@ -437,7 +1416,24 @@ class AsistenciaBuffer:
         Returns:
             int: Número de registros cargados
         """
-        self.conn.execute("DELETE FROM asistencias_buffer WHERE sincronizado = true")
+        with self._escritura:
+            self.conn.execute("DELETE FROM asistencias_buffer WHERE sincronizado = true")
+            self.conn.execute("DELETE FROM buffer_meta WHERE clave = 'reconciliado'")
+        self._notificar()
+        return self.hydrate_from_sheets()
+
+    def reiniciar(self):
+        """
+        Vacía el buffer completo (incluidos pendientes) y recarga desde Google Sheets.
+
+        Returns:
+            int: Número de registros cargados
+        """
+        with self._escritura:
+            self.conn.execute("DELETE FROM asistencias_buffer")
+            self.conn.execute("DELETE FROM asistencias_fallidas")
+            self.conn.execute("DELETE FROM buffer_meta WHERE clave = 'reconciliado'")
+        self._notificar()
         return self.hydrate_from_sheets()
 
     def limpiar_sincronizados(self, dias=7):
@@ -450,35 +1446,44 @@ class AsistenciaBuffer:
         Returns:
             int: Número de registros eliminados
         """
-        if dias <= 0:
-            count = self.conn.execute("SELECT COUNT(*) FROM asistencias_buffer WHERE sincronizado = true").fetchone()[0]
-            self.conn.execute("DELETE FROM asistencias_buffer WHERE sincronizado = true")
-        else:
-            count = self.conn.execute("""
-                SELECT COUNT(*) FROM asistencias_buffer
-                WHERE sincronizado = true
-                  AND created_at < CAST(CURRENT_TIMESTAMP AS TIMESTAMP) - (? * INTERVAL '1 day')
-            """, [dias]).fetchone()[0]
-            self.conn.execute("""
-                DELETE FROM asistencias_buffer
-                WHERE sincronizado = true
-                  AND created_at < CAST(CURRENT_TIMESTAMP AS TIMESTAMP) - (? * INTERVAL '1 day')
-            """, [dias])
+        with self._escritura:
+            if dias <= 0:
+                count = self.conn.execute("SELECT COUNT(*) FROM asistencias_buffer WHERE sincronizado = true").fetchone()[0]
+                self.conn.execute("DELETE FROM asistencias_buffer WHERE sincronizado = true")
+            else:
+                count = self.conn.execute("""
+                    SELECT COUNT(*) FROM asistencias_buffer
+                    WHERE sincronizado = true
+                      AND created_at < CAST(CURRENT_TIMESTAMP AS TIMESTAMP) - (? * INTERVAL '1 day')
+                """, [dias]).fetchone()[0]
+                self.conn.execute("""
+                    DELETE FROM asistencias_buffer
+                    WHERE sincronizado = true
+                      AND created_at < CAST(CURRENT_TIMESTAMP AS TIMESTAMP) - (? * INTERVAL '1 day')
+                """, [dias])
+
+            # Sin esos registros el buffer ya no refleja la hoja completa
+            if count > 0:
+                self.conn.execute("DELETE FROM buffer_meta WHERE clave = 'reconciliado'")
+                self._notificar()
 
         return count
 
     def close(self):
         """Cierra conexión y detiene sincronización automática."""
         self._stop_sync = True
+        # Aplicar lo que quedó en el diario antes de cerrar la base
+        self.diario.cerrar()
         if self._sync_thread:
             self._sync_thread.join(timeout=5)
-        if self.conn:
+        if self._db is not None:
             # Intentar sincronizar antes de cerrar
             try:
                 self.sincronizar()
             except:
                 pass
-            self.conn.close()
+            self._db.close()
+            self._db = None
 
 
 # ==================== INTEGRACIÓN CON STREAMLIT ====================
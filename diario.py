@@ -0,0 +1,441 @@
+"""
+Diario de Check-ins (append-only) con Group Commit
+==================================================
+
+Cada check-in se escribe primero como una línea JSON en un segmento del
+diario y luego se aplica a asistencias_buffer junto con los demás check-ins
+que llegaron en la misma ventana. Un solo fsync y una sola transacción
+DuckDB cubren todo el grupo, en lugar de una transacción por check-in.
+
+Características:
+- Segmentos JSONL append-only (segmento_<primer lsn>.jsonl) con número de
+  secuencia (lsn) por entrada
+- Group commit: un hilo escritor junta las entradas que llegan mientras
+  aplica el grupo anterior, hace un fsync y las aplica juntas; quien
+  escribe espera a que su entrada esté aplicada
+- Checkpoint: el último lsn aplicado queda en la base (lo guarda la función
+  de aplicación en la misma transacción) y al reiniciar se reproduce solo
+  lo posterior
+- Rotación por tamaño y compactación de segmentos ya sincronizados en
+  compactado.jsonl (última entrada por curso_id, rut y sesion)
+- Recuperación a un punto en el tiempo (reproducir hasta una fecha)
+- Una última línea cortada por una caída se ignora al leer
+- Cuarentena: una entrada inválida (errores_datos; si falla el grupo se
+  reintenta de a una) queda en cuarentena.jsonl con su error y ya no se
+  reproduce, compacta ni recupera
+- Un error transitorio al aplicar se reintenta; si persiste, o si falla el
+  fsync o la rotación, el diario queda detenido: quienes esperan reciben el
+  error, los siguientes agregar fallan de inmediato y las entradas quedan
+  en el diario para reproducirlas al reiniciar
+
+Uso:
+    from diario import DiarioAsistencias
+
+    diario = DiarioAsistencias("asistencias_diario", aplicar=aplicar_grupo)
+    diario.reproducir(desde_lsn=checkpoint)
+    ids = diario.agregar([{'curso_id': 'RM-Mar26', 'rut': '12345678-5', 'sesion': 1, ...}])
+    diario.compactar(sincronizado=lambda desde, hasta: True)
+"""
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+# Nombre del segmento con las entradas ya compactadas
+COMPACTADO = "compactado.jsonl"
+
+# Entradas que no se pudieron aplicar (con el error), excluidas del diario
+CUARENTENA = "cuarentena.jsonl"
+
+# Intentos del escritor ante un error transitorio al aplicar un grupo
+REINTENTOS_APLICAR = 3
+
+
+def _clave(entrada):
+    return (entrada['curso_id'], entrada['rut'], entrada['sesion'])
+
+
+class DiarioAsistencias:
+    """
+    Diario append-only de check-ins con fsync por grupo.
+    """
+
+    def __init__(self, directorio, aplicar, intervalo_grupo=0.0, max_grupo=500,
+                 max_bytes_segmento=4 * 1024 * 1024, errores_datos=(ValueError, KeyError, TypeError),
+                 espera_maxima=30.0):
+        """
+        Args:
+            directorio: Carpeta de los segmentos (se crea si no existe)
+            aplicar: Función (entradas, sincronizado=False) → dict lsn → resultado;
+                aplica un grupo a la base en una transacción (y guarda el checkpoint)
+            errores_datos: Excepciones de 'aplicar' que indican una entrada inválida;
+                al reproducir, solo estas mandan la entrada a cuarentena (cualquier
+                otra, ej: base no disponible, se propaga)
+            intervalo_grupo: Segundos extra que el escritor espera para juntar un
+                grupo (0 = solo lo que llegó mientras aplicaba el anterior)
+            max_grupo: Entradas máximas por grupo
+            max_bytes_segmento: Tamaño a partir del cual se rota el segmento
+            espera_maxima: Segundos que agregar espera a que su grupo se aplique
+        """
+        self.directorio = Path(directorio)
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        self.intervalo_grupo = intervalo_grupo
+        self.max_grupo = max_grupo
+        self.max_bytes_segmento = max_bytes_segmento
+        self._aplicar = aplicar
+        self.errores_datos = errores_datos
+        self.espera_maxima = espera_maxima
+
+        self._cond = threading.Condition()
+        self._cola = []           # Entradas escritas que esperan fsync y aplicación
+        self._resultados = {}     # lsn → resultado (o excepción) para quien espera
+        self._abandonados = set() # lsn cuyo agregar dejó de esperar (timeout)
+        self._cerrando = False
+        self._fallo = None        # Error que detuvo al escritor
+
+        self._cuarentena = {e['n'] for e in self._leer(self.directorio / CUARENTENA)}
+        self.ultimo_lsn = self._ultimo_lsn_en_disco()
+        self._lsn_procesado = self.ultimo_lsn
+        self._abrir_segmento()
+
+        self._hilo = threading.Thread(target=self._escritor, daemon=True)
+        self._hilo.start()
+
+    # ==================== ESCRITURA ====================
+
+    def agregar(self, entradas):
+        """
+        Escribe entradas en el diario y espera a que su grupo esté aplicado.
+
+        Args:
+            entradas: Lista de dicts serializables a JSON (curso_id, rut, sesion, ...)
+
+        Returns:
+            list: Resultado de la aplicación por entrada, en el mismo orden
+
+        Raises:
+            Exception: La excepción de la aplicación si el grupo falló
+            RuntimeError: Si el diario está cerrado o detenido por un error
+            TimeoutError: Si el grupo no se aplicó en espera_maxima segundos
+                (la entrada ya está en el diario)
+        """
+        if not entradas:
+            return []
+        with self._cond:
+            if self._fallo is not None:
+                raise RuntimeError(f"El diario está detenido por un error: {self._fallo}") \
+                    from self._fallo
+            if self._cerrando:
+                raise RuntimeError("El diario está cerrado")
+            lsns = []
+            for entrada in entradas:
+                self.ultimo_lsn += 1
+                entrada = dict(entrada, n=self.ultimo_lsn)
+                self._archivo.write(json.dumps(entrada, ensure_ascii=False) + "\n")
+                self._cola.append(entrada)
+                lsns.append(self.ultimo_lsn)
+            self._cond.notify_all()
+
+            limite = time.monotonic() + self.espera_maxima
+            while self._lsn_procesado < lsns[-1]:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    self._abandonados.update(lsns)
+                    raise TimeoutError("El diario no aplicó el check-in a tiempo "
+                                       "(quedó escrito y se aplicará después)")
+                self._cond.wait(restante)
+            resultados = [self._resultados.pop(lsn, None) for lsn in lsns]
+
+        for resultado in resultados:
+            if isinstance(resultado, Exception):
+                raise resultado
+        return resultados
+
+    def _escritor(self):
+        """Hilo del group commit: junta, hace fsync, aplica y despierta a los que esperan."""
+        while True:
+            with self._cond:
+                while not self._cola and not self._cerrando:
+                    self._cond.wait()
+                if not self._cola:
+                    return
+
+                # Ventana de agrupación: más check-ins entran en el mismo fsync
+                limite = time.monotonic() + self.intervalo_grupo
+                while len(self._cola) < self.max_grupo and not self._cerrando:
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        break
+                    self._cond.wait(restante)
+
+                grupo, self._cola = self._cola, []
+                self._archivo.flush()
+                fd = self._archivo.fileno()
+
+            fallo = None
+            try:
+                os.fsync(fd)
+                resultados = self._aplicar_con_reintentos(grupo)
+            except Exception as e:
+                fallo = e
+                resultados = {entrada['n']: e for entrada in grupo}
+
+            with self._cond:
+                for lsn, resultado in resultados.items():
+                    if lsn in self._abandonados:
+                        self._abandonados.discard(lsn)
+                    else:
+                        self._resultados[lsn] = resultado
+                self._lsn_procesado = grupo[-1]['n']
+                if fallo is None and self._archivo.tell() >= self.max_bytes_segmento:
+                    try:
+                        self._rotar()
+                    except Exception as e:
+                        fallo = e
+                if fallo is not None:
+                    self._detener(fallo)
+                self._cond.notify_all()
+                if fallo is not None:
+                    return
+
+    def _aplicar_con_reintentos(self, grupo):
+        """
+        Aplica un grupo del escritor reintentando los errores transitorios
+        (ej: conflicto de escritura); las entradas inválidas van a cuarentena.
+        """
+        for intento in range(REINTENTOS_APLICAR):
+            try:
+                return self._aplicar_seguro(grupo)
+            except Exception:
+                if intento == REINTENTOS_APLICAR - 1:
+                    raise
+                time.sleep(0.1 * 2 ** intento)
+
+    def _detener(self, error):
+        """
+        Marca el diario como detenido y entrega el error a todas las entradas
+        en cola. Llamar con el lock.
+        """
+        self._fallo = error
+        for entrada in self._cola:
+            if entrada['n'] in self._abandonados:
+                self._abandonados.discard(entrada['n'])
+            else:
+                self._resultados[entrada['n']] = error
+        self._cola = []
+        self._lsn_procesado = self.ultimo_lsn
+
+    def _aplicar_seguro(self, grupo, sincronizado=False):
+        """
+        Aplica un grupo; si falla, reintenta de a una entrada.
+
+        Las entradas que fallan solas con una excepción de errores_datos pasan
+        a cuarentena; cualquier otra (transitoria, ej: conflicto de escritura)
+        se propaga y la entrada sigue en el diario para reproducirse.
+
+        Args:
+            grupo: Entradas a aplicar (en orden de lsn)
+            sincronizado: Se pasa a la función de aplicación
+
+        Returns:
+            dict: lsn → resultado, o la excepción si la entrada quedó en cuarentena
+        """
+        try:
+            aplicados = self._aplicar(grupo, sincronizado=sincronizado)
+            return {e['n']: aplicados.get(e['n']) for e in grupo}
+        except self.errores_datos:
+            pass  # Se busca la entrada culpable aplicando de a una
+
+        resultados = {}
+        for entrada in grupo:
+            try:
+                resultados.update(self._aplicar([entrada], sincronizado=sincronizado))
+            except self.errores_datos as e:
+                self._poner_en_cuarentena(entrada, e)
+                resultados[entrada['n']] = e
+        return resultados
+
+    def _poner_en_cuarentena(self, entrada, error):
+        """Registra la entrada en cuarentena.jsonl (con fsync) y la excluye del diario."""
+        with open(self.directorio / CUARENTENA, "a", encoding="utf-8") as archivo:
+            archivo.write(json.dumps(dict(entrada, error=str(error)), ensure_ascii=False) + "\n")
+            archivo.flush()
+            os.fsync(archivo.fileno())
+        self._cuarentena.add(entrada['n'])
+
+    def _abrir_segmento(self):
+        """Abre para append el último segmento, o uno nuevo si no hay."""
+        segmentos = self._segmentos()
+        path = segmentos[-1] if segmentos else \
+            self.directorio / f"segmento_{self.ultimo_lsn + 1:012d}.jsonl"
+        self._path_actual = path
+        self._archivo = open(path, "a", encoding="utf-8")
+        # Una línea cortada por una caída no debe pegarse a la siguiente entrada
+        if self._archivo.tell() > 0:
+            with open(path, "rb") as archivo:
+                archivo.seek(-1, os.SEEK_END)
+                if archivo.read(1) != b"\n":
+                    self._archivo.write("\n")
+
+    def _rotar(self):
+        """Cierra el segmento actual (con fsync) y abre uno nuevo. Llamar con el lock."""
+        self._archivo.flush()
+        os.fsync(self._archivo.fileno())
+        self._archivo.close()
+        self._path_actual = self.directorio / f"segmento_{self.ultimo_lsn + 1:012d}.jsonl"
+        self._archivo = open(self._path_actual, "a", encoding="utf-8")
+
+    def rotar(self):
+        """Fuerza la rotación si el segmento actual tiene entradas."""
+        with self._cond:
+            if self._archivo.tell() > 0:
+                self._rotar()
+
+    def cerrar(self):
+        """Aplica lo pendiente, detiene el escritor y cierra el segmento."""
+        with self._cond:
+            if self._cerrando:
+                return
+            self._cerrando = True
+            self._cond.notify_all()
+        self._hilo.join(timeout=10)
+        with self._cond:
+            self._archivo.flush()
+            os.fsync(self._archivo.fileno())
+            self._archivo.close()
+
+    # ==================== LECTURA Y RECUPERACIÓN ====================
+
+    def _segmentos(self):
+        """Segmentos en orden de lsn (sin el compactado)."""
+        return sorted(self.directorio.glob("segmento_*.jsonl"))
+
+    @staticmethod
+    def _leer(path):
+        """Entradas de un segmento; una línea incompleta (caída a mitad de escritura) se omite."""
+        if not os.path.exists(path):
+            return
+        with open(path, encoding="utf-8") as archivo:
+            for linea in archivo:
+                try:
+                    yield json.loads(linea)
+                except json.JSONDecodeError:
+                    continue
+
+    def _ultimo_lsn_en_disco(self):
+        ultimo = 0
+        for path in [self.directorio / COMPACTADO] + self._segmentos():
+            for entrada in self._leer(path):
+                ultimo = max(ultimo, entrada['n'])
+        return ultimo
+
+    def entradas(self, desde_lsn=0, hasta=None):
+        """
+        Recorre el diario en orden de lsn (sin las entradas en cuarentena).
+
+        Args:
+            desde_lsn: Solo entradas con lsn mayor
+            hasta: Solo entradas con fecha_registro ISO <= hasta (datetime o str)
+
+        Yields:
+            tuple: (dict entrada, bool viene del compactado)
+        """
+        limite = hasta.isoformat() if hasattr(hasta, 'isoformat') else hasta
+        fuentes = [(self.directorio / COMPACTADO, True)] + \
+            [(path, False) for path in self._segmentos()]
+        for path, compactada in fuentes:
+            for entrada in self._leer(path):
+                if entrada['n'] <= desde_lsn or entrada['n'] in self._cuarentena:
+                    continue
+                if limite is not None and entrada.get('fecha_registro', '') > limite:
+                    continue
+                yield entrada, compactada
+
+    def reproducir(self, desde_lsn=0, hasta=None):
+        """
+        Aplica las entradas posteriores al checkpoint (recuperación tras una caída,
+        o reconstrucción a un punto en el tiempo con 'hasta').
+
+        Las entradas del compactado se aplican como sincronizadas. Una entrada
+        inválida (errores_datos) pasa a cuarentena en lugar de interrumpir la
+        reproducción.
+
+        Returns:
+            int: Entradas aplicadas
+        """
+        aplicadas = 0
+        grupo, compactado = [], None
+        for entrada, compactada in self.entradas(desde_lsn, hasta):
+            if grupo and (len(grupo) >= self.max_grupo or compactada != compactado):
+                aplicadas += self._reproducir_grupo(grupo, compactado)
+                grupo = []
+            grupo.append(entrada)
+            compactado = compactada
+        if grupo:
+            aplicadas += self._reproducir_grupo(grupo, compactado)
+        return aplicadas
+
+    def _reproducir_grupo(self, grupo, sincronizado):
+        resultados = self._aplicar_seguro(grupo, sincronizado=sincronizado)
+        return sum(not isinstance(r, Exception) for r in resultados.values())
+
+    def compactar(self, sincronizado):
+        """
+        Pliega en compactado.jsonl los segmentos cerrados ya sincronizados.
+
+        Se compacta en orden: el primer segmento que no cumple detiene el
+        proceso, así el compactado siempre cubre un prefijo del diario.
+
+        Args:
+            sincronizado: Función (lsn_desde, lsn_hasta) → bool; True si todas
+                las asistencias escritas en ese rango ya están en Sheets
+
+        Returns:
+            int: Segmentos compactados
+        """
+        with self._cond:
+            cerrados = [p for p in self._segmentos() if p != self._path_actual]
+            procesado = self._lsn_procesado
+
+        compactados = 0
+        for path in cerrados:
+            entradas = list(self._leer(path))
+            if entradas:
+                desde, hasta = entradas[0]['n'], entradas[-1]['n']
+                if hasta > procesado or not sincronizado(desde, hasta):
+                    break
+
+                # Las entradas en cuarentena nunca llegaron a la base ni a Sheets
+                base = {_clave(e): e for e in self._leer(self.directorio / COMPACTADO)}
+                for entrada in entradas:
+                    if entrada['n'] not in self._cuarentena:
+                        base[_clave(entrada)] = entrada
+                temporal = self.directorio / (COMPACTADO + ".tmp")
+                with open(temporal, "w", encoding="utf-8") as archivo:
+                    for entrada in sorted(base.values(), key=lambda e: e['n']):
+                        archivo.write(json.dumps(entrada, ensure_ascii=False) + "\n")
+                    archivo.flush()
+                    os.fsync(archivo.fileno())
+                os.replace(temporal, self.directorio / COMPACTADO)
+
+            os.remove(path)
+            compactados += 1
+        return compactados
+
+    def get_estadisticas(self):
+        """
+        Returns:
+            dict: {'ultimo_lsn': int, 'segmentos': int, 'bytes': int, 'cuarentena': int,
+                   'fallo': str | None}
+        """
+        with self._cond:
+            paths = self._segmentos() + [self.directorio / COMPACTADO]
+            return {
+                'ultimo_lsn': self.ultimo_lsn,
+                'segmentos': len(paths) - 1,
+                'bytes': sum(p.stat().st_size for p in paths if p.exists()),
+                'cuarentena': len(self._cuarentena),
+                'fallo': None if self._fallo is None else str(self._fallo)
+            }
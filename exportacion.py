@@ -0,0 +1,188 @@
+"""
+Exportación Masiva de Reportes (ZIP)
+====================================
+
+Genera en un solo trabajo todos los reportes IST Educa, MK Capacitaciones
+y de registros para los cursos de una región y/o rango de fechas, y los
+entrega en un único ZIP.
+
+Características:
+- Una sola pasada sobre los datos: un join asistencias × registros y un groupby
+- Generación de workbooks repartida en un pool de procesos
+- Corre en segundo plano; el progreso se consulta sin bloquear otras sesiones
+
+Uso:
+    from exportacion import ExportacionMasiva
+
+    job = ExportacionMasiva(df_cursos, df_registros, df_asistencias, region="Región del Maule")
+    job.iniciar()
+    job.progreso()   # (hechos, total)
+    job.zip_bytes    # cuando job.estado == 'listo'
+"""
+
+import io
+import zipfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import pandas as pd
+
+from indices import sesiones_en_rango
+from validacion import codificar_ruts
+from reportes import (generar_excel_ist, generar_excel_mk, generar_excel_registros,
+                      fecha_sesion_curso)
+
+
+def _generar_archivo(tipo, df, fecha_sesion=None):
+    """Genera un workbook en un proceso worker (función top-level, picklable)."""
+    if tipo == 'ist':
+        return generar_excel_ist(df).getvalue()
+    if tipo == 'mk':
+        return generar_excel_mk(df, fecha_sesion=fecha_sesion).getvalue()
+    return generar_excel_registros(df).getvalue()
+
+
+def filtrar_cursos(df_cursos, region=None, desde=None, hasta=None):
+    """
+    Selecciona los cursos de una región con al menos una sesión en el rango,
+    junto con los pares (curso_id, sesion) que caen en él.
+
+    Args:
+        df_cursos: DataFrame con configuración de cursos (fechas parseadas)
+        region: Región a exportar (None = todas)
+        desde: datetime.date inicial del rango (None = sin límite)
+        hasta: datetime.date final del rango (None = sin límite)
+
+    Returns:
+        tuple: (pd.DataFrame, pd.DataFrame | None) - cursos seleccionados y
+        sesiones en el rango (curso_id, sesion); None si no hay rango
+    """
+    df = df_cursos
+    if region and 'region' in df.columns:
+        df = df[df['region'] == region]
+
+    if df.empty or (desde is None and hasta is None):
+        return df, None
+
+    # Un curso entra si cualquiera de sus fechas de sesión cae en el rango
+    sesiones = sesiones_en_rango(df, desde or hasta, hasta or desde)
+    return df[df['curso_id'].astype(str).isin(sesiones['curso_id'])], sesiones
+
+
+class ExportacionMasiva:
+    """
+    Trabajo en segundo plano que genera todos los reportes y los empaqueta en un ZIP.
+    """
+
+    def __init__(self, df_cursos, df_registros, df_asistencias,
+                 region=None, desde=None, hasta=None, max_workers=None):
+        """
+        Prepara el trabajo (no genera nada hasta llamar iniciar()).
+
+        Args:
+            df_cursos: DataFrame con configuración de cursos
+            df_registros: DataFrame con registros de inscripción
+            df_asistencias: DataFrame con asistencias (curso_id, rut, sesion)
+            region: Región a exportar (None = todas)
+            desde: Fecha inicial del rango (None = sin límite)
+            hasta: Fecha final del rango (None = sin límite)
+            max_workers: Procesos del pool (None = núcleos disponibles)
+        """
+        self.max_workers = max_workers
+        self.estado = 'pendiente'
+        self.error = None
+        self.zip_bytes = None
+        self.iniciado_en = None
+        self.terminado_en = None
+        self._hechos = 0
+        self._lock = threading.Lock()
+        cursos, sesiones = filtrar_cursos(df_cursos, region, desde, hasta)
+        self._tareas = self._planificar(cursos, df_registros, df_asistencias, sesiones)
+
+    def _planificar(self, df_cursos, df_registros, df_asistencias, sesiones=None):
+        """
+        Arma la lista de archivos a generar con una sola pasada sobre los datos.
+
+        Args:
+            df_cursos: Cursos seleccionados (filtrar_cursos)
+            df_registros: DataFrame con registros de inscripción
+            df_asistencias: DataFrame con asistencias
+            sesiones: Pares (curso_id, sesion) a reportar (None = todas)
+
+        Returns:
+            list: Tuplas (ruta_en_zip, tipo, df, fecha_sesion)
+        """
+        if df_cursos.empty or df_registros.empty or 'curso_id' not in df_registros.columns:
+            return []
+
+        cursos = df_cursos.assign(_curso=df_cursos['curso_id'].astype(str)).set_index('_curso')
+        cursos = cursos[~cursos.index.duplicated()]
+        reg = df_registros.assign(_curso=df_registros['curso_id'].astype(str),
+                                  _rut=codificar_ruts(df_registros['rut']))
+        reg = reg[reg['_curso'].isin(cursos.index)]
+        tareas = []
+
+        # Registros por curso
+        for curso_id, grupo in reg.groupby('_curso', sort=True):
+            tareas.append((f"{curso_id}/registros_curso_{curso_id}.xlsx", 'registros',
+                           grupo.drop(columns=['_curso', '_rut']), None))
+
+        # IST / MK por (curso, sesión) con asistentes
+        if not df_asistencias.empty:
+            asis = pd.DataFrame({
+                '_curso': df_asistencias['curso_id'].astype(str),
+                '_rut': codificar_ruts(df_asistencias['rut']),
+                '_sesion': pd.to_numeric(df_asistencias['sesion'], errors='coerce'),
+            }).dropna(subset=['_sesion', '_rut']).drop_duplicates()
+            if sesiones is not None:
+                # Solo las sesiones dentro del rango pedido
+                asis = asis.merge(pd.DataFrame({'_curso': sesiones['curso_id'],
+                                                '_sesion': sesiones['sesion'].astype(float)}),
+                                  on=['_curso', '_sesion'])
+            asistentes = asis.merge(reg, on=['_curso', '_rut'])
+
+            for (curso_id, sesion), grupo in asistentes.groupby(['_curso', '_sesion'], sort=True):
+                sesion = int(sesion)
+                df_rep = grupo.drop(columns=['_curso', '_rut', '_sesion'])
+                fecha = fecha_sesion_curso(cursos.loc[curso_id], sesion)
+                tareas.append((f"{curso_id}/IST_{curso_id}_s{sesion}.xlsx", 'ist', df_rep, None))
+                tareas.append((f"{curso_id}/MK_{curso_id}_s{sesion}.xlsx", 'mk', df_rep, fecha))
+
+        return tareas
+
+    def iniciar(self):
+        """Lanza la generación en un thread de fondo."""
+        self.estado = 'en_curso'
+        self.iniciado_en = datetime.now()
+        threading.Thread(target=self._ejecutar, daemon=True).start()
+
+    def progreso(self):
+        """
+        Returns:
+            tuple: (archivos_generados, total_archivos)
+        """
+        return self._hechos, len(self._tareas)
+
+    def _ejecutar(self):
+        """Reparte los workbooks en el pool de procesos y arma el ZIP."""
+        try:
+            buf = io.BytesIO()
+            # 'spawn' evita hacer fork del servidor de Streamlit (threads, DuckDB)
+            contexto = multiprocessing.get_context('spawn')
+            with zipfile.ZipFile(buf, 'w', zipfile.ZIP_STORED) as zf, \
+                    ProcessPoolExecutor(max_workers=self.max_workers, mp_context=contexto) as pool:
+                futuros = {pool.submit(_generar_archivo, tipo, df, fecha): ruta
+                           for ruta, tipo, df, fecha in self._tareas}
+                for futuro in as_completed(futuros):
+                    zf.writestr(futuros[futuro], futuro.result())
+                    with self._lock:
+                        self._hechos += 1
+            self.zip_bytes = buf.getvalue()
+            self.estado = 'listo'
+        except Exception as e:
+            self.error = str(e)
+            self.estado = 'error'
+        finally:
+            self.terminado_en = datetime.now()
@@ -0,0 +1,167 @@
+"""
+Importación Masiva de Inscripciones (CSV / XLSX)
+================================================
+
+Las empresas envían planillas con 50–300 trabajadores. En lugar de pasar
+a cada persona por el formulario (un POST + rerun por inscripción), el
+admin sube la planilla, se valida completa de una vez y se envía en lotes
+con la acción addRegistros del Apps Script.
+
+Características:
+- Lectura de CSV o XLSX con encabezados tolerantes (mayúsculas, tildes, espacios)
+- Validación por columnas: campos obligatorios, RUT, RUT empresa, email,
+  comuna de la región, sexo / nacionalidad / rol
+- Duplicados dentro de la planilla y contra las inscripciones existentes
+  (índice por curso y RUT)
+- Cupo: solo las primeras filas válidas que caben en el curso
+- Reporte por fila (número de fila de la planilla, estado y detalle)
+
+Uso:
+    from importacion import leer_planilla, validar_importacion
+
+    df = leer_planilla(archivo_subido)
+    reporte = validar_importacion(df, curso, indice, inscritos, comunas_por_region, catalogos)
+    registros = registros_para_envio(reporte, curso_id)
+"""
+
+import re
+import unicodedata
+from datetime import datetime
+
+import pandas as pd
+
+from validacion import (normalizar_ruts, ruts_validos, emails_validos, oficializar,
+                        comunas_oficiales)
+
+# Columnas de la hoja Inscripciones que aporta la planilla
+COLUMNAS_IMPORTACION = ['rut', 'nombres', 'apellido_paterno', 'apellido_materno',
+                        'nacionalidad', 'email', 'sexo', 'rol', 'rut_empresa',
+                        'razon_social', 'region', 'comuna', 'direccion']
+
+# Encabezados alternativos habituales en las planillas de las empresas
+_SINONIMOS = {
+    'run': 'rut', 'rut_trabajador': 'rut', 'nombre': 'nombres',
+    'correo': 'email', 'correo_electronico': 'email', 'e_mail': 'email',
+    'genero': 'sexo', 'rol_trabajador': 'rol', 'rut_de_la_empresa': 'rut_empresa',
+    'empresa': 'razon_social', 'razon_social_empresa': 'razon_social',
+}
+
+def _normalizar_encabezado(nombre):
+    """'Apellido Paterno ' → 'apellido_paterno' (sin tildes ni símbolos)."""
+    texto = unicodedata.normalize('NFKD', str(nombre)).encode('ascii', 'ignore').decode()
+    texto = re.sub(r'[^a-z0-9]+', '_', texto.lower()).strip('_')
+    return _SINONIMOS.get(texto, texto)
+
+
+def leer_planilla(archivo):
+    """
+    Lee la planilla subida por el admin.
+
+    Args:
+        archivo: Archivo de st.file_uploader (CSV o XLSX)
+
+    Returns:
+        pd.DataFrame: Filas como texto, con encabezados normalizados
+    """
+    if archivo.name.lower().endswith(('.xlsx', '.xlsm')):
+        df = pd.read_excel(archivo, dtype=str, engine='openpyxl')
+    else:
+        df = pd.read_csv(archivo, dtype=str, sep=None, engine='python', encoding='utf-8-sig')
+    df.columns = [_normalizar_encabezado(c) for c in df.columns]
+    return df.dropna(how='all').reset_index(drop=True)
+
+
+def validar_importacion(df, curso, indice, inscritos_actuales, comunas_por_region, catalogos):
+    """
+    Valida una planilla completa contra las reglas del formulario.
+
+    Args:
+        df: DataFrame de leer_planilla
+        curso: dict con al menos curso_id y cupo_maximo
+        indice: Objeto con .buscar(curso_id, rut) (ej: IndiceInscritos)
+        inscritos_actuales: Inscritos que ya tiene el curso
+        comunas_por_region: dict región → lista de comunas
+        catalogos: dict columna → valores permitidos (ej: {'sexo': SEXO, 'rol': ROLES})
+
+    Returns:
+        pd.DataFrame: Columnas normalizadas + 'fila' (número en la planilla),
+        'estado' ('VALIDO' o 'ERROR') y 'detalle'
+    """
+    reporte = df.reindex(columns=COLUMNAS_IMPORTACION).astype('string').fillna('')
+    for col in reporte.columns:
+        reporte[col] = reporte[col].str.strip()
+    # Misma normalización que el formulario: texto en mayúsculas, email tal cual
+    mayusculas = [c for c in COLUMNAS_IMPORTACION if c not in ('email', 'region', 'comuna')]
+    reporte[mayusculas] = reporte[mayusculas].apply(lambda s: s.str.upper())
+    reporte['rut'] = normalizar_ruts(reporte['rut'])
+    reporte['rut_empresa'] = normalizar_ruts(reporte['rut_empresa'])
+    if reporte.empty:
+        return reporte.assign(fila=[], estado=[], detalle=[])
+
+    errores = pd.DataFrame(index=reporte.index)
+
+    vacios = reporte.eq('')
+    errores['obligatorios'] = vacios.any(axis=1).map(
+        {True: 'Campos obligatorios vacíos', False: ''})
+
+    errores['rut'] = (~ruts_validos(reporte['rut']) & ~vacios['rut']).map(
+        {True: 'RUT inválido', False: ''})
+    errores['rut_empresa'] = (~ruts_validos(reporte['rut_empresa']) & ~vacios['rut_empresa']).map(
+        {True: 'RUT empresa inválido', False: ''})
+
+    errores['email'] = (~emails_validos(reporte['email']) & ~vacios['email']).map(
+        {True: 'Correo electrónico inválido', False: ''})
+
+    # Región y comuna comparadas sin tildes; se guardan con el nombre oficial
+    reporte['region'] = oficializar(reporte['region'], comunas_por_region).fillna(reporte['region'])
+    comuna = comunas_oficiales(reporte['region'], reporte['comuna'], comunas_por_region)
+    errores['comuna'] = (comuna.isna() & ~vacios['comuna']).map(
+        {True: 'Comuna no corresponde a la región', False: ''})
+    reporte['comuna'] = comuna.fillna(reporte['comuna'])
+
+    for col, permitidos in catalogos.items():
+        valor = oficializar(reporte[col], permitidos)
+        errores[col + '_catalogo'] = (valor.isna() & ~vacios[col]).map(
+            {True: f'{col} no reconocido', False: ''})
+        reporte[col] = valor.fillna(reporte[col])
+
+    curso_id = str(curso['curso_id'])
+    ya_inscrito = reporte['rut'].map(lambda r: indice.buscar(curso_id, r) is not None)
+    errores['inscrito'] = ya_inscrito.map({True: 'Ya inscrito en el curso', False: ''})
+    errores['duplicado'] = (reporte['rut'].duplicated() & ~vacios['rut']).map(
+        {True: 'RUT repetido en la planilla', False: ''})
+
+    errores = errores.astype(object)
+    detalle = (errores + '; ').where(errores.ne(''), '').sum(axis=1).astype(str) \
+        .str.removesuffix('; ')
+
+    # Cupo: las filas válidas entran en orden hasta llenar el curso
+    valido = detalle.eq('')
+    cupo_maximo = pd.to_numeric(curso.get('cupo_maximo'), errors='coerce')
+    if pd.isna(cupo_maximo):
+        # Celda vacía o no numérica en Config: no hay cupo contra el cual validar
+        detalle = detalle.mask(valido, 'Curso sin cupo configurado')
+    else:
+        cupos = max(0, int(cupo_maximo) - int(inscritos_actuales))
+        sin_cupo = valido & (valido.cumsum() > cupos)
+        detalle = detalle.mask(sin_cupo, 'Sin cupo disponible en el curso')
+
+    reporte.insert(0, 'fila', reporte.index + 2)  # Fila 1 = encabezados
+    reporte['estado'] = detalle.eq('').map({True: 'VALIDO', False: 'ERROR'})
+    reporte['detalle'] = detalle
+    return reporte
+
+
+def registros_para_envio(reporte, curso_id):
+    """
+    Convierte las filas válidas del reporte al formato de la hoja Inscripciones.
+
+    Returns:
+        list: dicts listos para addRegistros
+    """
+    validos = reporte[reporte['estado'] == 'VALIDO']
+    registros = validos[COLUMNAS_IMPORTACION].assign(
+        fecha_registro=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        curso_id=curso_id
+    )
+    return registros.to_dict('records')
@@ -0,0 +1,231 @@
+"""
+Índices en Memoria para el Camino Caliente de Asistencia
+========================================================
+
+Estructuras precalculadas que evitan recorrer la configuración de cursos
+o la tabla de inscripciones completa en cada rerun de Streamlit.
+
+Características:
+- Sesiones del día calculadas con comparaciones vectorizadas por columna
+- Sesiones de un rango de fechas en una pasada (columnas de fecha en formato largo)
+- Índice fecha → [(curso_id, sesion)] materializado una vez por día y revisión
+- Índice hash (curso_id, rut) → datos del participante para validar en O(1)
+
+Uso:
+    from indices import sesiones_del_dia, sesiones_en_rango, indice_sesiones, IndiceInscritos
+
+    df_hoy = sesiones_del_dia(df_cursos, date.today())
+    pares = sesiones_en_rango(df_cursos, desde, hasta)  # curso_id, sesion
+    indice = indice_sesiones(df_hoy, date.today())  # {date: [(curso_id, sesion)]}
+
+    inscritos = IndiceInscritos(df_registros)
+    datos = inscritos.buscar("RM-Mar26", "12345678-k")
+"""
+
+import pandas as pd
+
+from validacion import codificar_rut, codificar_ruts
+
+# Columnas de fecha que definen una sesión explícita, en orden de prioridad
+_COLUMNAS_SESION = [('fecha_jornada', 1), ('fecha_sesion_1', 1),
+                    ('fecha_sesion_2', 2), ('fecha_sesion_3', 3)]
+
+
+def _como_fecha(serie):
+    """Convierte una columna a datetime normalizado (sin hora ni zona)."""
+    fechas = pd.to_datetime(serie, dayfirst=True, errors='coerce')
+    if fechas.dt.tz is not None:
+        fechas = fechas.dt.tz_convert(None)
+    return fechas.dt.normalize()
+
+
+def sesiones_del_dia(df_cursos, dia):
+    """
+    Filtra los cursos que tienen sesión en un día dado.
+
+    Prioridad por curso: fecha_jornada (sesión 1), luego fecha_sesion_1/2/3,
+    y como fallback el rango fecha_inicio – fecha_fin (sesión 1).
+
+    Args:
+        df_cursos: DataFrame con configuración de cursos
+        dia: datetime.date a evaluar
+
+    Returns:
+        pd.DataFrame: Cursos con sesión ese día incluyendo 'sesion_hoy' y
+        'fecha_sesion_hoy' (vacío si no hay ninguno)
+    """
+    if df_cursos.empty:
+        return pd.DataFrame()
+
+    dia_ts = pd.Timestamp(dia)
+    sesion = pd.Series(0, index=df_cursos.index)
+    fecha = pd.Series(pd.NaT, index=df_cursos.index, dtype='datetime64[ns]')
+    pendiente = pd.Series(True, index=df_cursos.index)
+
+    for col, num in _COLUMNAS_SESION:
+        if col not in df_cursos.columns:
+            continue
+        fechas_col = _como_fecha(df_cursos[col])
+        coincide = pendiente & (fechas_col == dia_ts)
+        sesion = sesion.mask(coincide, num)
+        fecha = fecha.mask(coincide, fechas_col)
+        pendiente &= ~coincide
+
+    # Fallback: el día está dentro del rango fecha_inicio – fecha_fin
+    if 'fecha_inicio' in df_cursos.columns and 'fecha_fin' in df_cursos.columns:
+        inicio = _como_fecha(df_cursos['fecha_inicio'])
+        fin = _como_fecha(df_cursos['fecha_fin'])
+        coincide = pendiente & (inicio <= dia_ts) & (dia_ts <= fin)
+        sesion = sesion.mask(coincide, 1)
+        fecha = fecha.mask(coincide, inicio)
+
+    con_sesion = sesion > 0
+    if not con_sesion.any():
+        return pd.DataFrame()
+
+    df_dia = df_cursos[con_sesion].copy()
+    df_dia['sesion_hoy'] = sesion[con_sesion].astype(int)
+    df_dia['fecha_sesion_hoy'] = fecha[con_sesion]
+    return df_dia.reset_index(drop=True)
+
+
+def sesiones_en_rango(df_cursos, desde, hasta):
+    """
+    Pares (curso_id, sesion) con sesión en algún día entre desde y hasta.
+
+    Equivale a aplicar sesiones_del_dia a cada día del rango, pero sin
+    recorrer los días: las columnas de fecha se pasan a formato largo una
+    vez y se filtran por rango. El fallback fecha_inicio – fecha_fin aporta
+    la sesión 1 solo si el rango incluye días del curso sin fecha explícita.
+
+    Args:
+        df_cursos: DataFrame con configuración de cursos
+        desde: datetime.date inicial (inclusive)
+        hasta: datetime.date final (inclusive)
+
+    Returns:
+        pd.DataFrame: Columnas curso_id (str) y sesion (int), sin duplicados
+    """
+    if df_cursos.empty:
+        return pd.DataFrame({'curso_id': pd.Series(dtype=str), 'sesion': pd.Series(dtype=int)})
+
+    desde_ts, hasta_ts = pd.Timestamp(desde), pd.Timestamp(hasta)
+    base = pd.DataFrame({'_fila': range(len(df_cursos)),
+                         'curso_id': df_cursos['curso_id'].astype(str).to_numpy()})
+
+    # Una fila por (curso, fecha explícita); ante fechas repetidas gana la
+    # columna de mayor prioridad, igual que en sesiones_del_dia
+    largas = [base.assign(sesion=num, fecha=_como_fecha(df_cursos[col]).to_numpy())
+              for col, num in _COLUMNAS_SESION if col in df_cursos.columns]
+    if largas:
+        explicitas = (pd.concat(largas, ignore_index=True)
+                      .dropna(subset=['fecha'])
+                      .drop_duplicates(subset=['_fila', 'fecha'], keep='first'))
+        explicitas = explicitas[(explicitas['fecha'] >= desde_ts) & (explicitas['fecha'] <= hasta_ts)]
+    else:
+        explicitas = base.assign(sesion=0, fecha=pd.NaT).iloc[0:0]
+    partes = [explicitas[['curso_id', 'sesion']]]
+
+    # Fallback: días del rango dentro de fecha_inicio – fecha_fin sin fecha explícita
+    if 'fecha_inicio' in df_cursos.columns and 'fecha_fin' in df_cursos.columns:
+        inicio = _como_fecha(df_cursos['fecha_inicio']).to_numpy()
+        fin = _como_fecha(df_cursos['fecha_fin']).to_numpy()
+        rango = base.assign(inicio=pd.Series(inicio).clip(lower=desde_ts),
+                            fin=pd.Series(fin).clip(upper=hasta_ts))
+        rango['dias'] = (rango['fin'] - rango['inicio']).dt.days + 1
+
+        cubiertos = explicitas.merge(rango[['_fila', 'inicio', 'fin']], on='_fila')
+        cubiertos = cubiertos[(cubiertos['fecha'] >= cubiertos['inicio']) &
+                              (cubiertos['fecha'] <= cubiertos['fin'])]
+        rango['cubiertos'] = rango['_fila'].map(
+            cubiertos.groupby('_fila')['fecha'].nunique()).fillna(0)
+
+        fallback = rango[rango['dias'].fillna(0) > rango['cubiertos']]
+        partes.append(fallback[['curso_id']].assign(sesion=1))
+
+    return (pd.concat(partes, ignore_index=True)
+            .astype({'curso_id': str, 'sesion': int})
+            .drop_duplicates()
+            .reset_index(drop=True))
+
+
+def indice_sesiones(df_dia, dia):
+    """
+    Construye el índice fecha → [(curso_id, sesion)] a partir de sesiones_del_dia.
+
+    Args:
+        df_dia: Resultado de sesiones_del_dia
+        dia: datetime.date al que corresponde
+
+    Returns:
+        dict: {dia: [(curso_id, sesion), ...]}
+    """
+    if df_dia.empty:
+        return {dia: []}
+    return {dia: list(zip(df_dia['curso_id'], df_dia['sesion_hoy'].astype(int)))}
+
+
+# Campos del registro que se muestran al confirmar asistencia
+CAMPOS_PARTICIPANTE = ['rut', 'nombres', 'apellido_paterno', 'apellido_materno', 'email']
+
+
+class IndiceInscritos:
+    """
+    Índice hash (curso_id, RUT codificado) → datos del participante.
+
+    Se construye una vez por revisión del snapshot de registros; cada
+    validación posterior es un lookup en un dict.
+    """
+
+    def __init__(self, df_registros, revision=None):
+        """
+        Construye el índice.
+
+        Args:
+            df_registros: DataFrame con registros de inscripciones
+            revision: Revisión del snapshot del que proviene (informativo)
+        """
+        self.revision = revision
+        self._datos = {}
+
+        if df_registros.empty or 'rut' not in df_registros.columns \
+                or 'curso_id' not in df_registros.columns:
+            return
+
+        campos = [c for c in CAMPOS_PARTICIPANTE if c in df_registros.columns]
+        df = df_registros[['curso_id'] + campos].copy()
+        df['_curso'] = df['curso_id'].astype(str)
+        df['_rut'] = codificar_ruts(df['rut'])
+        df = df.dropna(subset=['_rut'])  # Sin forma de RUT: nunca pasaría la validación
+
+        # Ante duplicados gana la primera inscripción (igual que antes con iloc[0])
+        df = df.drop_duplicates(subset=['_curso', '_rut'], keep='first')
+
+        claves = zip(df['_curso'], df['_rut'].astype('int64'))
+        registros = df[['curso_id'] + campos].to_dict('records')
+        self._datos = dict(zip(claves, registros))
+
+    def buscar(self, curso_id, rut):
+        """
+        Busca un participante inscrito.
+
+        Args:
+            curso_id: ID del curso
+            rut: RUT del participante (con o sin puntos, guión, k minúscula)
+
+        Returns:
+            dict | None: Datos del participante o None si no está inscrito
+        """
+        return self._datos.get((str(curso_id), codificar_rut(rut)))
+
+    def agregar(self, datos):
+        """
+        Incorpora un participante al índice (ej: inscripción tardía).
+
+        Args:
+            datos: dict con al menos 'curso_id' y 'rut'
+        """
+        self._datos[(str(datos['curso_id']), codificar_rut(datos['rut']))] = datos
+
+    def __len__(self):
+        return len(self._datos)
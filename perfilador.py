@@ -0,0 +1,266 @@
+"""
+Perfilador de Reruns de Streamlit
+=================================
+
+Una página lenta puede deberse al Apps Script, a pandas, a DuckDB o al
+render. Este módulo mide por fase cada rerun (descarga de datos, filtrado,
+validación, llamadas al buffer, generación de Excel) y muestra al admin
+las fases que más tiempo consumen.
+
+Características:
+- Opt-in: apagado no mide nada (cada fase cuesta una comparación)
+- Ventana móvil de tiempos por fase, compartida por todas las sesiones
+- Top de fases por tiempo acumulado en la ventana (media, p95, máximo)
+- Captura con cProfile de un rerun muestreado (el próximo, o 1 de cada N)
+  en un archivo .prof (pstats), abrible con snakeviz o flameprof para ver
+  la flamegraph
+- Panel en la barra lateral del admin
+
+Uso:
+    from perfilador import get_perfilador, panel_perfilador
+
+    perfil = get_perfilador()
+    with perfil.rerun("asistencia"):
+        with perfil.fase("datos: cursos"):
+            df_cursos = get_config_data()
+
+    panel_perfilador()  # Dentro del bloque admin
+"""
+
+import cProfile
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+import streamlit as st
+
+
+class PerfiladorReruns:
+    """
+    Tiempos por fase de los reruns, en una ventana móvil thread-safe.
+    """
+
+    def __init__(self, ventana=200, directorio="perfiles", max_archivos=10):
+        """
+        Args:
+            ventana: Mediciones que se conservan por fase
+            directorio: Carpeta donde se guardan las capturas .prof
+            max_archivos: Capturas que se conservan (las más antiguas se borran)
+        """
+        self.activo = False
+        self.ventana = ventana
+        self.directorio = directorio
+        self.muestreo = 0  # Capturar 1 de cada N reruns (0 = solo a pedido)
+        self._tiempos = {}  # fase → deque de segundos
+        self._archivos = deque(maxlen=max_archivos)
+        self._reruns = 0
+        self._capturar_proximo = False
+        self._lock = threading.Lock()
+        self._lock_captura = threading.Lock()  # Un solo cProfile a la vez
+
+    # ==================== MEDICIÓN ====================
+
+    def registrar(self, fase, segundos):
+        """Agrega una medición a la ventana de la fase."""
+        with self._lock:
+            tiempos = self._tiempos.get(fase)
+            if tiempos is None:
+                tiempos = self._tiempos[fase] = deque(maxlen=self.ventana)
+            tiempos.append(segundos)
+
+    @contextmanager
+    def fase(self, nombre):
+        """
+        Mide el bloque como una fase del rerun.
+
+        Se registra aunque el bloque termine con st.stop(), st.rerun() o
+        una excepción.
+        """
+        if not self.activo:
+            yield
+            return
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.registrar(nombre, time.perf_counter() - inicio)
+
+    def medir(self, nombre, funcion, *args, **kwargs):
+        """
+        Ejecuta funcion(*args, **kwargs) como una fase (útil dentro de lambdas,
+        ej: la data de un st.download_button).
+
+        Returns:
+            object: Resultado de la función
+        """
+        with self.fase(nombre):
+            return funcion(*args, **kwargs)
+
+    def iniciar_rerun(self, pagina):
+        """
+        Marca el inicio de un rerun completo de la página.
+
+        Si toca muestrear, el rerun se perfila con cProfile.
+
+        Args:
+            pagina: Nombre de la página (prefijo de la fase y del archivo)
+
+        Returns:
+            tuple | None: Estado a pasar a terminar_rerun (None si está apagado)
+        """
+        if not self.activo:
+            return None
+        with self._lock:
+            self._reruns += 1
+            capturar = self._capturar_proximo or \
+                (self.muestreo > 0 and self._reruns % self.muestreo == 0)
+
+        perfil = None
+        if capturar and self._lock_captura.acquire(blocking=False):
+            self._capturar_proximo = False
+            perfil = cProfile.Profile()
+            try:
+                perfil.enable()
+            except ValueError:  # Otro perfilador activo en el proceso
+                self._lock_captura.release()
+                perfil = None
+        return pagina, time.perf_counter(), perfil
+
+    def terminar_rerun(self, estado):
+        """
+        Registra el tiempo total del rerun y guarda la captura si la hubo.
+
+        Args:
+            estado: Valor devuelto por iniciar_rerun
+        """
+        if estado is None:
+            return
+        pagina, inicio, perfil = estado
+        self.registrar(f"{pagina}: rerun completo", time.perf_counter() - inicio)
+        if perfil is None:
+            return
+        try:
+            perfil.disable()
+            self._guardar_captura(pagina, perfil)
+        finally:
+            self._lock_captura.release()
+
+    @contextmanager
+    def rerun(self, pagina):
+        """Mide el bloque como un rerun completo (ver iniciar_rerun)."""
+        estado = self.iniciar_rerun(pagina)
+        try:
+            yield
+        finally:
+            self.terminar_rerun(estado)
+
+    def capturar_proximo(self):
+        """Pide perfilar con cProfile el próximo rerun de cualquier sesión."""
+        self._capturar_proximo = True
+
+    def _guardar_captura(self, pagina, perfil):
+        os.makedirs(self.directorio, exist_ok=True)
+        path = os.path.join(self.directorio,
+                            f"{pagina}_{datetime.now():%Y%m%d_%H%M%S_%f}.prof")
+        perfil.dump_stats(path)
+        with self._lock:
+            if len(self._archivos) == self._archivos.maxlen:
+                antiguo = self._archivos[0]
+                if os.path.exists(antiguo):
+                    os.remove(antiguo)
+            self._archivos.append(path)
+
+    # ==================== CONSULTA ====================
+
+    def top(self, n=10):
+        """
+        Fases con más tiempo acumulado en la ventana.
+
+        Returns:
+            pd.DataFrame: fase, mediciones, media_ms, p95_ms, max_ms, total_ms
+        """
+        with self._lock:
+            filas = [(fase, list(tiempos)) for fase, tiempos in self._tiempos.items() if tiempos]
+        if not filas:
+            return pd.DataFrame(columns=['fase', 'mediciones', 'media_ms', 'p95_ms',
+                                         'max_ms', 'total_ms'])
+
+        resumen = pd.DataFrame([
+            {
+                'fase': fase,
+                'mediciones': len(tiempos),
+                'media_ms': pd.Series(tiempos).mean() * 1000,
+                'p95_ms': pd.Series(tiempos).quantile(0.95) * 1000,
+                'max_ms': max(tiempos) * 1000,
+                'total_ms': sum(tiempos) * 1000
+            }
+            for fase, tiempos in filas
+        ])
+        return resumen.sort_values('total_ms', ascending=False).head(n).round(1) \
+            .reset_index(drop=True)
+
+    def archivos(self):
+        """
+        Returns:
+            list: Rutas de las capturas .prof, la más reciente primero
+        """
+        with self._lock:
+            return [p for p in reversed(self._archivos) if os.path.exists(p)]
+
+    def reiniciar(self):
+        """Descarta todas las mediciones (las capturas se conservan)."""
+        with self._lock:
+            self._tiempos.clear()
+            self._reruns = 0
+
+
+# ==================== INTEGRACIÓN CON STREAMLIT ====================
+
+@st.cache_resource
+def get_perfilador():
+    """
+    Obtiene instancia singleton del perfilador (compartida entre sesiones).
+
+    Returns:
+        PerfiladorReruns: Instancia del perfilador
+    """
+    return PerfiladorReruns(ventana=200)
+
+
+def panel_perfilador():
+    """Panel del perfilador en la barra lateral (solo llamar en modo admin)."""
+    perfil = get_perfilador()
+    with st.sidebar.expander("⏱️ Perfilador de Reruns"):
+        perfil.activo = st.toggle("Medir reruns (todas las sesiones)", value=perfil.activo,
+                                  key="perfilador_activo")
+        perfil.muestreo = st.number_input("Capturar 1 de cada N reruns (0 = no)",
+                                          min_value=0, max_value=1000, value=perfil.muestreo,
+                                          key="perfilador_muestreo")
+        if not perfil.activo:
+            st.caption("Apagado: las fases no se miden.")
+            return
+
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("📸 Capturar próximo", key="perfilador_capturar"):
+                perfil.capturar_proximo()
+        with col2:
+            if st.button("🧹 Reiniciar", key="perfilador_reiniciar"):
+                perfil.reiniciar()
+
+        df_top = perfil.top()
+        if df_top.empty:
+            st.caption("Sin mediciones todavía.")
+        else:
+            st.dataframe(df_top[['fase', 'mediciones', 'media_ms', 'p95_ms']],
+                         use_container_width=True, hide_index=True)
+
+        for path in perfil.archivos()[:3]:
+            with open(path, "rb") as archivo:
+                st.download_button(f"📥 {os.path.basename(path)}", archivo.read(),
+                                   os.path.basename(path), "application/octet-stream",
+                                   key=f"perfilador_{path}")
@@ -0,0 +1,408 @@
+"""
+Generación de Reportes Excel (IST Educa / MK Capacitaciones)
+============================================================
+
+Motor de exportación sobre XlsxWriter en modo constant_memory: las filas
+se escriben en streaming (no se mantiene la hoja completa en memoria) y
+todas las celdas comparten unos pocos formatos con nombre, en lugar de
+crear un Font/Border por celda.
+
+Características:
+- Memoria constante respecto al número de filas
+- Formatos compartidos (encabezado / dato) por workbook
+- Columnas de salida calculadas con operaciones vectorizadas de pandas
+- Pensado para generarse solo al descargar (data=callable en download_button)
+- Cache LRU por contenido (tipo, curso, sesión, hash de filas) acotado en bytes
+
+Uso:
+    from reportes import generar_excel_ist, get_cache_reportes, MIME_XLSX
+
+    cache = get_cache_reportes()
+    st.download_button("📥 IST", file_name="IST.xlsx", mime=MIME_XLSX,
+                       data=lambda: cache.obtener("ist", curso, sesion, df,
+                                                  lambda: generar_excel_ist(df)))
+
+Benchmark:
+    python reportes.py
+"""
+
+import io
+import hashlib
+import threading
+from collections import OrderedDict
+
+import streamlit as st
+import pandas as pd
+
+MIME_XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+_ROL_MK = {'PROFESIONAL SST': 1, 'TRABAJADOR': 2, 'MIEMBRO DE COMITÉ PARITARIO': 3,
+           'MIEMBRO COMITE PARITARIO': 3, 'MONITOR O DELEGADO': 4, 'DIRIGENTE SINDICAL': 5}
+_ROL_MK_DISPLAY = {1: "Profesional SST", 2: "Trabajador", 3: "Miembro Comité Paritario",
+                   4: "Monitor o Delegado", 5: "Dirigente Sindical"}
+
+_HEADERS_IST = ["RUT trabajador (Sin puntos ni dv)", "DV", "Nombres", "Apellidos (ambos)",
+                "Email (individual)", "Género", "Rol trabajador", "Región", "Comuna",
+                "Rut empresa (Sin puntos, con guión)", "Razón social"]
+_ANCHOS_IST = [22, 6, 25, 30, 30, 10, 25, 30, 25, 28, 35]
+
+_HEADERS_MK = ["Rut", "Nombres", "Apellido Paterno", "Apellido Materno",
+               "Sexo", "Nacionalidad", "Rol Trabajador", "Otro Rol",
+               "Rut empresa (Sin puntos, con guión)", "Razón social", "Comuna", "Fecha 1"]
+_ANCHOS_MK = [18, 25, 25, 25, 8, 14, 16, 25, 28, 35, 25, 20]
+
+# Hojas auxiliares del formato MK (tablas maestras)
+_HOJAS_MAESTRAS_MK = [
+    ("Parametros", [("Descripcion", "Valor"), ("Largo máximo Rut", 15),
+                    ("Largo máximo nombres", 50), ("Largo máximo apellido paterno", 50),
+                    ("Largo máximo apellido materno", 50)]),
+    ("MaeSexo", [("Codigo", "Valor"), (1, "Hombre"), (2, "Mujer")]),
+    ("MaeNacionalidad", [("Codigo", "Valor"), (1, "Chileno"), (2, "Extranjero")]),
+    ("MaeRolTrabajador", [("Codigo", "Valor"), (1, "Profesional SST"), (2, "Trabajador"),
+                          (3, "Miembro Comité Paritario"), (4, "Monitor o Delegado"),
+                          (5, "Dirigente Sindical")]),
+]
+
+
+def _columna(df, nombre):
+    """Columna como texto ('' para faltantes); serie vacía si no existe."""
+    if nombre not in df.columns:
+        return pd.Series('', index=df.index, dtype=object)
+    return df[nombre].fillna('').astype(str)
+
+
+def _columnas_ist(df):
+    """Calcula las 11 columnas del formato IST Educa."""
+    rut = _columna(df, 'rut')
+    partes = rut.str.strip().str.upper().str.split('-')
+    con_dv = partes.str.len() == 2
+
+    apellidos = (_columna(df, 'apellido_paterno') + ' '
+                 + _columna(df, 'apellido_materno')).str.strip()
+
+    return pd.DataFrame({
+        'rut': rut.where(~con_dv, partes.str[0].str.replace('.', '', regex=False)),
+        'dv': partes.str[1].where(con_dv, ''),
+        'nombres': _columna(df, 'nombres'),
+        'apellidos': apellidos,
+        'email': _columna(df, 'email'),
+        'sexo': _columna(df, 'sexo'),
+        'rol': _columna(df, 'rol'),
+        'region': _columna(df, 'region'),
+        'comuna': _columna(df, 'comuna'),
+        'rut_empresa': _columna(df, 'rut_empresa'),
+        'razon_social': _columna(df, 'razon_social'),
+    })
+
+
+def _columnas_mk(df, fecha_sesion):
+    """Calcula las 12 columnas del formato MK Capacitaciones."""
+    rol = _columna(df, 'rol').str.upper()
+    codigo_rol = rol.map(_ROL_MK)
+
+    return pd.DataFrame({
+        'rut': _columna(df, 'rut'),
+        'nombres': _columna(df, 'nombres'),
+        'apellido_paterno': _columna(df, 'apellido_paterno'),
+        'apellido_materno': _columna(df, 'apellido_materno'),
+        'sexo': _columna(df, 'sexo').str.capitalize(),
+        'nacionalidad': _columna(df, 'nacionalidad').str.capitalize(),
+        'rol': codigo_rol.fillna(2).astype(int).map(_ROL_MK_DISPLAY),
+        'otro_rol': rol.where(codigo_rol.isna(), ''),
+        'rut_empresa': _columna(df, 'rut_empresa'),
+        'razon_social': _columna(df, 'razon_social'),
+        'comuna': _columna(df, 'comuna'),
+        'fecha': fecha_sesion if fecha_sesion else '',
+    })
+
+
+def _nuevo_workbook(buf):
+    """Workbook XlsxWriter en streaming con los formatos compartidos."""
+    import xlsxwriter
+
+    wb = xlsxwriter.Workbook(buf, {'constant_memory': True})
+    borde = {'border': 1, 'border_color': '#AAAAAA'}
+    formatos = {
+        'dato': wb.add_format({'font_name': 'Arial', 'font_size': 10, **borde}),
+        'header_ist': wb.add_format({'font_name': 'Arial', 'font_size': 10, 'bold': True,
+                                     'font_color': '#FFFFFF', 'bg_color': '#1F4E79',
+                                     'align': 'center', 'text_wrap': True, **borde}),
+        'header_mk': wb.add_format({'font_name': 'Arial', 'font_size': 10, 'bold': True,
+                                    'font_color': '#FFFFFF', 'bg_color': '#2E75B6',
+                                    'align': 'center', **borde}),
+    }
+    return wb, formatos
+
+
+def _escribir_hoja(ws, headers, anchos, filas, fmt_header, fmt_dato, alto_header=None):
+    """Escribe encabezado y filas en orden (requisito de constant_memory)."""
+    for c, ancho in enumerate(anchos):
+        ws.set_column(c, c, ancho)
+    ws.write_row(0, 0, headers, fmt_header)
+    if alto_header:
+        ws.set_row(0, alto_header)
+    for r, fila in enumerate(filas.itertuples(index=False, name=None), 1):
+        ws.write_row(r, 0, fila, fmt_dato)
+
+
+def generar_excel_ist(df):
+    """
+    Genera el Excel de inscripción para IST Educa.
+
+    Args:
+        df: DataFrame de asistentes con columnas de inscripción
+
+    Returns:
+        io.BytesIO: Archivo .xlsx posicionado al inicio
+    """
+    buf = io.BytesIO()
+    wb, fmt = _nuevo_workbook(buf)
+    ws = wb.add_worksheet("Campos inscripción ISTeduca")
+    _escribir_hoja(ws, _HEADERS_IST, _ANCHOS_IST, _columnas_ist(df),
+                   fmt['header_ist'], fmt['dato'], alto_header=30)
+    wb.close()
+    buf.seek(0)
+    return buf
+
+
+def generar_excel_mk(df, fecha_sesion=None):
+    """
+    Genera el Excel de carga para MK Capacitaciones.
+
+    Args:
+        df: DataFrame de asistentes con columnas de inscripción
+        fecha_sesion: Fecha de la sesión (dd-mm-yyyy) para la columna 'Fecha 1'
+
+    Returns:
+        io.BytesIO: Archivo .xlsx posicionado al inicio
+    """
+    buf = io.BytesIO()
+    wb, fmt = _nuevo_workbook(buf)
+    ws = wb.add_worksheet("Datos")
+    _escribir_hoja(ws, _HEADERS_MK, _ANCHOS_MK, _columnas_mk(df, fecha_sesion),
+                   fmt['header_mk'], fmt['dato'])
+    for nombre, filas in _HOJAS_MAESTRAS_MK:
+        ws_maestra = wb.add_worksheet(nombre)
+        for r, fila in enumerate(filas):
+            ws_maestra.write_row(r, 0, fila)
+    wb.close()
+    buf.seek(0)
+    return buf
+
+
+def fecha_sesion_curso(curso_info, sesion):
+    """
+    Fecha de una sesión en formato dd-mm-yyyy para la columna 'Fecha 1' de MK.
+
+    Args:
+        curso_info: Fila (pd.Series o dict) de la Config del curso
+        sesion: Número de sesión
+
+    Returns:
+        str: Fecha formateada ('' si el curso no tiene fechas)
+    """
+    fecha_col = f'fecha_sesion_{sesion}'
+    if fecha_col not in curso_info or pd.isna(curso_info[fecha_col]):
+        # Fallback a fecha_jornada o fecha_inicio si no hay sesión específica
+        fecha_sesion = curso_info.get('fecha_jornada', curso_info.get('fecha_inicio', ''))
+    else:
+        fecha_sesion = curso_info[fecha_col]
+
+    if pd.isna(fecha_sesion):
+        return ''
+    if hasattr(fecha_sesion, 'strftime'):
+        return fecha_sesion.strftime('%d-%m-%Y')
+    return str(fecha_sesion)
+
+
+def generar_excel_registros(df):
+    """
+    Genera el Excel de registros de inscripción de un curso (Inscripcion.py).
+
+    Args:
+        df: DataFrame de registros del curso
+
+    Returns:
+        io.BytesIO: Archivo .xlsx posicionado al inicio
+    """
+    buf = io.BytesIO()
+    with pd.ExcelWriter(buf, engine='xlsxwriter') as writer:
+        df.to_excel(writer, sheet_name='Datos', index=False, float_format='%.2f')
+
+        # Formato para el archivo Excel
+        workbook = writer.book
+        worksheet = writer.sheets['Datos']
+        header_format = workbook.add_format({
+            'bold': True,
+            'bg_color': '#D8E4BC',
+            'border': 1
+        })
+
+        for col_num, value in enumerate(df.columns.values):
+            worksheet.write(0, col_num, value, header_format)
+            worksheet.set_column(col_num, col_num, len(str(value)) + 2)
+
+        worksheet.freeze_panes(1, 0)
+
+    buf.seek(0)
+    return buf
+
+
+# ==================== CACHE DE REPORTES ====================
+
+def huella_dataframe(df):
+    """
+    Hash del contenido de un DataFrame (columnas y filas, sin el índice).
+
+    Returns:
+        str: Hash hexadecimal
+    """
+    h = hashlib.sha1("|".join(map(str, df.columns)).encode('utf-8'))
+    h.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return h.hexdigest()
+
+
+class CacheReportes:
+    """
+    Cache LRU de reportes generados, direccionado por contenido y acotado en bytes.
+
+    Si los datos de entrada no cambian, reruns y descargas repetidas (de
+    cualquier admin) devuelven los mismos bytes sin regenerar el workbook.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        """
+        Args:
+            max_bytes: Tamaño máximo total de los reportes guardados
+        """
+        self.max_bytes = max_bytes
+        self.bytes_usados = 0
+        self.aciertos = 0
+        self.fallos = 0
+        self._reportes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, tipo, curso_id, sesion, df, generar, extra=()):
+        """
+        Devuelve el reporte desde el cache o lo genera y lo guarda.
+
+        Args:
+            tipo: Tipo de reporte ('ist', 'mk', 'registros', ...)
+            curso_id: ID del curso
+            sesion: Número de sesión (None si no aplica)
+            df: DataFrame de entrada (su hash forma parte de la clave)
+            generar: Función sin argumentos que devuelve bytes o BytesIO
+            extra: Otros parámetros que afectan el resultado (ej: fecha de sesión)
+
+        Returns:
+            bytes: Contenido del reporte
+        """
+        clave = (tipo, str(curso_id), str(sesion), huella_dataframe(df), tuple(extra))
+
+        with self._lock:
+            if clave in self._reportes:
+                self._reportes.move_to_end(clave)
+                self.aciertos += 1
+                return self._reportes[clave]
+            self.fallos += 1
+
+        contenido = generar()
+        if isinstance(contenido, io.BytesIO):
+            contenido = contenido.getvalue()
+
+        with self._lock:
+            if clave not in self._reportes and len(contenido) <= self.max_bytes:
+                self._reportes[clave] = contenido
+                self.bytes_usados += len(contenido)
+                while self.bytes_usados > self.max_bytes:
+                    _, expulsado = self._reportes.popitem(last=False)
+                    self.bytes_usados -= len(expulsado)
+
+        return contenido
+
+    def limpiar(self):
+        """Vacía el cache."""
+        with self._lock:
+            self._reportes.clear()
+            self.bytes_usados = 0
+
+    def get_estadisticas(self):
+        """
+        Obtiene estadísticas del cache.
+
+        Returns:
+            dict: Estadísticas
+        """
+        return {
+            'reportes': len(self._reportes),
+            'bytes': self.bytes_usados,
+            'aciertos': self.aciertos,
+            'fallos': self.fallos
+        }
+
+
+# ==================== INTEGRACIÓN CON STREAMLIT ====================
+
+@st.cache_resource
+def get_cache_reportes():
+    """
+    Obtiene instancia singleton del cache de reportes (compartida entre sesiones).
+
+    Returns:
+        CacheReportes: Instancia del cache
+    """
+    return CacheReportes(max_bytes=64 * 1024 * 1024)
+
+
+# ==================== BENCHMARK ====================
+
+if __name__ == "__main__":
+    import time
+    import tracemalloc
+    from openpyxl import Workbook
+    from openpyxl.styles import Font, Border, Side
+
+    def _ist_openpyxl_por_celda(df):
+        """Implementación anterior: workbook normal, Font/Border por celda."""
+        wb = Workbook()
+        ws = wb.active
+        brd = Border(*(Side(style='thin', color="AAAAAA"),) * 4)
+        for c, h in enumerate(_HEADERS_IST, 1):
+            ws.cell(row=1, column=c, value=h).font = Font(name="Arial", bold=True)
+        for ri, row in enumerate(_columnas_ist(df).itertuples(index=False), 2):
+            for c, v in enumerate(row, 1):
+                cell = ws.cell(row=ri, column=c, value=v)
+                cell.font = Font(name="Arial", size=10)
+                cell.border = brd
+        buf = io.BytesIO()
+        wb.save(buf)
+        return buf
+
+    def medir(nombre, fn, df):
+        t0 = time.perf_counter()
+        buf = fn(df)
+        segundos = time.perf_counter() - t0
+
+        # Segunda pasada solo para memoria (tracemalloc distorsiona los tiempos)
+        tracemalloc.start()
+        fn(df)
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"   {nombre:<28} {segundos:6.2f}s  pico {pico / 1e6:7.1f} MB  "
+              f"archivo {len(buf.getvalue()) / 1e6:5.2f} MB")
+
+    print("📊 Benchmark de exportación Excel")
+    print("=" * 50)
+    for n in (10_000, 25_000):
+        df = pd.DataFrame({
+            'rut': [f"{10_000_000 + i}-{i % 10}" for i in range(n)],
+            'nombres': 'JUAN ANDRÉS', 'apellido_paterno': 'PÉREZ',
+            'apellido_materno': 'GONZÁLEZ', 'email': 'juan@empresa.cl',
+            'sexo': 'HOMBRE', 'nacionalidad': 'CHILENO', 'rol': 'TRABAJADOR',
+            'region': 'Región Metropolitana de Santiago', 'comuna': 'Santiago',
+            'rut_empresa': '76543210-3', 'razon_social': 'EMPRESA DE PRUEBA SPA',
+        })
+        print(f"\n{n:,} filas:")
+        medir("openpyxl (por celda)", _ist_openpyxl_por_celda, df)
+        medir("IST constant_memory", generar_excel_ist, df)
+        medir("MK constant_memory", lambda d: generar_excel_mk(d, "04-03-2026"), df)
@@ -0,0 +1,251 @@
+"""
+Roster del Día para el Check-in de Participantes
+================================================
+
+Precarga en memoria solo a los inscritos de los cursos con sesión hoy,
+para que el formulario de asistencia valide sin descargar la tabla de
+inscripciones completa.
+
+Características:
+- Precalentado al iniciar la app y al cambiar de día (en segundo plano, un
+  solo intento a la vez; mientras tanto se sirve el roster vigente)
+- Refresco periódico en segundo plano (inscripciones tardías)
+- Copia en la tabla DuckDB 'roster_hoy' junto a asistencias_buffer,
+  servida de inmediato tras un reinicio
+- Lookup O(1) por (curso_id, rut)
+
+Uso:
+    from roster import RosterDia
+
+    roster = RosterDia(cargar_cursos, cargar_registros, conn=buffer.conn)
+    datos = roster.buscar("RM-Mar26", "12345678-9")
+"""
+
+import logging
+import pandas as pd
+import threading
+import time
+from datetime import date, datetime
+
+from indices import sesiones_del_dia, indice_sesiones, IndiceInscritos, CAMPOS_PARTICIPANTE
+
+logger = logging.getLogger(__name__)
+
+# Segundos mínimos entre intentos de precalentado disparados por un lookup
+REINTENTO_CAMBIO_DIA = 60
+
+
+class RosterDia:
+    """
+    Inscritos de los cursos con sesión hoy, indexados por (curso_id, rut).
+    """
+
+    def __init__(self, cargar_cursos, cargar_registros, conn=None,
+                 intervalo_refresco=300):
+        """
+        Inicializa y precalienta el roster.
+
+        Args:
+            cargar_cursos: Función sin argumentos que devuelve la Config (fechas parseadas)
+            cargar_registros: Función (cursos) que devuelve los registros de
+                esos curso_id (ej: leídos filtrados del snapshot local)
+            conn: Conexión DuckDB donde persistir 'roster_hoy' (opcional)
+            intervalo_refresco: Segundos entre refrescos (0 = sin refresco automático)
+        """
+        self.cargar_cursos = cargar_cursos
+        self.cargar_registros = cargar_registros
+        self.intervalo_refresco = intervalo_refresco
+        self.dia = None
+        self.sesiones = {}
+        self.actualizado_en = None
+        self._indice = IndiceInscritos(pd.DataFrame())
+        self._lock = threading.Lock()
+        self._precalentando = threading.Lock()
+        self._ultimo_intento = None
+        self.ultimo_error = None  # (datetime, mensaje) del último precalentado fallido
+        self._stop_refresco = False
+
+        # Cursor propio: el refresco corre en otro thread
+        self.conn = conn.cursor() if conn is not None else None
+        if self.conn is not None:
+            self._init_tabla()
+
+        # Tras un reinicio, servir el roster persistido mientras se refresca
+        if self._cargar_desde_tabla():
+            threading.Thread(target=self._precalentar_seguro, daemon=True).start()
+        else:
+            self._precalentar_seguro()
+
+        if intervalo_refresco > 0:
+            threading.Thread(target=self._refresco_loop, daemon=True).start()
+
+    def _init_tabla(self):
+        """Crea la tabla de roster persistido."""
+        columnas = ", ".join(f"{c} VARCHAR" for c in CAMPOS_PARTICIPANTE)
+        self.conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS roster_hoy (
+                dia DATE NOT NULL,
+                curso_id VARCHAR NOT NULL,
+                {columnas}
+            )
+        """)
+
+    def precalentar(self):
+        """
+        Recalcula las sesiones de hoy y carga a sus inscritos.
+
+        Returns:
+            int: Número de inscritos en el roster
+        """
+        dia = date.today()
+        df_hoy = sesiones_del_dia(self.cargar_cursos(), dia)
+        sesiones = indice_sesiones(df_hoy, dia)
+        cursos = {str(curso_id) for curso_id, _ in sesiones[dia]}
+
+        df_roster = pd.DataFrame()
+        if cursos:
+            df_registros = self.cargar_registros(cursos)
+            if not df_registros.empty and 'curso_id' in df_registros.columns:
+                df_roster = df_registros[df_registros['curso_id'].astype(str).isin(cursos)]
+
+        indice = IndiceInscritos(df_roster)
+
+        with self._lock:
+            self.dia = dia
+            self.sesiones = sesiones
+            self._indice = indice
+            self.actualizado_en = datetime.now()
+
+        if self.conn is not None:
+            self._guardar_en_tabla(dia, df_roster)
+
+        return len(indice)
+
+    def buscar(self, curso_id, rut):
+        """
+        Busca un participante en el roster de hoy.
+
+        Args:
+            curso_id: ID del curso
+            rut: RUT del participante
+
+        Returns:
+            dict | None: Datos del participante o None si no está en el roster
+        """
+        if self.dia != date.today():
+            self._precalentar_en_segundo_plano()  # Cambio de día sin esperar al refresco
+        return self._indice.buscar(curso_id, rut)
+
+    def agregar(self, datos):
+        """Incorpora un inscrito encontrado fuera del roster (inscripción tardía)."""
+        with self._lock:
+            self._indice.agregar(datos)
+
+    def get_estadisticas(self):
+        """
+        Obtiene estadísticas del roster.
+
+        Returns:
+            dict: Estadísticas
+        """
+        return {
+            'dia': self.dia,
+            'cursos': len(self.sesiones.get(self.dia, [])),
+            'inscritos': len(self._indice),
+            'actualizado_en': self.actualizado_en,
+            'ultimo_error': self.ultimo_error
+        }
+
+    def close(self):
+        """Detiene el refresco automático."""
+        self._stop_refresco = True
+
+    def _precalentar_seguro(self):
+        """
+        Precalienta sin propagar errores: se registran en ultimo_error y se
+        reintenta en el próximo refresco. Si ya hay un precalentado en curso no
+        hace nada.
+        """
+        if not self._precalentando.acquire(blocking=False):
+            return
+        try:
+            self._ultimo_intento = time.monotonic()
+            self.precalentar()
+            self.ultimo_error = None
+        except Exception as e:
+            logger.exception("Error precalentando el roster del día")
+            self.ultimo_error = (datetime.now(), str(e))
+        finally:
+            self._precalentando.release()
+
+    def _precalentar_en_segundo_plano(self):
+        """
+        Lanza un precalentado en un thread aparte, salvo que ya haya uno en
+        curso o el último intento sea de hace menos de REINTENTO_CAMBIO_DIA
+        segundos (un Sheets caído no se consulta en cada lookup).
+        """
+        if self._precalentando.locked():
+            return
+        if self._ultimo_intento is not None and \
+                time.monotonic() - self._ultimo_intento < REINTENTO_CAMBIO_DIA:
+            return
+        threading.Thread(target=self._precalentar_seguro, daemon=True).start()
+
+    def _refresco_loop(self):
+        """Refresca cada intervalo o al pasar la medianoche, lo que ocurra primero."""
+        while not self._stop_refresco:
+            ahora = datetime.now()
+            medianoche = datetime.combine(date.fromordinal(ahora.toordinal() + 1),
+                                          datetime.min.time())
+            espera = min(self.intervalo_refresco,
+                         (medianoche - ahora).total_seconds() + 1)
+            time.sleep(espera)
+            if not self._stop_refresco:
+                self._precalentar_seguro()
+
+    def _guardar_en_tabla(self, dia, df_roster):
+        """Reemplaza el roster persistido por el de hoy."""
+        df = df_roster.reindex(columns=['curso_id'] + CAMPOS_PARTICIPANTE).astype('string')
+        df.insert(0, 'dia', dia)
+
+        self.conn.register('_roster', df)
+        try:
+            self.conn.execute("BEGIN TRANSACTION")
+            self.conn.execute("DELETE FROM roster_hoy")
+            self.conn.execute("INSERT INTO roster_hoy SELECT * FROM _roster")
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        finally:
+            self.conn.unregister('_roster')
+
+    def _cargar_desde_tabla(self):
+        """
+        Carga el roster persistido si corresponde a hoy.
+
+        Returns:
+            bool: True si se cargó un roster de hoy
+        """
+        if self.conn is None:
+            return False
+
+        dia = date.today()
+        df = self.conn.execute(
+            "SELECT * EXCLUDE (dia) FROM roster_hoy WHERE dia = ?", [dia]
+        ).df().fillna('')
+        if df.empty:
+            return False
+
+        # Las sesiones no se persisten: se recalculan con la Config en caché
+        try:
+            sesiones = indice_sesiones(sesiones_del_dia(self.cargar_cursos(), dia), dia)
+        except Exception:
+            sesiones = {}
+
+        with self._lock:
+            self.dia = dia
+            self.sesiones = sesiones
+            self._indice = IndiceInscritos(df)
+            self.actualizado_en = datetime.now()
+        return True
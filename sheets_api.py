@@ -0,0 +1,158 @@
+"""
+Cliente Paginado para el API de Google Apps Script
+==================================================
+
+Este módulo descarga las hojas grandes (Inscripciones, Asistencias) en
+páginas offset/limit en lugar de una única respuesta JSON con toda la hoja.
+
+Características:
+- Memoria acotada: solo una página se parsea a la vez
+- Primeros resultados disponibles antes de terminar la descarga
+- Páginas como DataFrames columnares, concatenables en uno solo
+- Compatible con despliegues antiguos del Apps Script sin paginación
+- Filtros opcionales por parámetro (ej: curso_id y sesion en getAsistencias)
+- Checksums por (curso_id, sesion) de la hoja Asistencias para reconciliar
+  sin descargarla completa
+
+Uso:
+    from sheets_api import iter_paginas, descargar_dataframe, descargar_config
+
+    for pagina in iter_paginas(API_URL, API_KEY, "getAsistencias", "asistencias"):
+        procesar(pagina)  # pd.DataFrame con hasta PAGE_SIZE filas
+
+    df = descargar_dataframe(API_URL, API_KEY, "getAsistencias", "asistencias",
+                             filtros={'curso_id': 'RM-Mar26', 'sesion': 1})
+    cursos = descargar_config(API_URL, API_KEY)
+    checksums = descargar_checksums(API_URL, API_KEY)
+"""
+
+import requests
+import pandas as pd
+
+# Filas por página (equilibrio entre número de requests y memoria por respuesta)
+PAGE_SIZE = 2000
+
+
+class SheetsAPIError(Exception):
+    """Error devuelto por el Apps Script (success = false)."""
+
+
+def iter_paginas(api_url, api_key, action, campo, page_size=PAGE_SIZE, timeout=15,
+                 filtros=None):
+    """
+    Recorre una acción GET paginada del Apps Script.
+
+    Args:
+        api_url: URL del Apps Script API
+        api_key: Key del API
+        action: Acción GET (getRegistros, getAsistencias)
+        campo: Clave de la lista de filas en la respuesta ('registros', 'asistencias')
+        page_size: Filas por página
+        timeout: Timeout por request en segundos
+        filtros: dict de parámetros extra (ej: {'curso_id': ..., 'sesion': ...});
+            un Apps Script que no los conoce los ignora y devuelve todo
+
+    Yields:
+        pd.DataFrame: Una página de filas (nunca vacía)
+
+    Raises:
+        SheetsAPIError: Si el API responde success = false
+    """
+    offset = 0
+    while True:
+        response = requests.get(
+            api_url,
+            params={"action": action, "key": api_key,
+                    "offset": offset, "limit": page_size, **(filtros or {})},
+            timeout=timeout
+        )
+        data = response.json()
+
+        if not data.get('success'):
+            raise SheetsAPIError(data.get('error', 'Error desconocido'))
+
+        filas = data.get(campo) or []
+        if filas:
+            yield pd.DataFrame(filas)
+
+        # Un Apps Script sin paginación devuelve todo sin 'next_offset'
+        next_offset = data.get('next_offset')
+        if next_offset is None or not filas:
+            break
+        offset = int(next_offset)
+
+
+def descargar_config(api_url, api_key, timeout=15):
+    """
+    Descarga la hoja Config (cursos). Es pequeña y no se pagina.
+
+    Returns:
+        pd.DataFrame: Cursos tal como los entrega el API
+
+    Raises:
+        SheetsAPIError: Si el API responde success = false
+    """
+    response = requests.get(api_url, params={"action": "getConfig", "key": api_key},
+                            timeout=timeout)
+    data = response.json()
+
+    if not data.get('success'):
+        raise SheetsAPIError(data.get('error', 'Error desconocido'))
+
+    return pd.DataFrame(data.get('cursos') or [])
+
+
+def descargar_checksums(api_url, api_key, timeout=30):
+    """
+    Descarga el conteo y hash por (curso_id, sesion) de la hoja Asistencias.
+
+    El hash de un bucket es la suma módulo 2^32 de los primeros 4 bytes del
+    MD5 de cada RUT (independiente del orden de las filas).
+
+    Returns:
+        pd.DataFrame: curso_id, sesion, filas, hash (sin buckets con valores
+        no numéricos)
+
+    Raises:
+        SheetsAPIError: Si el API responde success = false (incluido un
+            Apps Script sin getChecksumsAsistencias)
+    """
+    response = requests.get(api_url, params={"action": "getChecksumsAsistencias", "key": api_key},
+                            timeout=timeout)
+    data = response.json()
+
+    if not data.get('success'):
+        raise SheetsAPIError(data.get('error', 'Error desconocido'))
+
+    df = pd.DataFrame(data.get('checksums') or [],
+                      columns=['curso_id', 'sesion', 'filas', 'hash'])
+    # Un bucket con sesión, conteo o hash no numérico (celda vacía o texto en
+    # Sheets) se descarta: queda como diferente y se compara fila a fila
+    numericas = df[['sesion', 'filas', 'hash']].apply(pd.to_numeric, errors='coerce')
+    validas = numericas.notna().all(axis=1)
+    df = df[validas].assign(**numericas[validas])
+    return df.astype({'curso_id': str, 'sesion': 'int64', 'filas': 'int64', 'hash': 'int64'}) \
+        .reset_index(drop=True)
+
+
+def descargar_dataframe(api_url, api_key, action, campo, page_size=PAGE_SIZE, timeout=15,
+                        filtros=None):
+    """
+    Descarga una hoja página a página y la concatena en un DataFrame.
+
+    Pensada para descargas acotadas (ej: un bucket con filtros); para hojas
+    completas, pasar iter_paginas a SnapshotCache.obtener, que inserta cada
+    página en DuckDB sin juntar la hoja en memoria.
+
+    Returns:
+        pd.DataFrame: Todas las filas (vacío si la hoja no tiene datos)
+
+    Raises:
+        SheetsAPIError: Si el API responde success = false
+    """
+    paginas = list(iter_paginas(api_url, api_key, action, campo,
+                                page_size=page_size, timeout=timeout, filtros=filtros))
+    if not paginas:
+        return pd.DataFrame()
+    return pd.concat(paginas, ignore_index=True)
+
@@ -0,0 +1,414 @@
+"""
+Cache Persistente de Lectura para Datos de Google Sheets
+=======================================================
+
+Guarda en disco (DuckDB) la última copia de cada hoja descargada del
+Apps Script (Config, Inscripciones, Asistencias) junto con su revisión,
+para que tras un redeploy la app responda sin esperar a Google Sheets.
+
+Características:
+- Snapshot por dataset en una tabla DuckDB (snap_<dataset>) que sobrevive reinicios
+- Descarga por páginas: cada página se inserta al llegar (memoria acotada a
+  una página) y la tabla anterior se reemplaza al terminar
+- Lecturas filtradas por columna (ej: asistencias de un curso y sesión,
+  registros de los cursos de hoy) sin cargar el dataset completo
+- Arranque en caliente: la primera lectura de cada dataset en el proceso sirve
+  el snapshot aunque esté obsoleto y lo refresca en segundo plano; después,
+  un snapshot obsoleto se refresca en línea
+- Si un refresco falla se registra el error y se sigue sirviendo el último
+  snapshot bueno, revalidando en segundo plano (cada REINTENTO_FALLO
+  segundos como máximo) hasta que uno funcione
+- Revisión por contenido (hash incremental por página) para invalidar índices derivados
+- Una sola revalidación en curso por dataset
+
+Uso:
+    from sheets_cache import get_snapshot_cache
+
+    cache = get_snapshot_cache("sheets_cache_asistencia.duckdb")
+    df = cache.obtener("registros", lambda: iter_paginas(...), max_edad=180)
+    df = cache.obtener("asistencias", fetcher, filtros={'curso_id': 'RM-Mar26', 'sesion': 1})
+    df.attrs['revision']  # revisión del snapshot servido
+"""
+
+import duckdb
+import streamlit as st
+import pandas as pd
+import hashlib
+import json
+import threading
+from datetime import datetime
+
+# Tipo DuckDB por tipo de columna de pandas (dtype.kind); el resto se guarda como texto
+_TIPOS = {'i': 'BIGINT', 'u': 'BIGINT', 'f': 'DOUBLE', 'b': 'BOOLEAN'}
+
+# Segundos mínimos entre revalidaciones de un dataset cuyo último refresco falló
+REINTENTO_FALLO = 30
+
+
+def _tabla(dataset, nueva=False):
+    """Nombre (entre comillas) de la tabla del snapshot de un dataset."""
+    return f'"snap_{dataset}{"__nueva" if nueva else ""}"'
+
+
+def _columna(nombre):
+    return '"' + str(nombre).replace('"', '""') + '"'
+
+
+def _tipo_comun(actual, nuevo):
+    """Tipo que admite los valores de ambos (una columna numérica con texto pasa a VARCHAR)."""
+    if actual == nuevo:
+        return actual
+    if {actual, nuevo} == {'BIGINT', 'DOUBLE'}:
+        return 'DOUBLE'
+    return 'VARCHAR'
+
+
+def _preparar_pagina(pagina):
+    """
+    Normaliza una página para insertarla.
+
+    Returns:
+        tuple: (pd.DataFrame con las columnas de texto como str o None,
+                dict columna → tipo DuckDB)
+    """
+    pagina = pagina.rename(columns=str)
+    tipos = {}
+    for col in pagina.columns:
+        # Enteros con celdas vacías llegan como float: se guardan como enteros
+        # (así '1' y 1 siguen siendo iguales si la columna pasa a VARCHAR)
+        if pagina[col].dtype.kind == 'f':
+            valores = pagina[col].dropna()
+            if valores.eq(valores.round()).all():
+                pagina[col] = pagina[col].astype('Int64')
+        tipos[col] = _TIPOS.get(pagina[col].dtype.kind, 'VARCHAR')
+        if tipos[col] == 'VARCHAR':
+            serie = pagina[col].astype(object)
+            pagina[col] = serie.where(serie.isna(), serie.astype(str)).where(serie.notna(), None)
+    return pagina, tipos
+
+
+class SnapshotCache:
+    """
+    Snapshots persistentes de datasets de Google Sheets con revalidación
+    en segundo plano.
+    """
+
+    def __init__(self, db_path="sheets_cache.duckdb"):
+        """
+        Inicializa el cache de snapshots.
+
+        Args:
+            db_path: Ruta al archivo DuckDB (persiste entre reinicios)
+        """
+        self.db_path = db_path
+        self.conn = duckdb.connect(db_path)
+        self._lock = threading.RLock()
+        self._refrescos = {}    # dataset → Lock (un refresco a la vez por dataset)
+        self._revalidando = set()
+        self._forzar = set()
+        self._servidos = set()  # Datasets ya leídos en este proceso
+        self._fallos = {}       # dataset → (datetime, error) del último refresco fallido
+
+        anteriores = self._snapshots_json()
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS snapshots (
+                dataset VARCHAR PRIMARY KEY,
+                revision VARCHAR NOT NULL,
+                guardado_en TIMESTAMP NOT NULL,
+                filas INTEGER NOT NULL
+            )
+        """)
+        # Snapshots del formato anterior (una fila JSON por dataset) → tablas
+        for dataset, datos in anteriores:
+            self.guardar(dataset, pd.DataFrame(json.loads(datos)))
+
+    def _snapshots_json(self):
+        """
+        Lee y elimina la tabla de snapshots del formato anterior (columna 'datos').
+
+        Returns:
+            list: Tuplas (dataset, datos JSON); vacía si el archivo ya es del formato actual
+        """
+        columnas = {r[0] for r in self.conn.execute("""
+            SELECT column_name FROM information_schema.columns WHERE table_name = 'snapshots'
+        """).fetchall()}
+        if 'datos' not in columnas:
+            return []
+        anteriores = self.conn.execute("SELECT dataset, datos FROM snapshots").fetchall()
+        self.conn.execute("DROP TABLE snapshots")
+        return anteriores
+
+    def leer(self, dataset, filtros=None):
+        """
+        Lee el último snapshot guardado de un dataset.
+
+        Args:
+            dataset: Nombre del dataset ('config', 'registros', 'asistencias')
+            filtros: dict columna → valor o lista de valores; solo se leen esas
+                filas (los números se comparan como número, el resto como texto)
+
+        Returns:
+            pd.DataFrame | None: Snapshot con attrs 'revision' y 'guardado_en',
+            o None si nunca se ha guardado
+        """
+        with self._lock:
+            meta = self._meta(dataset)
+            if meta is None:
+                return None
+            revision, guardado_en, filas = meta
+
+            df = pd.DataFrame()
+            if filas:
+                columnas = [d[0] for d in self.conn.execute(
+                    f"SELECT * FROM {_tabla(dataset)} LIMIT 0").description]
+                condiciones, params = [], []
+                for col, valores in (filtros or {}).items():
+                    if col not in columnas:
+                        condiciones.append("false")
+                        continue
+                    if not isinstance(valores, (list, tuple, set)):
+                        valores = [valores]
+                    valores = list(valores)
+                    numericos = all(isinstance(v, (int, float)) and not isinstance(v, bool)
+                                    for v in valores)
+                    expr = f"TRY_CAST({_columna(col)} AS DOUBLE)" if numericos \
+                        else f"CAST({_columna(col)} AS VARCHAR)"
+                    condiciones.append(f"{expr} IN ({', '.join('?' * len(valores))})"
+                                       if valores else "false")
+                    params += [float(v) for v in valores] if numericos else [str(v) for v in valores]
+                where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+                df = self.conn.execute(f"SELECT * FROM {_tabla(dataset)} {where}", params).df()
+
+        df.attrs['revision'] = revision
+        df.attrs['guardado_en'] = guardado_en
+        return df
+
+    def _meta(self, dataset):
+        """(revision, guardado_en, filas) del snapshot o None."""
+        with self._lock:
+            return self.conn.execute("""
+                SELECT revision, guardado_en, filas FROM snapshots WHERE dataset = ?
+            """, [dataset]).fetchone()
+
+    def guardar(self, dataset, datos):
+        """
+        Guarda un snapshot, reemplazando el anterior.
+
+        Las páginas se insertan a medida que llegan en una tabla nueva, con el
+        tipo de cada columna ampliado si una página trae valores de otro tipo
+        (número y texto → VARCHAR); al terminar reemplaza a la anterior en una
+        transacción. Si la descarga falla a mitad, el snapshot anterior queda intacto.
+
+        Args:
+            dataset: Nombre del dataset
+            datos: DataFrame o iterable de DataFrames (páginas) tal como los
+                devuelve el API (sin transformar)
+
+        Returns:
+            str: Revisión del snapshot (hash del contenido)
+        """
+        paginas = [datos] if isinstance(datos, pd.DataFrame) else datos
+        nueva = _tabla(dataset, nueva=True)
+        resumen = hashlib.sha1()
+        tipos = {}
+        filas = 0
+
+        with self._lock:
+            self.conn.execute(f"DROP TABLE IF EXISTS {nueva}")
+        try:
+            for pagina in paginas:
+                if pagina.empty:
+                    continue
+                resumen.update(pagina.to_json(orient='records', date_format='iso',
+                                              force_ascii=False).encode('utf-8'))
+                pagina, tipos_pagina = _preparar_pagina(pagina)
+                with self._lock:
+                    self._ajustar_columnas(nueva, tipos, tipos_pagina)
+                    self.conn.register('_pagina_snapshot', pagina)
+                    try:
+                        self.conn.execute(
+                            f"INSERT INTO {nueva} BY NAME SELECT * FROM _pagina_snapshot")
+                    finally:
+                        self.conn.unregister('_pagina_snapshot')
+                filas += len(pagina)
+
+            revision = resumen.hexdigest()[:16]
+            with self._lock:
+                if not tipos:
+                    # Hoja vacía: tabla sin filas (leer devuelve un DataFrame vacío)
+                    self.conn.execute(f"CREATE TABLE {nueva} (_vacia BOOLEAN)")
+                self.conn.execute("BEGIN TRANSACTION")
+                try:
+                    self.conn.execute(f"DROP TABLE IF EXISTS {_tabla(dataset)}")
+                    self.conn.execute(f"ALTER TABLE {nueva} RENAME TO {_tabla(dataset)}")
+                    self.conn.execute("""
+                        INSERT INTO snapshots (dataset, revision, guardado_en, filas)
+                        VALUES (?, ?, ?, ?)
+                        ON CONFLICT (dataset) DO UPDATE
+                        SET revision = EXCLUDED.revision,
+                            guardado_en = EXCLUDED.guardado_en,
+                            filas = EXCLUDED.filas
+                    """, [dataset, revision, datetime.now(), filas])
+                    self.conn.execute("COMMIT")
+                except Exception:
+                    self.conn.execute("ROLLBACK")
+                    raise
+        except Exception:
+            with self._lock:
+                self.conn.execute(f"DROP TABLE IF EXISTS {nueva}")
+            raise
+
+        return revision
+
+    def _ajustar_columnas(self, tabla, tipos, tipos_pagina):
+        """Crea la tabla con la primera página y agrega/amplía columnas para las siguientes."""
+        if not tipos:
+            definicion = ", ".join(f"{_columna(c)} {t}" for c, t in tipos_pagina.items())
+            self.conn.execute(f"CREATE TABLE {tabla} ({definicion})")
+            tipos.update(tipos_pagina)
+            return
+        for col, tipo in tipos_pagina.items():
+            if col not in tipos:
+                self.conn.execute(f"ALTER TABLE {tabla} ADD COLUMN {_columna(col)} {tipo}")
+                tipos[col] = tipo
+            elif _tipo_comun(tipos[col], tipo) != tipos[col]:
+                tipos[col] = _tipo_comun(tipos[col], tipo)
+                self.conn.execute(
+                    f"ALTER TABLE {tabla} ALTER COLUMN {_columna(col)} SET DATA TYPE {tipos[col]}")
+
+    def obtener(self, dataset, fetcher, max_edad=300, filtros=None):
+        """
+        Devuelve el dataset priorizando el snapshot local.
+
+        - Sin snapshot (o tras invalidar): descarga en línea y guarda.
+        - Snapshot más viejo que max_edad en la primera lectura del proceso: se
+          sirve y se revalida en segundo plano (la app arranca sin esperar).
+        - Snapshot más viejo que max_edad en lecturas posteriores: descarga en
+          línea; si falla, se registra el fallo y se sirve el snapshot.
+        - Con un fallo registrado: se sirve el snapshot y se revalida en segundo
+          plano (sin reintentar en línea) hasta que un refresco funcione.
+
+        Args:
+            dataset: Nombre del dataset
+            fetcher: Función sin argumentos que descarga el dataset desde el API
+                (un DataFrame o un iterable de páginas, ej: iter_paginas)
+            max_edad: Segundos antes de considerar el snapshot obsoleto
+            filtros: Filas a leer (ver leer); None = el dataset completo
+
+        Returns:
+            pd.DataFrame: Datos con attrs 'revision' y 'guardado_en'
+
+        Raises:
+            Exception: Lo que lance fetcher si no hay snapshot al cual recurrir
+        """
+        meta = self._meta(dataset)
+        with self._lock:
+            primera_lectura = dataset not in self._servidos
+            self._servidos.add(dataset)
+
+        if meta is not None and dataset not in self._forzar:
+            edad = (datetime.now() - meta[1]).total_seconds()
+            if edad <= max_edad:
+                return self.leer(dataset, filtros)
+            if primera_lectura:
+                self.revalidar_en_segundo_plano(dataset, fetcher)
+                return self.leer(dataset, filtros)
+            with self._lock:
+                fallo = self._fallos.get(dataset)
+            if fallo is not None:
+                # Apps Script caído: no bloquear cada lectura reintentando
+                if (datetime.now() - fallo[0]).total_seconds() >= REINTENTO_FALLO:
+                    self.revalidar_en_segundo_plano(dataset, fetcher)
+                return self.leer(dataset, filtros)
+
+        try:
+            self._refrescar(dataset, fetcher, desde=meta[1] if meta else None)
+        except Exception:
+            if meta is None:
+                raise
+            # Apps Script caído: mejor datos viejos que nada
+        return self.leer(dataset, filtros)
+
+    def revalidar_en_segundo_plano(self, dataset, fetcher):
+        """Lanza un refresco del dataset si no hay otro en curso."""
+        with self._lock:
+            if dataset in self._revalidando:
+                return
+            self._revalidando.add(dataset)
+
+        def revalidar():
+            try:
+                self._refrescar(dataset, fetcher)
+            except Exception:
+                pass  # Queda en fallos(); se reintentará en un próximo acceso
+            finally:
+                with self._lock:
+                    self._revalidando.discard(dataset)
+
+        threading.Thread(target=revalidar, daemon=True).start()
+
+    def fallos(self):
+        """
+        Último refresco fallido de cada dataset que aún no se ha recuperado.
+
+        Returns:
+            dict: dataset → {'desde': datetime, 'error': str}
+        """
+        with self._lock:
+            return {ds: {'desde': cuando, 'error': error}
+                    for ds, (cuando, error) in self._fallos.items()}
+
+    def invalidar(self, dataset=None):
+        """
+        Fuerza una descarga en línea en el próximo acceso.
+
+        Args:
+            dataset: Dataset a invalidar (None = todos los guardados)
+        """
+        with self._lock:
+            if dataset is None:
+                datasets = [r[0] for r in self.conn.execute(
+                    "SELECT dataset FROM snapshots").fetchall()]
+            else:
+                datasets = [dataset]
+            self._forzar.update(datasets)
+
+    def _refrescar(self, dataset, fetcher, desde=None):
+        """
+        Descarga el dataset y lo guarda. Un solo refresco a la vez por dataset:
+        si otro terminó mientras se esperaba (snapshot posterior a 'desde'),
+        no se vuelve a descargar.
+        """
+        with self._lock:
+            refresco = self._refrescos.setdefault(dataset, threading.Lock())
+        with refresco:
+            meta = self._meta(dataset)
+            if desde is not None and meta is not None and meta[1] > desde \
+                    and dataset not in self._forzar:
+                return
+            try:
+                self.guardar(dataset, fetcher())
+            except Exception as e:
+                with self._lock:
+                    self._fallos[dataset] = (datetime.now(), str(e))
+                raise
+            with self._lock:
+                self._forzar.discard(dataset)
+                self._fallos.pop(dataset, None)
+
+
+# ==================== INTEGRACIÓN CON STREAMLIT ====================
+
+@st.cache_resource
+def get_snapshot_cache(db_path="sheets_cache.duckdb"):
+    """
+    Obtiene instancia singleton del cache de snapshots para usar en Streamlit.
+
+    Args:
+        db_path: Archivo DuckDB (uno por app: dos procesos no pueden abrir
+            el mismo archivo en modo escritura)
+
+    Returns:
+        SnapshotCache: Instancia del cache
+    """
+    return SnapshotCache(db_path=db_path)
@@ -0,0 +1,356 @@
+"""
+Validación Vectorizada de RUT, Email y Comuna
+=============================================
+
+Reglas de validación compartidas por el formulario, la hidratación del
+buffer, la importación masiva, los índices y los reportes. Cada regla
+tiene una versión por columna (pd.Series completa, sin apply por fila) y
+una versión escalar rápida para el formulario.
+
+Características:
+- Normalización de RUT a 12345678-9 (sin puntos, con guión, K mayúscula)
+  con operaciones de texto vectorizadas
+- Dígito verificador (módulo 11) calculado con aritmética NumPy sobre
+  todo el arreglo de cuerpos
+- RUT codificado como entero (cuerpo * 16 + dígito verificador) para
+  almacenar y cruzar; macros DuckDB rut_codigo / rut_texto equivalentes
+- Email con una sola expresión regular
+- Región / comuna y catálogos comparados sin tildes ni mayúsculas,
+  devolviendo el nombre oficial
+- Micro-benchmark contra rut_chile por fila: python validacion.py
+
+Uso:
+    from validacion import normalizar_ruts, ruts_validos, rut_valido, codificar_ruts
+
+    df['rut'] = normalizar_ruts(df['rut'])
+    df = df[ruts_validos(df['rut'])]
+
+    if not rut_valido(rut_formulario):
+        st.error("RUT inválido")
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+# Cuerpo de hasta 8 dígitos + dígito verificador, ya normalizado
+PATRON_RUT = r'^(\d{1,8})-([\dK])$'
+PATRON_EMAIL = r'^[^@\s]+@[^@\s]+\.[^@\s]+$'
+
+_RE_EMAIL = re.compile(PATRON_EMAIL)
+_RE_LIMPIEZA = re.compile(r'[.\s]')
+
+# Resto módulo 11 → dígito verificador ('0'..'9', 'K'); índice = 11 - suma % 11
+_DV = '0123456789K0'
+_DIGITOS = np.array(list(_DV))
+_PESOS = (2, 3, 4, 5, 6, 7, 2, 3)
+
+
+# ==================== RUT ====================
+
+def normalizar_rut(rut):
+    """
+    Normaliza un RUT a 12345678-9 (ej: ' 12.345.678-k' → '12345678-K').
+
+    Args:
+        rut: RUT en cualquier formato (None → '')
+
+    Returns:
+        str: RUT normalizado (sin validar)
+    """
+    if rut is None or rut != rut:  # None / NaN
+        return ''
+    texto = str(rut).replace('.', '').strip().upper()
+    if ' ' in texto:
+        texto = _RE_LIMPIEZA.sub('', texto)
+    if '-' not in texto and len(texto) > 1 and texto[:-1].isdigit():
+        texto = f"{texto[:-1]}-{texto[-1]}"
+    return texto
+
+
+def normalizar_ruts(serie):
+    """
+    Versión por columna de normalizar_rut.
+
+    Args:
+        serie: pd.Series con RUTs en cualquier formato
+
+    Returns:
+        pd.Series: RUTs normalizados (dtype string, vacíos como '')
+    """
+    return serie.astype('string').fillna('') \
+        .str.replace(r'[.\s]', '', regex=True).str.upper() \
+        .str.replace(r'^(\d+)([\dK])$', r'\1-\2', regex=True)
+
+
+def digito_verificador(cuerpo):
+    """
+    Dígito verificador de un cuerpo de RUT (módulo 11).
+
+    Args:
+        cuerpo: Cuerpo numérico del RUT (int o str de dígitos)
+
+    Returns:
+        str: '0'..'9' o 'K'
+    """
+    n = int(cuerpo)
+    suma = 0
+    for peso in _PESOS:
+        n, digito = divmod(n, 10)
+        suma += digito * peso
+    return _DV[11 - suma % 11]
+
+
+def digitos_verificadores(cuerpos):
+    """
+    Dígitos verificadores de un arreglo de cuerpos, sin bucle por fila.
+
+    Recorre las 8 posiciones decimales de todos los cuerpos a la vez
+    (pesos 2, 3, 4, 5, 6, 7, 2, 3 desde la derecha).
+
+    Args:
+        cuerpos: Arreglo o Series de enteros
+
+    Returns:
+        np.ndarray: Dígitos verificadores ('0'..'9', 'K')
+    """
+    n = np.asarray(cuerpos, dtype=np.int64)
+    suma = np.zeros_like(n)
+    for peso in _PESOS:
+        n, digito = np.divmod(n, 10)
+        suma += digito * peso
+    return _DIGITOS[11 - suma % 11]
+
+
+def rut_valido(rut):
+    """
+    Valida un RUT (camino rápido escalar para el formulario).
+
+    Nunca lanza excepción: entradas vacías o no numéricas son inválidas.
+
+    Args:
+        rut: RUT en cualquier formato
+
+    Returns:
+        bool: True si el dígito verificador corresponde
+    """
+    cuerpo, guion, dv = normalizar_rut(rut).rpartition('-')
+    if not (guion and cuerpo.isascii() and cuerpo.isdigit() and len(cuerpo) <= 8):
+        return False
+    return digito_verificador(cuerpo) == dv
+
+
+def ruts_validos(serie):
+    """
+    Valida una columna completa de RUTs.
+
+    Args:
+        serie: pd.Series con RUTs (normalizados o no)
+
+    Returns:
+        pd.Series: bool por fila (mismo índice)
+    """
+    ruts = normalizar_ruts(serie)
+    bien_formado = ruts.str.fullmatch(PATRON_RUT).to_numpy(dtype=bool)
+    validos = np.zeros(len(ruts), dtype=bool)
+    if bien_formado.any():
+        ruts = ruts[bien_formado]
+        cuerpos = ruts.str[:-2].astype('int64').to_numpy()
+        validos[bien_formado] = digitos_verificadores(cuerpos) == ruts.str[-1].to_numpy(dtype=str)
+    return pd.Series(validos, index=serie.index)
+
+
+# ==================== RUT CODIFICADO ====================
+#
+# Clave compacta de un RUT: cuerpo * 16 + código del dígito verificador
+# ('0'..'9' → 0..9, 'K' → 10). Cabe en un INTEGER de 32 bits (cuerpo de
+# hasta 8 dígitos) y se usa como clave de almacenamiento y de cruce; el
+# texto 12345678-9 solo se arma al mostrar o enviar a Sheets.
+
+def codificar_rut(rut):
+    """
+    Codifica un RUT como entero compacto.
+
+    Args:
+        rut: RUT en cualquier formato
+
+    Returns:
+        int | None: Código del RUT o None si no tiene forma de RUT
+    """
+    cuerpo, guion, dv = normalizar_rut(rut).rpartition('-')
+    if not (guion and cuerpo.isascii() and cuerpo.isdigit() and len(cuerpo) <= 8
+            and len(dv) == 1 and dv in _DV):
+        return None
+    return int(cuerpo) * 16 + _DV.index(dv)
+
+
+def codificar_ruts(serie):
+    """
+    Versión por columna de codificar_rut.
+
+    Args:
+        serie: pd.Series con RUTs en cualquier formato
+
+    Returns:
+        pd.Series: Códigos (dtype Int64, <NA> si no tiene forma de RUT)
+    """
+    ruts = normalizar_ruts(serie)
+    bien_formado = ruts.str.fullmatch(PATRON_RUT).fillna(False).astype(bool)
+    codigos = pd.Series(pd.NA, index=serie.index, dtype='Int64')
+    if bien_formado.any():
+        ruts = ruts[bien_formado]
+        dv = ruts.str[-1].replace('K', '10').astype('int64')
+        codigos[bien_formado] = ruts.str[:-2].astype('int64') * 16 + dv
+    return codigos
+
+
+def decodificar_rut(codigo):
+    """
+    Texto 12345678-9 de un RUT codificado.
+
+    Returns:
+        str: RUT normalizado ('' si codigo es None)
+    """
+    if codigo is None or codigo != codigo:
+        return ''
+    cuerpo, dv = divmod(int(codigo), 16)
+    return f"{cuerpo}-{_DV[dv]}"
+
+
+def decodificar_ruts(serie):
+    """
+    Versión por columna de decodificar_rut.
+
+    Returns:
+        pd.Series: RUTs normalizados (dtype string)
+    """
+    codigos = serie.astype('Int64')
+    texto = (codigos // 16).astype('string') + '-' \
+        + (codigos % 16).map(dict(enumerate(_DV))).astype('string')
+    return texto.fillna('')
+
+
+# Mismas funciones en DuckDB, para cruzar y mostrar sin salir de SQL
+_MACROS_SQL = [
+    r"""CREATE OR REPLACE MACRO rut_partes(t) AS
+        regexp_extract(regexp_replace(upper(CAST(t AS VARCHAR)), '[.\s]', '', 'g'),
+                       '^(\d{1,8})-?([0-9K])$', ['cuerpo', 'dv'])""",
+    """CREATE OR REPLACE MACRO rut_codigo(t) AS
+        CASE WHEN rut_partes(t).cuerpo <> ''
+             THEN CAST(rut_partes(t).cuerpo AS INTEGER) * 16
+                  + CASE rut_partes(t).dv WHEN 'K' THEN 10
+                         ELSE CAST(rut_partes(t).dv AS INTEGER) END
+        END""",
+    """CREATE OR REPLACE MACRO rut_texto(c) AS
+        CAST(c >> 4 AS VARCHAR) || '-'
+        || CASE c & 15 WHEN 10 THEN 'K' ELSE CAST(c & 15 AS VARCHAR) END""",
+]
+
+
+def crear_macros_sql(conn):
+    """
+    Crea las macros rut_codigo(texto) y rut_texto(codigo) en una base DuckDB.
+
+    Args:
+        conn: Conexión DuckDB (las macros quedan en el archivo y las ven sus cursores)
+    """
+    for macro in _MACROS_SQL:
+        conn.execute(macro)
+
+
+# ==================== EMAIL ====================
+
+def email_valido(email):
+    """
+    Valida un correo electrónico (camino rápido escalar).
+
+    Returns:
+        bool: True si tiene la forma usuario@dominio.tld
+    """
+    return bool(_RE_EMAIL.match(str(email or '').strip()))
+
+
+def emails_validos(serie):
+    """
+    Valida una columna completa de correos.
+
+    Returns:
+        pd.Series: bool por fila
+    """
+    return serie.astype('string').fillna('').str.strip().str.match(PATRON_EMAIL) \
+        .astype(bool)
+
+
+# ==================== REGIÓN / COMUNA / CATÁLOGOS ====================
+
+def sin_tildes(serie):
+    """Versión comparable de una columna de texto (mayúsculas y sin tildes)."""
+    return serie.astype('string').fillna('').str.normalize('NFKD') \
+        .str.encode('ascii', 'ignore').str.decode('ascii').str.upper().str.strip()
+
+
+def oficializar(serie, permitidos):
+    """
+    Lleva una columna a los valores oficiales de un catálogo.
+
+    La comparación ignora tildes, mayúsculas y espacios extremos.
+
+    Args:
+        serie: pd.Series con valores ingresados
+        permitidos: Lista de valores oficiales
+
+    Returns:
+        pd.Series: Valor oficial por fila, NaN si no corresponde a ninguno
+    """
+    oficiales = dict(zip(sin_tildes(pd.Series(list(permitidos))), permitidos))
+    return sin_tildes(serie).map(oficiales)
+
+
+def comunas_oficiales(regiones, comunas, comunas_por_region):
+    """
+    Lleva una columna de comunas a su nombre oficial dentro de su región.
+
+    Args:
+        regiones: pd.Series con regiones (nombre oficial)
+        comunas: pd.Series con comunas ingresadas
+        comunas_por_region: dict región → lista de comunas
+
+    Returns:
+        pd.Series: Comuna oficial por fila, NaN si no pertenece a la región
+    """
+    pares = pd.DataFrame([(r, c) for r, lista in comunas_por_region.items() for c in lista],
+                         columns=['region', 'comuna'])
+    claves = pares['region'] + '|' + sin_tildes(pares['comuna'])
+    oficiales = dict(zip(claves, pares['comuna']))
+    return (regiones.astype('string').fillna('') + '|' + sin_tildes(comunas)).map(oficiales)
+
+
+if __name__ == '__main__':
+    # Micro-benchmark: validación por columna vs rut_chile fila a fila
+    import timeit
+
+    from rut_chile import rut_chile
+
+    rng = np.random.default_rng(0)
+    cuerpos = rng.integers(1_000_000, 30_000_000, size=20_000)
+    dvs = digitos_verificadores(cuerpos)
+    dvs[::10] = '0'  # ~10% con dígito alterado
+    ruts = pd.Series([f"{c:,}".replace(',', '.') + f"-{d}" for c, d in zip(cuerpos, dvs)])
+
+    def por_fila():
+        return ruts.map(lambda r: rut_chile.is_valid_rut(r))
+
+    def por_columna():
+        return ruts_validos(ruts)
+
+    def escalar():
+        return [rut_valido(r) for r in ruts]
+
+    assert por_fila().tolist() == por_columna().tolist() == escalar()
+
+    for nombre, funcion in [('rut_chile por fila', por_fila),
+                            ('rut_valido escalar', escalar),
+                            ('ruts_validos columna', por_columna)]:
+        segundos = min(timeit.repeat(funcion, number=1, repeat=5))
+        print(f"{nombre:<22} {len(ruts):>6} RUTs  {segundos * 1000:8.1f} ms")